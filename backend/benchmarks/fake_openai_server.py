@@ -0,0 +1,117 @@
+"""
+Servidor local que imita la API de streaming de OpenAI para los benchmarks.
+
+Implementa ``POST /v1/chat/completions`` (solo ``stream=True``) y
+``POST /v1/embeddings``. La respuesta se emite a ``token_rate`` tokens por
+segundo tras ``first_token_delay`` segundos. ``script`` es una lista de
+respuestas que se recorre en bucle, una por petición:
+
+    [{"content": "texto de respuesta"},
+     {"tool_calls": [{"name": "add_row", "arguments": {"spreadsheet_id": "bench", "values": ["a"]}}]}]
+
+Si el último mensaje es el resultado de una tool call se responde siempre
+con texto, así que un turno con tool calls termina en dos peticiones.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+DEFAULT_ANSWER = (
+    "The integration is progressing as planned. Finance is at 80% complete, "
+    "HR systems are at 65%, and the IT infrastructure migration is at 40%. "
+    "The main risks are the vendor contract renewals and the data migration window."
+)
+
+
+def _chunk(model: str, delta: dict, finish_reason: Optional[str] = None, **extra) -> str:
+    payload = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        **extra,
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def create_app(token_rate: float = 50.0, first_token_delay: float = 0.3,
+               answer: str = DEFAULT_ANSWER, script: Optional[List[dict]] = None) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    responses = itertools.cycle(script or [{"content": answer}])
+    app.state.requests = 0
+
+    async def stream_text(model: str, text: str, include_usage: bool, prompt_tokens: int):
+        await asyncio.sleep(first_token_delay)
+        tokens = text.split(" ")
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            yield _chunk(model, {"content": token if i == 0 else " " + token})
+            if token_rate > 0:
+                await asyncio.sleep(1 / token_rate)
+        yield _chunk(model, {}, "stop")
+        if include_usage:
+            yield (
+                "data: " + json.dumps({
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                              "total_tokens": prompt_tokens + len(tokens)},
+                }) + "\n\n"
+            )
+        yield "data: [DONE]\n\n"
+
+    async def stream_tool_calls(model: str, calls: List[dict]):
+        await asyncio.sleep(first_token_delay)
+        for index, call in enumerate(calls):
+            arguments = json.dumps(call.get("arguments", {}))
+            yield _chunk(model, {"tool_calls": [{
+                "index": index, "id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                "function": {"name": call["name"], "arguments": ""},
+            }]})
+            # Los argumentos llegan troceados, como en la API real
+            for start in range(0, len(arguments), 16):
+                yield _chunk(model, {"tool_calls": [{
+                    "index": index, "function": {"arguments": arguments[start:start + 16]},
+                }]})
+                if token_rate > 0:
+                    await asyncio.sleep(1 / token_rate)
+        yield _chunk(model, {}, "tool_calls")
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        model = body.get("model", "gpt-bench")
+        messages = body.get("messages", [])
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+
+        response = {"content": answer} if messages and messages[-1]["role"] == "tool" else next(responses)
+        if response.get("tool_calls") and body.get("tools"):
+            events = stream_tool_calls(model, response["tool_calls"])
+        else:
+            events = stream_text(model, response.get("content", answer), include_usage, prompt_tokens)
+        return StreamingResponse(events, media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            data.append({"object": "embedding", "index": i,
+                         "embedding": [b / 255 for b in (digest * 48)[:1536]]})
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    return app
@@ -0,0 +1,257 @@
+"""
+Servicio de Google Sheets/Drive en memoria para los benchmarks.
+
+Imita la parte de ``googleapiclient`` que usa ``GoogleSheetsClient``
+(``spreadsheets().create/get/batchUpdate``, ``values().get/update/append/
+batchUpdate``, ``drive.permissions().create`` y ``drive.files().delete``). De ``batchUpdate`` solo
+simula ``appendDimension`` y ``updateCells``. Cada ``execute()`` espera
+``latency`` segundos en el hilo que lo llama, como una petición real;
+``create_latency`` permite simular que crear una hoja es más lento.
+"""
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+_CELL = re.compile(r"^([A-Z]*)(\d*)")
+
+TRACKER_ROWS = [
+    ["Integration Area", "Completion Status", "% Complete", "Owner"],
+    ["Finance", "In Progress", "80", "Ana"],
+    ["HR Systems", "In Progress", "65", "Luis"],
+    ["IT Infrastructure", "At Risk", "40", "Marta"],
+    ["Vendor Contracts", "Not Started", "0", "Jorge"],
+]
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for char in letters:
+        index = index * 26 + (ord(char) - 64)
+    return max(index - 1, 0)
+
+
+def _column_letters(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _cell_values(rows: List[dict]) -> List[list]:
+    """rowData de la API (``userEnteredValue``) a listas de valores"""
+    return [
+        [next(iter(cell.get("userEnteredValue", {}).values()), "") for cell in row.get("values", [])]
+        for row in rows
+    ]
+
+
+class _Request:
+    def __init__(self, service: "FakeSheetsService", fn, *args, latency: Optional[float] = None):
+        self.service = service
+        self.fn = fn
+        self.args = args
+        self.latency = service.latency if latency is None else latency
+
+    def execute(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.service.lock:
+            self.service.calls += 1
+            return self.fn(*self.args)
+
+
+class _Sheet:
+    def __init__(self, sheet_id: int, title: str, rows: Optional[List[list]] = None):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.rows: List[list] = [list(r) for r in rows or []]
+        self.row_count = max(1000, len(self.rows))
+        self.column_count = 26
+
+    def write(self, row: int, column: int, values: List[list]) -> None:
+        for offset, values_row in enumerate(values):
+            index = row + offset
+            while len(self.rows) <= index:
+                self.rows.append([])
+            target = self.rows[index]
+            while len(target) < column + len(values_row):
+                target.append("")
+            target[column:column + len(values_row)] = values_row
+        self.row_count = max(self.row_count, len(self.rows))
+
+
+class FakeSheetsService:
+    def __init__(self, latency: float = 0.0, create_latency: Optional[float] = None):
+        self.latency = latency
+        self.create_latency = create_latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.spreadsheets_by_id: Dict[str, Dict[str, _Sheet]] = {}
+
+    def add_spreadsheet(self, spreadsheet_id: str, sheets: Dict[str, List[list]]) -> None:
+        self.spreadsheets_by_id[spreadsheet_id] = {
+            title: _Sheet(i, title, rows) for i, (title, rows) in enumerate(sheets.items())
+        }
+
+    # --- API de googleapiclient -----------------------------------------
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return _Values(self)
+
+    def permissions(self):
+        return self
+
+    def files(self):
+        return self
+
+    def delete(self, fileId):
+        return _Request(self, lambda: self.spreadsheets_by_id.pop(fileId, None) and "")   # drive.files().delete
+
+    def create(self, body=None, fileId=None, fields=None, **kwargs):
+        if fileId is not None:
+            return _Request(self, lambda: {"id": "anyone"})      # drive.permissions().create
+        return _Request(self, self._create, body, latency=self.create_latency)
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        return _Request(self, self._metadata, spreadsheetId)
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _Request(self, self._batch_update, spreadsheetId, body)
+
+    # --- Implementación -------------------------------------------------
+
+    def _sheet(self, spreadsheet_id: str, a1_range: str):
+        name, _, ref = a1_range.rpartition("!")
+        sheets = self.spreadsheets_by_id.setdefault(spreadsheet_id, {})
+        if not name:
+            name = next(iter(sheets), "Sheet1")
+        if name not in sheets:
+            sheets[name] = _Sheet(len(sheets), name)
+        return sheets[name], ref
+
+    def _create(self, body):
+        spreadsheet_id = uuid.uuid4().hex
+        sheets = {}
+        for i, spec in enumerate(body.get("sheets") or [{"properties": {"title": "Sheet1"}}]):
+            sheet = _Sheet(i, spec["properties"]["title"])
+            grid = spec["properties"].get("gridProperties", {})
+            sheet.row_count = grid.get("rowCount", sheet.row_count)
+            sheet.column_count = grid.get("columnCount", sheet.column_count)
+            for block in spec.get("data", []):
+                sheet.write(block.get("startRow", 0), block.get("startColumn", 0), _cell_values(block.get("rowData", [])))
+            sheets[sheet.title] = sheet
+        self.spreadsheets_by_id[spreadsheet_id] = sheets
+        metadata = self._metadata(spreadsheet_id)
+        return {"spreadsheetId": spreadsheet_id, **metadata}
+
+    def _metadata(self, spreadsheet_id: str):
+        return {"sheets": [
+            {"properties": {"sheetId": s.sheet_id, "title": s.title,
+                            "gridProperties": {"rowCount": s.row_count, "columnCount": s.column_count}}}
+            for s in self.spreadsheets_by_id.get(spreadsheet_id, {}).values()
+        ]}
+
+    def _batch_update(self, spreadsheet_id: str, body):
+        sheets = {s.sheet_id: s for s in self.spreadsheets_by_id.get(spreadsheet_id, {}).values()}
+        for request in body.get("requests", []):
+            append = request.get("appendDimension")
+            if append and append["sheetId"] in sheets:
+                sheet = sheets[append["sheetId"]]
+                if append["dimension"] == "COLUMNS":
+                    sheet.column_count += append["length"]
+                else:
+                    sheet.row_count += append["length"]
+            cells = request.get("updateCells")
+            if cells and cells["start"]["sheetId"] in sheets:
+                start = cells["start"]
+                sheets[start["sheetId"]].write(start.get("rowIndex", 0), start.get("columnIndex", 0),
+                                               _cell_values(cells.get("rows", [])))
+            # updateSpreadsheetProperties (el título) no afecta a los datos del fake
+        return {"spreadsheetId": spreadsheet_id, "replies": [{} for _ in body.get("requests", [])]}
+
+
+class _Values:
+    def __init__(self, service: FakeSheetsService):
+        self.service = service
+
+    def get(self, spreadsheetId, range, majorDimension="ROWS", **kwargs):
+        def run():
+            sheet, ref = self.service._sheet(spreadsheetId, range)
+            if ref == "1:1":
+                values = sheet.rows[:1]
+            elif majorDimension == "COLUMNS":
+                column = _column_index(_CELL.match(ref).group(1))
+                values = [[r[column] if len(r) > column else "" for r in sheet.rows if r]]
+            else:
+                end = re.search(r":[A-Z]*(\d+)$", ref)
+                values = sheet.rows[:int(end.group(1))] if end else sheet.rows
+            return {"range": range, "values": [list(r) for r in values if r]}
+        return _Request(self.service, run)
+
+    def update(self, spreadsheetId, range, body, valueInputOption="RAW", **kwargs):
+        def run():
+            self._write(spreadsheetId, range, body["values"])
+            return {"updatedRange": range}
+        return _Request(self.service, run)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            for data in body.get("data", []):
+                self._write(spreadsheetId, data["range"], data["values"])
+            return {"spreadsheetId": spreadsheetId, "responses": []}
+        return _Request(self.service, run)
+
+    def append(self, spreadsheetId, range, body, valueInputOption="RAW", insertDataOption=None, **kwargs):
+        def run():
+            sheet, _ = self.service._sheet(spreadsheetId, range)
+            while sheet.rows and not sheet.rows[-1]:
+                sheet.rows.pop()
+            start = len(sheet.rows)
+            sheet.write(start, 0, body["values"])
+            width = max((len(r) for r in body["values"]), default=1)
+            return {"updates": {
+                "updatedRange": f"{sheet.title}!A{start + 1}:{_column_letters(width - 1)}{len(sheet.rows)}",
+                "updatedRows": len(body["values"]),
+            }}
+        return _Request(self.service, run)
+
+    def _write(self, spreadsheet_id: str, a1_range: str, values: List[list]) -> None:
+        sheet, ref = self.service._sheet(spreadsheet_id, a1_range)
+        letters, digits = _CELL.match(ref).groups()
+        sheet.write(int(digits or 1) - 1, _column_index(letters or "A"), values)
+
+
+def install_fake_sheets(latency: float = 0.0, tracker_id: Optional[str] = None,
+                        create_latency: Optional[float] = None) -> FakeSheetsService:
+    """
+    Sustituye el ``GoogleSheetsClient`` del proceso por uno respaldado por el fake.
+
+    Evita cargar credenciales: se crea la instancia sin ``__init__`` y se
+    registra como singleton y como cliente del ``AsyncGoogleSheetsClient``.
+    """
+    from src.utils.async_sheets_client import get_async_sheets_client
+    from src.utils.google_sheets_client import GoogleSheetsClient
+    from src.utils.lru_cache import LRUCache
+    from src.utils.sheet_metadata_cache import SheetMetadataCache
+
+    service = FakeSheetsService(latency, create_latency)
+    if tracker_id:
+        service.add_spreadsheet(tracker_id, {"Tracker": TRACKER_ROWS})
+    service.add_spreadsheet("bench", {"Sheet1": [["Vendor", "Service", "Status"]]})
+
+    client = object.__new__(GoogleSheetsClient)
+    client.sheets = service
+    client.drive = service
+    client._row_counts = LRUCache(maxsize=1024, ttl=600)
+    client._metadata = SheetMetadataCache(service)
+    client.initialized = True
+    GoogleSheetsClient._instance = client
+    get_async_sheets_client()._client = client
+    return service
@@ -0,0 +1,265 @@
+"""
+Benchmark offline de ``/chat/stream`` y ``/sheets/*``.
+
+Levanta en el mismo proceso el backend, un servidor OpenAI falso
+(``fake_openai_server``) y un Google Sheets en memoria (``fake_sheets``), y
+lanza N clientes concurrentes. No usa red externa ni APIs de pago.
+
+    cd backend
+    python -m benchmarks.run --scenario chat --clients 50 --turns 3
+    python -m benchmarks.run --scenario tools --clients 20 --json results.json
+    python -m benchmarks.run --scenario sheets --clients 100 --max-p95-ttft 0.5
+
+Informa p50/p95/p99 del tiempo hasta el primer frame (TTFT) y de la
+duración total, throughput y crecimiento de memoria (RSS) por
+conversación. Con ``--max-p95-ttft`` / ``--max-memory-per-conversation``
+el proceso termina con código 1 si se superan, para usarlo en CI.
+
+Requiere uvicorn y httpx. Backend, servidor falso y clientes comparten
+proceso (y GIL): los números sirven para comparar cambios entre sí, no como
+capacidad absoluta.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+SCENARIOS = ("chat", "tools", "sheets")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss es el máximo (KB en Linux, bytes en macOS), a falta de algo mejor
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+
+
+def _configure_environment(args, workdir: str, openai_port: int) -> None:
+    """Debe ejecutarse antes de importar ``src`` (los settings se leen al importar)"""
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_HTTP2": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "INTEGRATION_TRACKER_ID": "bench-tracker",
+        "LOG_LEVEL": args.log_level,
+        "LLM_FAST_ROUTES": f"openai:{args.model}",
+        "LLM_PLANNING_ROUTES": f"openai:{args.model}",
+    })
+    os.environ.pop("GEMINI_API_KEY", None)
+
+
+class ServerThread:
+    """uvicorn en un hilo con su propio event loop"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                                    log_level="warning", lifespan="on"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def _chat_client(http, base_url: str, endpoint: str, turns: int, prompt: str, results: dict) -> None:
+    conversation_id = f"bench-{uuid.uuid4().hex}"
+    for turn in range(turns):
+        started = time.perf_counter()
+        first = None
+        chars = 0
+        try:
+            async with http.stream("POST", f"{base_url}{endpoint}",
+                                   json={"conversation_id": conversation_id,
+                                         "content": f"{prompt} (turn {turn + 1})"}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    if first is None:
+                        first = time.perf_counter() - started
+                    chars += len(line) - 5
+        except Exception as e:
+            results["errors"].append(str(e))
+            continue
+        results["ttft"].append(first if first is not None else time.perf_counter() - started)
+        results["duration"].append(time.perf_counter() - started)
+        results["chars"] += chars
+    results["conversations"] += 1
+
+
+async def _sheets_client(http, base_url: str, requests: int, results: dict) -> None:
+    for i in range(requests):
+        started = time.perf_counter()
+        try:
+            response = await http.post(f"{base_url}/sheets/rows/add", json={
+                "spreadsheet_id": "bench", "sheet_name": "Sheet1",
+                "values": [f"vendor-{uuid.uuid4().hex[:8]}", "service", "active"],
+            })
+            response.raise_for_status()
+        except Exception as e:
+            results["errors"].append(str(e))
+            continue
+        elapsed = time.perf_counter() - started
+        results["ttft"].append(elapsed)
+        results["duration"].append(elapsed)
+
+
+async def _drive(args, base_url: str) -> dict:
+    import httpx
+
+    results = {"ttft": [], "duration": [], "errors": [], "chars": 0, "conversations": 0}
+    limits = httpx.Limits(max_connections=args.clients * 2, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+        # Calentamiento: imports perezosos, cachés y la primera conexión
+        if args.scenario == "sheets":
+            await _sheets_client(http, base_url, 1, {"ttft": [], "duration": [], "errors": []})
+        else:
+            await _chat_client(http, base_url, "/chat/stream", 1, args.prompt,
+                               {"ttft": [], "duration": [], "errors": [], "chars": 0, "conversations": 0})
+
+        gc.collect()
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        if args.scenario == "sheets":
+            await asyncio.gather(*[
+                _sheets_client(http, base_url, args.turns, results) for _ in range(args.clients)
+            ])
+        else:
+            await asyncio.gather(*[
+                _chat_client(http, base_url, "/chat/stream", args.turns, args.prompt, results)
+                for _ in range(args.clients)
+            ])
+        wall = time.perf_counter() - started
+        gc.collect()
+        rss_after = _rss_bytes()
+
+    completed = len(results["duration"])
+    conversations = results["conversations"] or args.clients
+    return {
+        "scenario": args.scenario,
+        "clients": args.clients,
+        "turns": args.turns,
+        "completed": completed,
+        "errors": len(results["errors"]),
+        "error_samples": results["errors"][:5],
+        "wall_seconds": wall,
+        "throughput_rps": completed / wall if wall else None,
+        "chars_per_second": results["chars"] / wall if wall and results["chars"] else None,
+        "ttft_seconds": summarize(results["ttft"]),
+        "duration_seconds": summarize(results["duration"]),
+        "rss_before_bytes": rss_before,
+        "rss_after_bytes": rss_after,
+        "memory_per_conversation_bytes": (rss_after - rss_before) / conversations,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, default="chat",
+                        help="chat: respuestas de texto; tools: cada turno hace una tool call add_row; "
+                             "sheets: POST /sheets/rows/add")
+    parser.add_argument("--clients", type=int, default=20, help="clientes concurrentes")
+    parser.add_argument("--turns", type=int, default=3, help="turnos (o peticiones) por cliente")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="tokens/s del OpenAI falso (0 = sin pausa)")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="segundos hasta el primer token")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="segundos por llamada a Sheets")
+    parser.add_argument("--model", default="gpt-bench")
+    parser.add_argument("--prompt", default="What's the % complete of the Finance integration?")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", dest="json_path", help="guarda el resultado en este fichero")
+    parser.add_argument("--max-p95-ttft", type=float, help="falla si el p95 de TTFT supera estos segundos")
+    parser.add_argument("--max-memory-per-conversation", type=float,
+                        help="falla si el RSS crece más de estos bytes por conversación")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="palladium-bench-")
+    openai_port, app_port = _free_port(), _free_port()
+    _configure_environment(args, workdir, openai_port)
+
+    from benchmarks.fake_openai_server import create_app
+    from benchmarks.fake_sheets import install_fake_sheets
+
+    script = None
+    if args.scenario == "tools":
+        script = [{"tool_calls": [{"name": "add_row", "arguments": {
+            "spreadsheet_id": "bench", "sheet_name": "Sheet1", "values": ["Acme", "Payroll", "active"],
+        }}]}]
+    fake_openai = ServerThread(create_app(args.token_rate, args.first_token_delay, script=script), openai_port)
+    fake_openai.start()
+
+    from src.main import app
+    install_fake_sheets(args.sheets_latency, tracker_id="bench-tracker")
+    backend = ServerThread(app, app_port)
+    backend.start()
+
+    try:
+        result = asyncio.run(_drive(args, f"http://127.0.0.1:{app_port}"))
+    finally:
+        backend.stop()
+        fake_openai.stop()
+
+    print(json.dumps(result, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failed = False
+    if args.max_p95_ttft is not None and (result["ttft_seconds"]["p95"] or 0) > args.max_p95_ttft:
+        print(f"FAIL: p95 TTFT {result['ttft_seconds']['p95']:.3f}s > {args.max_p95_ttft}s", file=sys.stderr)
+        failed = True
+    if (args.max_memory_per_conversation is not None
+            and result["memory_per_conversation_bytes"] > args.max_memory_per_conversation):
+        print(f"FAIL: {result['memory_per_conversation_bytes']:.0f} bytes/conversation", file=sys.stderr)
+        failed = True
+    if result["errors"]:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
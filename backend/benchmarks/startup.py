@@ -0,0 +1,166 @@
+"""
+Benchmark de arranque en frío del backend.
+
+Cada repetición usa procesos nuevos, como un worker recién escalado:
+
+- ``import_seconds``: tiempo de ``import src.main``.
+- ``ready_seconds``: desde lanzar uvicorn hasta que ``GET /`` responde
+  (incluye el lifespan: tablas y, en modo ``eager``, los clientes).
+- ``first_chat_seconds``: la primera petición a ``/chat/stream`` contra el
+  OpenAI falso, que en modo ``lazy`` paga la importación del SDK.
+
+    cd backend
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --modes lazy --max-ready 2.0
+
+Google Sheets se sustituye por ``fake_sheets`` dentro del proceso servidor,
+así que no hacen falta credenciales ni red.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.run import ServerThread, _free_port
+
+MODES = ("lazy", "eager")
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import src.main; print(time.perf_counter() - t)"
+
+
+def serve(port: int) -> None:
+    """Punto de entrada del proceso servidor (``python -m benchmarks.startup --serve PORT``)"""
+    import uvicorn
+
+    from benchmarks.fake_sheets import install_fake_sheets
+    from src.main import app
+
+    install_fake_sheets(tracker_id=os.environ["INTEGRATION_TRACKER_ID"])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _environment(mode: str, workdir: str, openai_port: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "STARTUP_MODE": mode,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_HTTP2": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, f'{mode}.db')}",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "INTEGRATION_TRACKER_ID": "bench-tracker",
+        "LOG_LEVEL": "WARNING",
+        "LLM_FAST_ROUTES": "openai:gpt-bench",
+        "LLM_PLANNING_ROUTES": "openai:gpt-bench",
+    })
+    env.pop("GEMINI_API_KEY", None)
+    return env
+
+
+def _measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _measure_server(env: Dict[str, str], timeout: float) -> Dict[str, float]:
+    import httpx
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.startup", "--serve", str(port)], env=env)
+    try:
+        with httpx.Client(timeout=timeout) as http:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"the server exited with code {process.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError("the server did not become ready")
+                try:
+                    if http.get(f"{base_url}/").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            ready = time.perf_counter() - started
+
+            request_started = time.perf_counter()
+            with http.stream("POST", f"{base_url}/chat/stream",
+                             json={"conversation_id": "startup", "content": "Hello"}) as response:
+                response.raise_for_status()
+                for _ in response.iter_lines():
+                    pass
+            first_chat = time.perf_counter() - request_started
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"ready_seconds": ready, "first_chat_seconds": first_chat}
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=3, help="procesos nuevos por modo")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", dest="json_path", help="guarda el resultado en este fichero")
+    parser.add_argument("--max-import", type=float, help="falla si la mediana de import supera estos segundos")
+    parser.add_argument("--max-ready", type=float, help="falla si la mediana hasta estar listo supera estos segundos")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    from benchmarks.fake_openai_server import create_app
+
+    workdir = tempfile.mkdtemp(prefix="palladium-startup-")
+    openai_port = _free_port()
+    fake_openai = ServerThread(create_app(token_rate=0, first_token_delay=0), openai_port)
+    fake_openai.start()
+
+    result = {}
+    try:
+        for mode in args.modes:
+            env = _environment(mode, workdir, openai_port)
+            runs = []
+            for _ in range(args.repeat):
+                run = _measure_server(env, args.timeout)
+                run["import_seconds"] = _measure_import(env)
+                runs.append(run)
+            result[mode] = {key: _summary([r[key] for r in runs]) for key in runs[0]}
+    finally:
+        fake_openai.stop()
+
+    print(json.dumps(result, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failed = False
+    for mode, stats in result.items():
+        if args.max_import is not None and stats["import_seconds"]["median"] > args.max_import:
+            print(f"FAIL: {mode} import {stats['import_seconds']['median']:.3f}s > {args.max_import}s",
+                  file=sys.stderr)
+            failed = True
+        if args.max_ready is not None and stats["ready_seconds"]["median"] > args.max_ready:
+            print(f"FAIL: {mode} ready {stats['ready_seconds']['median']:.3f}s > {args.max_ready}s",
+                  file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,107 @@
+from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Único load_dotenv del proceso: también lo leen las librerías que usan os.environ
+load_dotenv()
+
 class Settings(BaseSettings):
     openai_api_key: str | None = None      # si usas OpenAI
     allowed_origins: list[str] = ["*"]     # CORS
 
+    # Cliente OpenAI compartido
+    openai_base_url: str | None = None
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 30.0  # segundos
+    openai_http2: bool = True              # requiere el paquete h2
+    openai_timeout: float = 60.0           # segundos (lectura del stream)
+    openai_connect_timeout: float = 5.0
+    openai_max_retries: int = 3            # backoff exponencial con jitter del SDK
+
+    # Routing entre proveedores de LLM ("proveedor:modelo" separados por comas, por preferencia)
+    gemini_api_key: str | None = None
+    llm_fast_routes: str = "openai:gpt-4o-mini,gemini:gemini-2.0-flash"          # consultas cortas
+    llm_planning_routes: str = "openai:gpt-4-turbo-2024-04-09,gemini:gemini-2.0-flash"  # operaciones con hojas
+    llm_first_token_timeout: float = 20.0  # segundos hasta el primer token antes del failover
+    llm_hedge_after: float = 0.0           # segundos antes de lanzar la ruta siguiente en paralelo (0 = sin hedging)
+    llm_ttft_slo: float = 3.0              # rutas más lentas que esto pasan al final
+    llm_cooldown: float = 30.0             # segundos sin usar una ruta tras un 429/timeout
+    llm_provider_max_retries: int = 1      # reintentos del SDK por ruta (el router hace el failover)
+
+    # Conversation store
+    database_url: str = "sqlite:///chats.db"   # rutas SQLite relativas a backend/
+    database_async: bool = False           # engine asíncrono (con SQLite requiere aiosqlite)
+    db_pool_size: int = 10                 # conexiones abiertas en el pool
+    db_max_overflow: int = 20              # conexiones extra en picos
+    db_pool_timeout: float = 30.0          # segundos esperando una conexión libre
+    sqlite_busy_timeout: float = 5.0       # segundos esperando el lock de escritura
+    conversation_cache_size: int = 512     # conversaciones en memoria (hot tier)
+    conversation_cache_ttl: float = 900.0  # segundos
+    conversation_cache_validate: bool = True  # revalida contra la DB (multi-worker)
+
+    # Ventana de contexto
+    context_max_tokens: int = 6000         # presupuesto de tokens por petición
+    context_keep_turns: int = 6            # turnos recientes enviados literalmente
+    summary_model: str = "gpt-4o-mini"     # modelo para el resumen incremental
+
+    # Integration Tracker
+    integration_tracker_id: str = "1Vil2a5Z2vAjP3OawRkGfZ3O8JQA4oFsXvzdzu_B0g9U"
+    tracker_cache_ttl: float = 300.0       # segundos que el snapshot se considera fresco
+    tracker_stale_ttl: float = 3600.0      # segundos extra sirviendo el snapshot viejo
+
+    # Streaming SSE
+    sse_heartbeat_interval: float = 15.0   # segundos entre keep-alives
+    sse_flush_interval: float = 0.05       # espera máxima para agrupar tokens
+    sse_min_chunk_chars: int = 32          # caracteres que fuerzan un frame
+    sse_replay_buffer_tokens: int = 8192   # tokens por generación que se pueden reenviar
+    sse_resume_grace: float = 30.0         # segundos que sigue la generación sin clientes
+
+    # Ficheros subidos
+    upload_dir: str = "uploads"
+    extraction_workers: int = 2            # procesos para extraer texto de PDFs
+    upload_max_file_bytes: int = 50 * 1024 * 1024           # límite por fichero
+    upload_max_conversation_bytes: int = 200 * 1024 * 1024  # cuota por conversación
+    upload_chunk_bytes: int = 1024 * 1024  # tamaño de bloque al escribir en disco
+    upload_session_ttl: float = 86400.0    # segundos sin actividad antes de borrar una subida por partes
+
+    # Recuperación de pasajes de ficheros
+    retrieval_top_k: int = 8
+    retrieval_token_budget: int = 2000     # tokens de pasajes por petición
+    retrieval_chunk_tokens: int = 300
+    retrieval_chunk_overlap: int = 50
+    retrieval_use_embeddings: bool = False # requiere numpy
+    embedding_model: str = "text-embedding-3-small"
+
+    # Cache de respuestas (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 3600.0     # segundos
+    response_cache_similarity: float = 0.95          # coseno mínimo para un acierto semántico
+    response_cache_use_embeddings: bool = False      # requiere numpy
+
+    # Tools
+    tool_call_concurrency: int = 4         # tool calls ejecutadas a la vez por turno
+    tool_speculation: bool = False         # adelanta trabajo mientras llegan los argumentos (puede crear hojas)
+
+    # Google Sheets
+    google_credentials_path: str = "./src/credentials.json"  # cuenta de servicio
+    google_credentials_json: str | None = None             # alternativa: el JSON en la variable
+    google_discovery_cache_dir: str | None = None          # documentos de discovery en disco
+    sheets_max_workers: int = 8            # hilos dedicados a llamadas de Sheets
+    sheets_call_timeout: float = 30.0      # segundos por llamada
+    sheets_batch_window: float = 0.05      # segundos que se agrupan mutaciones
+    sheets_batch_max_size: int = 100       # mutaciones máximas por lote
+    sheets_pool_size: int = 0              # hojas en blanco pre-creadas y compartidas (0 = sin pool)
+    idempotency_ttl: float = 86400.0       # segundos que se recuerdan las claves de idempotencia
+
+    # Arranque
+    startup_mode: str = "lazy"             # "lazy": SDKs al primer uso; "eager": se cargan en el lifespan
+
+    # Observabilidad
+    log_level: str = "INFO"
+    log_json: bool = True                  # una línea JSON por registro
+    otel_enabled: bool = False             # spans de OpenTelemetry (requiere opentelemetry-api/sdk)
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 settings = Settings()
@@ -1,15 +1,14 @@
 from fastapi import Depends
-from google.oauth2.service_account import Credentials
-from jira import JIRA
 from .config import settings
+from src.utils.google_services import get_google_services
 
 def get_gsheets_creds():
-    creds = Credentials.from_service_account_file("credentials.json", scopes=[
-        "https://www.googleapis.com/auth/spreadsheets"
-    ])
-    return creds
+    # Cacheadas en el registro; google-auth renueva el token al caducar
+    return get_google_services().credentials()
 
 def get_jira():
+    from jira import JIRA
+
     return JIRA(
         server=settings.jira_server,
         basic_auth=(settings.jira_user, settings.jira_api_token)
@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from src.core.config import settings
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram
+except ImportError:  # prometheus_client es opcional; sin él las métricas no hacen nada
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace
+except ImportError:  # opentelemetry es opcional
+    trace = None
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+
+def _histogram(name: str, documentation: str, labels, buckets=None):
+    if prometheus_client is None:
+        return _NoopMetric()
+    kwargs = {"buckets": buckets} if buckets else {}
+    return Histogram(name, documentation, labels, **kwargs)
+
+
+def _counter(name: str, documentation: str, labels):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return Counter(name, documentation, labels)
+
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+
+# HTTP (para streams, el tiempo hasta enviar las cabeceras)
+HTTP_REQUEST_SECONDS = _histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"], _LATENCY_BUCKETS)
+
+# Streams SSE, por endpoint
+SSE_FIRST_TOKEN_SECONDS = _histogram(
+    "sse_time_to_first_token_seconds", "Request start to first SSE data frame", ["endpoint"], _LATENCY_BUCKETS)
+SSE_STREAM_SECONDS = _histogram(
+    "sse_stream_duration_seconds", "Total SSE stream duration", ["endpoint"], _LATENCY_BUCKETS)
+SSE_DISCONNECTS = _counter(
+    "sse_client_disconnects_total", "SSE streams closed by the client before finishing", ["endpoint"])
+SSE_RESUMES = _counter("sse_resumes_total", "SSE subscriptions resumed with Last-Event-ID", ["endpoint"])
+SSE_ABANDONED = _counter("sse_abandoned_generations_total", "Generations cancelled after the resume grace period", [])
+
+# Completions, por ruta proveedor:modelo
+LLM_FIRST_TOKEN_SECONDS = _histogram(
+    "llm_time_to_first_token_seconds", "Provider request to first delta", ["route"], _LATENCY_BUCKETS)
+LLM_STREAM_SECONDS = _histogram(
+    "llm_stream_duration_seconds", "Provider stream duration", ["route"], _LATENCY_BUCKETS)
+LLM_TOKENS_PER_SECOND = _histogram(
+    "llm_tokens_per_second", "Completion tokens per second after the first token", ["route"],
+    (5, 10, 20, 40, 60, 80, 100, 150, 200, 400))
+LLM_TOKENS = _counter("llm_tokens_total", "Prompt and completion tokens", ["route", "kind"])
+LLM_FAILOVERS = _counter("llm_failovers_total", "Routes abandoned before the first token", ["route", "reason"])
+
+# Google Sheets y tool calls
+SHEETS_CALL_SECONDS = _histogram(
+    "sheets_call_duration_seconds", "GoogleSheetsClient call latency", ["function"], _LATENCY_BUCKETS)
+SHEETS_CALL_ERRORS = _counter("sheets_call_errors_total", "Failed GoogleSheetsClient calls", ["function"])
+TOOL_CALL_SECONDS = _histogram(
+    "tool_call_duration_seconds", "Chat tool call latency", ["function"], _LATENCY_BUCKETS)
+TOOL_CALL_ERRORS = _counter("tool_call_errors_total", "Failed chat tool calls", ["function"])
+
+
+def metrics_payload() -> Optional[tuple]:
+    """(cuerpo, content type) en formato Prometheus, o None si no está instalado"""
+    if prometheus_client is None:
+        return None
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def _tracer():
+    if trace is None or not settings.otel_enabled:
+        return None
+    return trace.get_tracer("palladium-chat")
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Span de OpenTelemetry si está habilitado; si no, no hace nada"""
+    tracer = _tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=_clean(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, **attributes: Any):
+    """Span sin activar en el contexto, para streams que cruzan varios ``yield``"""
+    tracer = _tracer()
+    return tracer.start_span(name, attributes=_clean(attributes)) if tracer is not None else None
+
+
+def end_span(current, **attributes: Any) -> None:
+    if current is not None:
+        current.set_attributes(_clean(attributes))
+        current.end()
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in attributes.items() if v is not None}
+
+
+@contextmanager
+def timed(histogram, errors=None, **labels: str):
+    """Mide la duración del bloque; si lanza una excepción cuenta un error"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
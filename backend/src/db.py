@@ -1,9 +1,198 @@
 # db.py
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, TypeVar
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlmodel import create_engine, SQLModel, Session
+from src.core.config import settings
+
+# Importar los modelos para que queden registrados en SQLModel.metadata
+from src.models import chat, conversation, file_chunk, sheet_write, upload  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _create_message_fts(connection) -> None:
+    """Índice FTS5 de los mensajes (external content sobre conversationmessage)"""
+    try:
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5("
+            "content, content='conversationmessage', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError as e:
+        logger.warning(f"SQLite sin FTS5, la búsqueda de mensajes queda desactivada: {str(e)}")
+        return
+    # Indexa los mensajes que ya existían; los nuevos los añade append_message
+    connection.exec_driver_sql("INSERT INTO message_fts(message_fts) VALUES ('rebuild')")
+
+
+def _ensure_message_fts(connection) -> None:
+    """Crea el índice FTS si la migración 2 se aplicó en un SQLite sin FTS5"""
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'"
+    ).first()
+    if exists is None:
+        _create_message_fts(connection)
+
+
+# Migraciones del esquema: (user_version, sentencias o función que recibe la
+# conexión). create_all crea las tablas nuevas; aquí va lo que no hace (índices,
+# columnas en tablas ya existentes, tablas virtuales). Deben poder aplicarse
+# sobre una base recién creada.
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS ix_chat_spreadsheet_id ON chat (spreadsheet_id)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_created_at ON chat (created_at)",
+    ]),
+    (2, _create_message_fts),
+    (3, [
+        # Fragmentos duplicados por indexaciones concurrentes antes del índice único
+        "DELETE FROM filechunk WHERE id NOT IN "
+        "(SELECT MIN(id) FROM filechunk GROUP BY sha256, chunk_index)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_filechunk_sha256_chunk_index ON filechunk (sha256, chunk_index)",
+    ]),
+]
+
+
+def _database_url(url: str) -> str:
+    """Las rutas SQLite relativas se resuelven desde backend/, no desde el directorio actual"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or not parsed.database or parsed.database == ":memory:":
+        return url
+    path = Path(parsed.database)
+    if not path.is_absolute():
+        path = BACKEND_DIR / path
+    return parsed.set(database=str(path)).render_as_string(hide_password=False)
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _set_sqlite_pragmas(dbapi_connection, _record) -> None:
+    # WAL: los lectores no bloquean al escritor; NORMAL es seguro con WAL y evita un fsync por commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout * 1000)}")
+    cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+    if _is_sqlite(url):
+        if make_url(url).database in (None, "", ":memory:"):
+            return {"connect_args": {"check_same_thread": False}}
+        # timeout del driver en segundos (espera al lock), además del busy_timeout
+        options["connect_args"] = {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout}
+    else:
+        options["pool_pre_ping"] = True
+    return options
+
+
+DATABASE_URL = _database_url(settings.database_url)
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
+_async_engine = None
+
+
+def get_async_engine():
+    """
+    Engine asíncrono (``database_async``), creado en el primer uso.
+
+    Con SQLite usa aiosqlite, que hay que instalar aparte.
+    """
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url = make_url(DATABASE_URL)
+        if url.get_backend_name() == "sqlite":
+            try:
+                import aiosqlite  # noqa: F401
+            except ImportError:
+                raise RuntimeError("database_async requires the aiosqlite package")
+            url = url.set(drivername="sqlite+aiosqlite")
+        _async_engine = create_async_engine(url, **_engine_options(DATABASE_URL))
+        if _is_sqlite(DATABASE_URL):
+            event.listen(_async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return _async_engine
+
+
+async def run_in_session(fn: Callable[[Session], T]) -> T:
+    """
+    Ejecuta ``fn(session)`` sin bloquear el event loop.
+
+    Con ``database_async`` va por el engine asíncrono (``AsyncSession.run_sync``);
+    si no, en un hilo con una ``Session`` del engine síncrono. ``fn`` usa la
+    API síncrona en los dos casos.
+    """
+    if settings.database_async:
+        from sqlmodel.ext.asyncio.session import AsyncSession
+
+        async with AsyncSession(get_async_engine()) as session:
+            return await session.run_sync(fn)
+
+    def run() -> T:
+        with Session(engine) as session:
+            return fn(session)
+
+    return await asyncio.to_thread(run)
+
+
+def migrate(target=None) -> int:
+    """Aplica las migraciones pendientes según ``PRAGMA user_version``; devuelve la versión final"""
+    target = target or engine
+    if not _is_sqlite(str(target.url)):
+        return 0
+    with target.begin() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        for number, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info("Aplicando migración", extra={"version": number})
+            if callable(statements):
+                statements(connection)
+            else:
+                for statement in statements:
+                    connection.execute(text(statement))
+            # PRAGMA no admite parámetros; number es un entero de MIGRATIONS
+            connection.exec_driver_sql(f"PRAGMA user_version = {int(number)}")
+            version = number
+        if version >= 2:
+            # user_version no registra si FTS5 faltaba: se reintenta en cada arranque
+            _ensure_message_fts(connection)
+    return version
+
+
+def init_db():
+    """Crea las tablas que falten y migra el esquema; se llama una vez desde el lifespan de la app"""
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
 
-engine = create_engine("sqlite:///chats.db")
-SQLModel.metadata.create_all(engine)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+async def close_db() -> None:
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    engine.dispose()
@@ -1,10 +1,62 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from src.core.config import settings
+from src.core.logging_config import configure_logging
+from src.core.metrics import HTTP_REQUEST_SECONDS, metrics_payload
+from src.db import close_db, init_db
 from src.routers import chat
 from src.routers import sheets
+from src.services.file_extraction import shutdown_file_extractor
+from src.services.llm_router import get_llm_router
+from src.services.spreadsheet_pool import get_spreadsheet_pool
+from src.services.stream_broker import get_stream_broker
+from src.utils.async_sheets_client import shutdown_async_sheets_client
+from src.utils.openai_client import close_openai_client, openai_pool_stats
 
-app = FastAPI(title="Palladium Chat Backend")
+configure_logging()
+
+logger = logging.getLogger(__name__)
+
+def preload_clients():
+    """Modo "eager": importa los SDKs y crea los clientes antes de aceptar peticiones"""
+    from src.utils.openai_client import get_openai_client
+    from src.utils.google_services import get_google_services
+
+    get_openai_client()
+    try:
+        services = get_google_services()
+        services.service("sheets", "v4")
+        services.service("drive", "v3")
+    except Exception as e:
+        # Sin credenciales la app arranca igual; el error sale en el primer uso
+        logger.warning(f"No se pudieron precargar los clientes de Google: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    await asyncio.to_thread(init_db)
+    if settings.startup_mode == "eager":
+        await asyncio.to_thread(preload_clients)
+    logger.info("Arranque completado", extra={
+        "startup_mode": settings.startup_mode, "seconds": round(time.perf_counter() - started, 3)
+    })
+    pool = get_spreadsheet_pool()
+    if pool is not None:
+        pool.refill_soon()
+    yield
+    await get_stream_broker().stop()
+    if pool is not None:
+        await pool.stop()
+    shutdown_async_sheets_client()
+    await close_openai_client()
+    await close_db()
+    shutdown_file_extractor()
+
+app = FastAPI(title="Palladium Chat Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,6 +66,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    request.state.started_at = time.perf_counter()
+    response = await call_next(request)
+    # Plantilla de la ruta (no la URL) para no disparar la cardinalidad
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method, route=route, status=str(response.status_code)
+    ).observe(time.perf_counter() - request.state.started_at)
+    return response
+
 app.include_router(chat.router)
 app.include_router(sheets.router)
 # app.include_router(jira.router)
@@ -21,3 +84,19 @@ app.include_router(sheets.router)
 @app.get("/")
 def root():
     return {"status": "ok"}
+
+@app.get("/stats/openai-pool")
+def openai_pool():
+    return openai_pool_stats()
+
+@app.get("/stats/llm-routes")
+def llm_routes():
+    return get_llm_router().stats()
+
+@app.get("/metrics")
+def metrics():
+    payload = metrics_payload()
+    if payload is None:
+        return Response("prometheus_client is not installed\n", status_code=503, media_type="text/plain")
+    body, content_type = payload
+    return Response(body, media_type=content_type)
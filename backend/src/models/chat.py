@@ -5,5 +5,5 @@ from uuid import uuid4
 
 class Chat(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    spreadsheet_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    spreadsheet_id: Optional[str] = Field(default=None, index=True)
@@ -0,0 +1,19 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+class Conversation(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    model: str
+    metadata_json: str = "{}"
+    version: int = 0                       # se incrementa en cada escritura
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ConversationMessage(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str = Field(foreign_key="conversation.id", index=True)
+    role: str
+    content: Optional[str] = None
+    extra_json: Optional[str] = None       # tool_calls, tool_call_id, name...
+    created_at: datetime = Field(default_factory=datetime.utcnow)
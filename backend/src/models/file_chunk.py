@@ -0,0 +1,18 @@
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+from typing import Optional
+
+# chunk_index de la fila que marca un fichero ya indexado sin texto (no es un fragmento)
+EMPTY_MARKER_INDEX = -1
+
+class FileChunk(SQLModel, table=True):
+    # Un fragmento por posición: dos workers indexando el mismo fichero no lo duplican
+    __table_args__ = (Index("ux_filechunk_sha256_chunk_index", "sha256", "chunk_index", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sha256: str = Field(index=True)        # contenido del fichero (compartido entre conversaciones)
+    chunk_index: int
+    page: int
+    text: str
+    tokens: int
+    embedding: Optional[bytes] = None      # float32, solo si los embeddings están activos
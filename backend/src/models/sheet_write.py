@@ -0,0 +1,24 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+class IdempotencyRecord(SQLModel, table=True):
+    key: str = Field(primary_key=True)     # lo envía el cliente (cabecera Idempotency-Key)
+    spreadsheet_id: str
+    request_hash: str                      # detecta la misma clave con otra petición
+    status: str = "pending"                # pending | done
+    result_json: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class SpreadsheetLease(SQLModel, table=True):
+    spreadsheet_id: str = Field(primary_key=True)
+    owner: Optional[str] = None            # worker que tiene el lease
+    expires_at: Optional[datetime] = None
+    version: int = 0                       # se incrementa al cambiar las cabeceras
+
+class SpareSpreadsheet(SQLModel, table=True):
+    spreadsheet_id: str = Field(primary_key=True)  # hoja en blanco ya compartida (SpreadsheetPool)
+    sheet_id: int
+    row_count: int
+    column_count: int
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -0,0 +1,11 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+class UploadedFile(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str = Field(index=True)
+    filename: str                          # nombre original saneado, solo para mostrar
+    sha256: str = Field(index=True)        # blob en uploads/blobs/
+    size: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
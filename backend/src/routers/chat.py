@@ -1,22 +1,37 @@
 from __future__ import annotations
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Optional
 import os
-import shutil
 import asyncio
 import json
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
-from src.utils.openai_client import create_conversation, OpenAIConversation
-from src.schemas.chat import ChatRequest
-from dotenv import load_dotenv
-from src.utils.google_sheets_client import get_sheets_client
-import PyPDF2
-
-load_dotenv()
+import logging
+from fastapi import APIRouter, File, Header, HTTPException, UploadFile, Form, Query, Request, Response
+from src.core.config import settings
+from src.core.metrics import TOOL_CALL_ERRORS, TOOL_CALL_SECONDS, span, timed
+from src.services.conversation_store import get_conversation_store
+from src.services.context_builder import get_context_builder
+from src.services.file_index import get_file_retriever, format_passages
+from src.services.llm_router import Route, get_llm_router
+from src.services.message_search import SearchUnavailable, search_messages
+from src.services.response_cache import get_response_cache
+from src.services.sheets_batcher import get_sheets_batcher
+from src.services.spreadsheet_pool import provision_spreadsheet
+from src.services.tool_speculation import SpareReservation, ToolSpeculator
+from src.services.stream_broker import StreamGone, StreamNotHere, get_stream_broker
+from src.services.streaming import event_stream_response
+from src.services.tracker_cache import get_tracker_cache, format_tracker_context
+from src.services.upload_store import UploadError, get_upload_store
+from src.schemas.chat import ChatRequest, UploadSessionRequest
 
 router = APIRouter(prefix="/chat", tags=["OpenAI Chat"])
 
-_CONVERSATIONS: Dict[str, OpenAIConversation] = {}
+logger = logging.getLogger(__name__)
+
+SHEETS_SYSTEM_PROMPT = """
+You can create or modify Google Sheets by using the available functions.
+
+For spreadsheet operations, use the appropriate function rather than describing the action in text.
+When a user needs a spreadsheet, create one with appropriate headers based on their requirements.
+"""
 
 # Define the function specifications for OpenAI function calling
 SHEETS_FUNCTIONS = [
@@ -136,134 +151,265 @@ SHEETS_FUNCTIONS = [
     }
 ]
 
-@router.post("/stream")
-async def chat_stream(req: ChatRequest):
-    if req.conversation_id not in _CONVERSATIONS:
-        _CONVERSATIONS[req.conversation_id] = create_conversation(req.conversation_id)
+SHEETS_TOOLS = [{"type": "function", "function": spec} for spec in SHEETS_FUNCTIONS]
 
-        try:
-            client = get_sheets_client()
-            tracker_data = client.read_integration_tracker()
+# Rounds of tool calls allowed before giving up on a single user message
+MAX_TOOL_ROUNDS = 5
+
+def start_stream(request: Request, conversation_id: str, tokens):
+    """Runs the answer as a detached generation and streams it to this client"""
+    generation = get_stream_broker().start(conversation_id, tokens)
+    return event_stream_response(request, generation.subscribe())
 
-            system_message = "Información del proyecto de integración:\n\n"
+def resume_stream(request: Request, conversation_id: str, last_event_id: str):
+    """Replays what the client missed after ``last_event_id`` and keeps streaming"""
+    try:
+        generation, after = get_stream_broker().resume(conversation_id, last_event_id)
+    except StreamNotHere as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except StreamGone as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return event_stream_response(request, generation.subscribe(after), resumed=True)
 
-            for item in tracker_data:
-                if all(key in item for key in ["Integration Area", "Completion Status", "% Complete"]):
-                    system_message += f"- {item['Integration Area']}: {item['Completion Status']} ({item['% Complete']}% completado)\n"
+@router.post("/stream")
+async def chat_stream(req: ChatRequest, request: Request, last_event_id: Optional[str] = Header(None)):
+    # A retried request after a dropped connection resumes instead of generating again
+    if last_event_id:
+        return resume_stream(request, req.conversation_id, last_event_id)
 
-            _CONVERSATIONS[req.conversation_id].add_message("system", system_message)
+    conversation, created = await get_conversation_store().aget_or_create(req.conversation_id)
+
+    if created:
+        try:
+            snapshot = await get_tracker_cache().get()
+            await conversation.aadd_message("system", format_tracker_context(snapshot.data))
 
         except Exception as e:
-            print(f"Error al cargar datos iniciales: {str(e)}")
+            logger.warning(f"Error al cargar datos iniciales: {str(e)}", extra={"conversation_id": req.conversation_id})
 
-    conversation = _CONVERSATIONS[req.conversation_id]
+    await conversation.aadd_message("user", req.content)
 
     # Provide context about sheets before generating a response
-    await fetch_sheets_info(req.conversation_id)
+    sheets_info = await fetch_sheets_info(req.conversation_id)
+
+    # Short tracker lookups go to the fast tier, spreadsheet work to the planning tier
+    router = get_llm_router()
+    routes = router.routes_for(router.classify(req.content, sheets_info is not None))
+    model = routes[0].label if routes else conversation.model
+
+    probe = await lookup_cached_answer(conversation, req.content, sheets_info, model)
+    if probe is not None and probe.answer is not None:
+        return start_stream(request, req.conversation_id, replay_answer(conversation, probe.answer))
 
-    initial_system_message = """
-    You can create or modify Google Sheets by using the available functions.
+    messages = await get_context_builder().build(conversation, [SHEETS_SYSTEM_PROMPT, sheets_info])
+    on_answer = (lambda answer: get_response_cache().store(probe, answer)) if probe is not None else None
 
-    For spreadsheet operations, use the appropriate function rather than describing the action in text.
-    When a user needs a spreadsheet, create one with appropriate headers based on their requirements.
+    tokens = stream_completion(conversation, messages, on_answer, routes)
+    return start_stream(request, req.conversation_id, summarize_after(conversation, tokens))
+
+@router.get("/stream/{conversation_id}")
+async def chat_stream_reconnect(conversation_id: str, request: Request, last_event_id: Optional[str] = Header(None)):
+    """
+    Reconnects to the answer being generated for a conversation: after
+    ``Last-Event-ID`` when a connection dropped, or from the start to follow
+    it from another tab. 204 when nothing is being generated.
     """
+    if last_event_id:
+        return resume_stream(request, conversation_id, last_event_id)
+    generation = get_stream_broker().current(conversation_id)
+    if generation is None:
+        return Response(status_code=204)
+    try:
+        generation.check(0)
+    except StreamGone as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return event_stream_response(request, generation.subscribe())
 
-    conversation.add_message("system", initial_system_message)
-    conversation.add_message("user", req.content)
+async def lookup_cached_answer(conversation, content: str, sheets_info: Optional[str], model: str):
+    """
+    Looks up a cached answer when the reply depends only on the tracker snapshot.
 
+    Only the first question of a conversation without a spreadsheet is
+    cacheable: later turns depend on the history and spreadsheet answers
+    on live sheet state.
+    """
+    cache = get_response_cache()
+    if cache is None or sheets_info is not None:
+        return None
+    if sum(1 for m in conversation.message_history if m["role"] == "user") != 1:
+        return None
     try:
-        stream_coroutine = conversation.client.chat.completions.create(
-            model=conversation.model,
-            messages=[{"role": m["role"], "content": m["content"]} for m in conversation.message_history],
-            functions=SHEETS_FUNCTIONS,  # Use 'functions' not 'tools'
-            stream=True,
-        )
+        snapshot = await get_tracker_cache().get()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    async def event_generator():
-        assistant_content = ""
-        function_call_data = {}
-        current_function = None
-
-        stream = await stream_coroutine
-
-        async for chunk in stream:
-            delta = chunk.choices[0].delta
-
-            # Handle function calling chunks
-            if delta.get("function_call"):
-                fc = delta.function_call
-
-                # Start of a new function call
-                if hasattr(fc, "name") and fc.name:
-                    current_function = fc.name
-                    function_call_data = {"name": current_function, "arguments": ""}
-
-                # Accumulate function arguments
-                if hasattr(fc, "arguments") and fc.arguments:
-                    function_call_data["arguments"] += fc.arguments
-
-            # Handle normal content
-            elif delta.get("content") is not None:
-                token = delta.content
-                assistant_content += token
-                yield f"data: {token}\n\n"
-
-            # End of function call - process it
-            if chunk.choices[0].finish_reason == "function_call":
-                raw_args = function_call_data["arguments"]
-                print("RAW ARGS JSON:", raw_args)  # Debug log
-                try:
-                    # Just validate JSON but use the raw string for the function call
-                    json.loads(raw_args)
-                    result = await process_function_call(
-                        function_call_data["name"],
-                        raw_args,
-                        req.conversation_id
-                    )
-
-                    # Send function result to the user
-                    if result:
-                        yield f"data: {result}\n\n"
-                        assistant_content += result
-                except json.JSONDecodeError as e:
-                    error_msg = f"Error parsing JSON args: {str(e)} in {raw_args}"
-                    print(error_msg)  # Log the error
-                    yield f"data: {error_msg}\n\n"
-                except Exception as e:
-                    error_msg = f"Error executing function: {str(e)}"
-                    print(error_msg)  # Log the error
-                    yield f"data: {error_msg}\n\n"
-
-        conversation.add_message("assistant", assistant_content)
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
-
-async def process_function_call(function_name: str, arguments_json: str, conversation_id: str) -> str:
-    """Process function calls from OpenAI and execute the appropriate actions"""
+        logger.warning(f"Error al consultar la cache de respuestas: {str(e)}")
+        return None
+    return await cache.lookup(content, snapshot.version, model)
+
+async def summarize_after(conversation, tokens):
+    """Extends the rolling summary once the answer is complete, off the critical path"""
+    async for token in tokens:
+        yield token
+    get_context_builder().summarize_later(conversation)
+
+async def replay_answer(conversation, answer: str):
+    """Streams a cached answer through the same path as a live one"""
+    await conversation.aadd_message("assistant", answer)
+    yield answer
+
+async def stream_completion(conversation, messages: List[dict],
+                            on_answer: Optional[Callable[[str], None]] = None,
+                            routes: Optional[List[Route]] = None):
+    """
+    Streams the assistant's text for ``messages``.
+
+    When the model answers with tool calls, they are executed concurrently,
+    their results are appended to the conversation and a follow-up streamed
+    completion is requested, until the model answers with plain text. While
+    the tool call arguments stream in, ``ToolSpeculator`` starts the
+    preparatory Google calls early.
+    ``on_answer`` receives the full text of a complete answer that needed
+    no tool calls. ``routes`` are the provider/model candidates, in order;
+    they default to the planning tier.
+    """
+    router = get_llm_router()
+    if routes is None:
+        routes = router.routes_for("planning")
+
+    for round_number in range(MAX_TOOL_ROUNDS):
+        content = ""
+        tool_calls = {}
+        finish_reason = None
+        speculator = ToolSpeculator() if settings.tool_speculation else None
+
+        # However the round ends (answer, error, cancellation, the client going away
+        # at a yield), spares reserved but not handed to a tool call are released
+        try:
+            try:
+                # The router closes the provider stream if we are cancelled
+                async for delta in router.stream(routes, messages, tools=SHEETS_TOOLS):
+                    # Tool call deltas arrive by index, possibly interleaved
+                    for tc in delta.tool_calls:
+                        call = tool_calls.setdefault(tc.index, {
+                            "id": None,
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""},
+                        })
+                        if tc.id:
+                            call["id"] = tc.id
+                        if tc.name:
+                            call["function"]["name"] += tc.name
+                        if tc.arguments:
+                            call["function"]["arguments"] += tc.arguments
+                        if speculator is not None:
+                            speculator.feed(tc.index, call["function"]["name"], tc.arguments)
+
+                    if delta.content:
+                        content += delta.content
+                        yield delta.content
+
+                    if delta.finish_reason:
+                        finish_reason = delta.finish_reason
+            except asyncio.CancelledError:
+                # No client came back within the grace period: keep what was already generated
+                if content:
+                    await conversation.aadd_message("assistant", content)
+                raise
+            except Exception as e:
+                error_msg = f"Error generating response: {str(e)}"
+                logger.exception(error_msg, extra={"conversation_id": conversation.conversation_id})
+                yield error_msg
+                return
+
+            if finish_reason != "tool_calls" or not tool_calls:
+                await conversation.aadd_message("assistant", content)
+                if on_answer is not None and round_number == 0 and finish_reason == "stop":
+                    on_answer(content)
+                return
+
+            calls = [tool_calls[index] for index in sorted(tool_calls)]
+            await conversation.aadd_message("assistant", content or None, tool_calls=calls)
+            messages.append({"role": "assistant", "content": content or None, "tool_calls": calls})
+
+            spares = None
+            if speculator is not None:
+                spares = [speculator.take(index, tool_calls[index]) for index in sorted(tool_calls)]
+        finally:
+            if speculator is not None:
+                speculator.discard()
+
+        results = await run_tool_calls(calls, conversation.conversation_id, spares)
+        for call, result in zip(calls, results):
+            await conversation.aadd_message("tool", result, tool_call_id=call["id"])
+            messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+
+    yield "I couldn't finish the spreadsheet operations. Please try again."
+
+async def run_tool_calls(tool_calls: List[dict], conversation_id: str,
+                         spares: Optional[List[Optional[SpareReservation]]] = None) -> List[str]:
+    """
+    Runs the tool calls of one model turn concurrently, bounded by a semaphore
+
+    ``spares`` holds, per call, the blank spreadsheet reserved by
+    ``ToolSpeculator`` while its arguments streamed (or None). The ones no
+    call used are released when the calls end, however they end.
+    """
+    semaphore = asyncio.Semaphore(settings.tool_call_concurrency)
+    spares = spares or [None] * len(tool_calls)
+
+    async def run(call, spare):
+        raw_args = call["function"]["arguments"] or "{}"
+        try:
+            json.loads(raw_args)
+        except json.JSONDecodeError as e:
+            error_msg = f"Error parsing JSON args: {str(e)} in {raw_args}"
+            logger.warning(error_msg, extra={"function": call["function"]["name"]})
+            TOOL_CALL_ERRORS.labels(function=call["function"]["name"]).inc()
+            return error_msg
+
+        async with semaphore:
+            with span("chat.tool_call", function=call["function"]["name"]), \
+                    timed(TOOL_CALL_SECONDS, function=call["function"]["name"]):
+                return await process_function_call(call["function"]["name"], raw_args, conversation_id,
+                                                   idempotency_key=call["id"] and f"tool:{call['id']}",
+                                                   spare=spare)
+
+    try:
+        return await asyncio.gather(*[run(call, spare) for call, spare in zip(tool_calls, spares)])
+    finally:
+        # Calls that failed, were cancelled or never reached create_spreadsheet
+        for spare in spares:
+            if spare is not None:
+                spare.release()
+
+async def process_function_call(function_name: str, arguments_json: str, conversation_id: str,
+                                idempotency_key: Optional[str] = None,
+                                spare: Optional[SpareReservation] = None) -> str:
+    """
+    Process function calls from OpenAI and execute the appropriate actions
+
+    ``idempotency_key`` (derived from the tool call id) makes a re-run of the
+    same tool call return the original result instead of writing twice.
+    ``spare`` is a blank spreadsheet reserved speculatively for
+    ``create_spreadsheet``; it is only taken there, otherwise the caller
+    releases it.
+    """
     try:
-        # Print for debugging
-        print(f"Processing function: {function_name}")
-        print(f"Arguments JSON: {arguments_json}")
+        logger.info("Processing function", extra={"function": function_name, "arguments": arguments_json})
 
         # Parse JSON arguments
         args = json.loads(arguments_json)
 
-        client = get_sheets_client()
-        conversation = _CONVERSATIONS.get(conversation_id)
+        conversation = await get_conversation_store().aget(conversation_id)
 
         if function_name == "create_spreadsheet":
             title = args.get("title", "Vendor Inventory")
             headers = args.get("headers", ["Vendor Name", "Services Provided", "Contract Terms",
                                "Compliance Info", "Usage Criticality", "Status"])
 
-            result = client.create_sheet(title, headers)
+            result = await provision_spreadsheet(title, headers, spare=spare and spare.take())
 
             if conversation:
-                if not hasattr(conversation, 'metadata'):
-                    conversation.metadata = {}
-                conversation.metadata['spreadsheet_id'] = result['spreadsheet_id']
+                await conversation.aset_metadata('spreadsheet_id', result['spreadsheet_id'])
 
             return f"I've created a {title} spreadsheet with all the columns you need. You can access it here: {result['url']}"
 
@@ -272,7 +418,7 @@ async def process_function_call(function_name: str, arguments_json: str, convers
             sheet_name = args.get("sheet_name", "Sheet1")
             values = args.get("values", [])
 
-            result = client.add_row(spreadsheet_id, sheet_name, values)
+            result = await get_sheets_batcher().add_row(spreadsheet_id, sheet_name, values, idempotency_key)
 
             if result and result.get('success', False):
                 return f"I've added a new row to your spreadsheet with the values you provided."
@@ -285,7 +431,7 @@ async def process_function_call(function_name: str, arguments_json: str, convers
             row_index = args.get("row_index")
             values = args.get("values", [])
 
-            result = client.update_row(spreadsheet_id, sheet_name, row_index, values)
+            result = await get_sheets_batcher().update_row(spreadsheet_id, sheet_name, row_index, values, idempotency_key)
 
             if result and result.get('success', False):
                 return f"I've updated row {row_index} in your spreadsheet with the new values."
@@ -297,7 +443,7 @@ async def process_function_call(function_name: str, arguments_json: str, convers
             sheet_name = args.get("sheet_name", "Sheet1")
             column_name = args.get("column_name")
 
-            result = client.add_column(spreadsheet_id, sheet_name, column_name)
+            result = await get_sheets_batcher().add_column(spreadsheet_id, sheet_name, column_name, idempotency_key)
 
             if result and result.get('success', False):
                 return f"I've added a new column '{column_name}' to your spreadsheet."
@@ -312,160 +458,150 @@ async def process_function_call(function_name: str, arguments_json: str, convers
         return "The requested function is not supported."
 
     except Exception as e:
-        print(f"Function error: {str(e)}")
+        logger.exception(f"Function error: {str(e)}", extra={"function": function_name})
+        TOOL_CALL_ERRORS.labels(function=function_name).inc()
         return f"Error processing function call: {str(e)}"
 
+async def _upload_chunks(file: UploadFile):
+    while True:
+        chunk = await file.read(settings.upload_chunk_bytes)
+        if not chunk:
+            break
+        yield chunk
+
+def _upload_error(e: UploadError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.get("/search")
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    role: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+):
+    """Full-text search over past messages, ranked by BM25, with highlighted snippets"""
+    try:
+        return await search_messages(q, limit=limit, offset=offset, role=role, conversation_id=conversation_id)
+    except SearchUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def _notify_upload(conversation_id: str, file_names: List[str]):
+    conversation = await get_conversation_store().aget(conversation_id)
+    if conversation is not None:
+        await conversation.aadd_message(
+            "system",
+            f"User uploaded files: {', '.join(file_names)}"
+        )
+
 @router.post("/upload")
 async def upload_files(
     conversation_id: str = Form(...),
     files: List[UploadFile] = File(...)
 ):
-    upload_dir = os.path.join("uploads", conversation_id)
-    os.makedirs(upload_dir, exist_ok=True)
-
-    file_paths = []
-    for file in files:
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        file_paths.append(file_path)
-
-    if conversation_id in _CONVERSATIONS:
-        conversation = _CONVERSATIONS[conversation_id]
-        file_names = [file.filename for file in files]
-        conversation.add_message(
-            "system",
-            f"User uploaded files: {', '.join(file_names)}"
+    store = get_upload_store()
+    retriever = get_file_retriever()
+    uploaded = []
+
+    try:
+        for file in files:
+            try:
+                record = await store.save(conversation_id, file.filename, _upload_chunks(file))
+            finally:
+                await file.close()
+
+            # Extract and index now, in the background, so chat turns only query the index
+            retriever.prepare(str(store.blob_path(record.sha256)), record.sha256)
+            uploaded.append(record.filename)
+    except UploadError as e:
+        raise _upload_error(e)
+    finally:
+        # Files saved before a failure stay uploaded: the conversation must know about them
+        if uploaded:
+            await _notify_upload(conversation_id, uploaded)
+
+    return {"uploaded_files": uploaded}
+
+@router.post("/uploads")
+async def create_upload(req: UploadSessionRequest):
+    """Starts a resumable multi-part upload"""
+    try:
+        return await asyncio.to_thread(
+            get_upload_store().create_session, req.conversation_id, req.filename, req.size
         )
+    except UploadError as e:
+        raise _upload_error(e)
+
+@router.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    """Parts received so far, to resume an interrupted upload"""
+    try:
+        return await asyncio.to_thread(get_upload_store().status, upload_id)
+    except UploadError as e:
+        raise _upload_error(e)
 
-    return {"uploaded_files": [file.filename for file in files]}
+@router.put("/uploads/{upload_id}/parts/{part_number}")
+async def upload_part(upload_id: str, part_number: int, request: Request):
+    """Raw request body is one part; parts can be sent in any order and retried"""
+    try:
+        return await get_upload_store().write_part(upload_id, part_number, request.stream())
+    except UploadError as e:
+        raise _upload_error(e)
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    store = get_upload_store()
+    try:
+        record = await store.complete(upload_id)
+    except UploadError as e:
+        raise _upload_error(e)
+
+    get_file_retriever().prepare(str(store.blob_path(record.sha256)), record.sha256)
+    await _notify_upload(record.conversation_id, [record.filename])
+
+    return {"filename": record.filename, "sha256": record.sha256, "size": record.size}
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    try:
+        await asyncio.to_thread(get_upload_store().abort, upload_id)
+    except UploadError as e:
+        raise _upload_error(e)
+    return {"success": True}
 
 @router.post("/stream-with-files")
-async def chat_stream_with_files(req: ChatRequest):
+async def chat_stream_with_files(req: ChatRequest, request: Request, last_event_id: Optional[str] = Header(None)):
     """Chat with file context if files have been uploaded"""
-    if req.conversation_id not in _CONVERSATIONS:
-        _CONVERSATIONS[req.conversation_id] = create_conversation(req.conversation_id)
+    if last_event_id:
+        return resume_stream(request, req.conversation_id, last_event_id)
 
-    conversation = _CONVERSATIONS[req.conversation_id]
-    conversation.add_message("user", req.content)
+    conversation, _ = await get_conversation_store().aget_or_create(req.conversation_id)
+    await conversation.aadd_message("user", req.content)
 
-    upload_dir = os.path.join("uploads", req.conversation_id)
-    file_contents = []
+    context_message = None
+    files = await asyncio.to_thread(get_upload_store().files, req.conversation_id)
 
-    if os.path.exists(upload_dir):
-        files = os.listdir(upload_dir)
-        for file in files:
-            file_path = os.path.join(upload_dir, file)
-
-            if file.lower().endswith('.pdf'):
-                try:
-                    text = extract_text_from_pdf(file_path)
-                    file_contents.append(f"Content of {file}:\n{text}")
-                except Exception as e:
-                    file_contents.append(f"Error extracting text from PDF {file}: {str(e)}")
-            else:
-                try:
-                    with open(file_path, "r") as f:
-                        content = f.read()
-                        file_contents.append(f"Content of {file}:\n{content}")
-                except:
-                    file_contents.append(f"File uploaded: {file}")
-
-    if file_contents:
-        file_context = "\n\n".join(file_contents)
-        context_message = f"The user has uploaded the following files:\n{file_context}"
-        conversation.add_message("system", context_message)
+    if files:
+        try:
+            passages = await get_file_retriever().retrieve(files, req.content)
+            context_message = format_passages(passages)
+        except Exception as e:
+            context_message = f"Error reading the uploaded files: {str(e)}"
 
-    try:
-        stream_coroutine = conversation.client.chat.completions.create(
-            model=conversation.model,
-            messages=[{"role": m["role"], "content": m["content"]} for m in conversation.message_history],
-            functions=SHEETS_FUNCTIONS,  # Use 'functions' not 'tools'
-            stream=True,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    async def event_generator():
-        assistant_content = ""
-        function_call_data = {}
-        current_function = None
-
-        stream = await stream_coroutine
-
-        async for chunk in stream:
-            delta = chunk.choices[0].delta
-
-            # Handle function calling chunks
-            if delta.get("function_call"):
-                fc = delta.function_call
-
-                # Start of a new function call
-                if hasattr(fc, "name") and fc.name:
-                    current_function = fc.name
-                    function_call_data = {"name": current_function, "arguments": ""}
-
-                # Accumulate function arguments
-                if hasattr(fc, "arguments") and fc.arguments:
-                    function_call_data["arguments"] += fc.arguments
-
-            # Handle normal content
-            elif delta.get("content") is not None:
-                token = delta.content
-                assistant_content += token
-                yield f"data: {token}\n\n"
-
-            # End of function call - process it
-            if chunk.choices[0].finish_reason == "function_call":
-                raw_args = function_call_data["arguments"]
-                print("RAW ARGS JSON:", raw_args)  # Debug log
-                try:
-                    # Validate JSON but use the raw string for processing
-                    json.loads(raw_args)
-                    result = await process_function_call(
-                        function_call_data["name"],
-                        raw_args,
-                        req.conversation_id
-                    )
-
-                    # Send function result to the user
-                    if result:
-                        yield f"data: {result}\n\n"
-                        assistant_content += result
-                except json.JSONDecodeError as e:
-                    error_msg = f"Error parsing JSON args: {str(e)} in {raw_args}"
-                    print(error_msg)  # Log the error
-                    yield f"data: {error_msg}\n\n"
-                except Exception as e:
-                    error_msg = f"Error executing function: {str(e)}"
-                    print(error_msg)  # Log the error
-                    yield f"data: {error_msg}\n\n"
-
-        conversation.add_message("assistant", assistant_content)
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
-
-def extract_text_from_pdf(file_path):
-    with open(file_path, "rb") as file:
-        reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-
-async def fetch_sheets_info(conversation_id):
-    """Gets information about sheets associated with this conversation"""
-    if conversation_id in _CONVERSATIONS:
-        conversation = _CONVERSATIONS[conversation_id]
+    messages = await get_context_builder().build(conversation, [context_message])
+
+    return start_stream(request, req.conversation_id,
+                        summarize_after(conversation, stream_completion(conversation, messages)))
 
+async def fetch_sheets_info(conversation_id) -> Optional[str]:
+    """Gets context about the sheet associated with this conversation"""
+    conversation = await get_conversation_store().aget(conversation_id)
+    if conversation is not None:
         # If there's a spreadsheet_id in the metadata
-        if hasattr(conversation, 'metadata') and 'spreadsheet_id' in conversation.metadata:
+        if 'spreadsheet_id' in conversation.metadata:
             sheet_id = conversation.metadata['spreadsheet_id']
             sheet_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/edit"
 
-            # Add this information as context
-            context_message = f"Current spreadsheet: {sheet_url}"
-            conversation.add_message("system", context_message)
-            return True
+            return f"Current spreadsheet: {sheet_url}"
 
-    return False
\ No newline at end of file
+    return None
\ No newline at end of file
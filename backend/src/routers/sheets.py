@@ -1,12 +1,19 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException
+from email.utils import parsedate_to_datetime
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from sqlalchemy import update
 from sqlmodel import Session, select
 from src.models.chat import Chat
-from src.db import get_session
-from src.services.google_sheets import create_vendor_sheet
+from src.db import run_in_session
 from pydantic import BaseModel
 from typing import List, Optional, Any
-from src.utils.google_sheets_client import get_sheets_client
+from src.utils.async_sheets_client import SheetsTimeoutError
+from src.services.conversation_store import get_conversation_store
+from src.services.tracker_cache import get_tracker_cache
+from src.services.sheets_batcher import get_sheets_batcher
+from src.services.spreadsheet_pool import VENDOR_HEADERS, provision_spreadsheet
+from src.services.sheet_writes import IdempotencyConflict, IdempotencyKeyReused
 
 router = APIRouter(prefix="/sheets", tags=["Google Sheets"])
 
@@ -18,24 +25,21 @@ class SheetCreateRequest(BaseModel):
 @router.post("/create")
 async def create_sheet(request: SheetCreateRequest):
     try:
-        client = get_sheets_client()
-        result = client.create_sheet(request.title, request.headers)
+        result = await provision_spreadsheet(request.title, request.headers)
 
-        from src.routers.chat import _CONVERSATIONS
-        
-        if request.conversation_id in _CONVERSATIONS:
-            conversation = _CONVERSATIONS[request.conversation_id]
-            if not hasattr(conversation, 'metadata'):
-                conversation.metadata = {}
-            conversation.metadata['spreadsheet_id'] = result['spreadsheet_id']
-            
-            conversation.add_message(
+        conversation = await get_conversation_store().aget(request.conversation_id)
+        if conversation is not None:
+            await conversation.aset_metadata('spreadsheet_id', result['spreadsheet_id'])
+
+            await conversation.aadd_message(
                 "system", 
                 f"Created spreadsheet: {result['url']}"
             )
         
         return result
-        
+
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -44,8 +48,8 @@ class CreateSheetOut(BaseModel):
     url: str
 
 @router.post("/chats/{chat_id}/actions/create_sheet", response_model=CreateSheetOut)
-def action_create_sheet(chat_id: str, session: Session = Depends(get_session)):
-    chat = session.exec(select(Chat).where(Chat.id == chat_id)).first()
+async def action_create_sheet(chat_id: str):
+    chat = await run_in_session(lambda session: session.get(Chat, chat_id))
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
@@ -56,76 +60,166 @@ def action_create_sheet(chat_id: str, session: Session = Depends(get_session)):
             "url": f"https://docs.google.com/spreadsheets/d/{chat.spreadsheet_id}",
         }
 
-    sheet_id, url = create_vendor_sheet()
-    chat.spreadsheet_id = sheet_id
-    session.add(chat)
-    session.commit()
+    created = await provision_spreadsheet("Vendor Inventory", VENDOR_HEADERS)
+    sheet_id, url = created['spreadsheet_id'], created['url']
 
+    def save(session: Session) -> Optional[str]:
+        # Solo si nadie la guardó mientras se creaba; si no, gana la primera
+        session.exec(
+            update(Chat).where(Chat.id == chat_id, Chat.spreadsheet_id.is_(None)).values(spreadsheet_id=sheet_id)
+        )
+        session.commit()
+        return session.exec(select(Chat.spreadsheet_id).where(Chat.id == chat_id)).first()
+
+    saved_id = await run_in_session(save)
+    if saved_id != sheet_id:
+        return {"spreadsheet_id": saved_id, "url": f"https://docs.google.com/spreadsheets/d/{saved_id}"}
     return {"spreadsheet_id": sheet_id, "url": url}
 
 @router.get("/integration-tracker")
-async def get_integration_tracker():
+async def get_integration_tracker(request: Request):
     try:
-        client = get_sheets_client()
-        tracker_data = client.read_integration_tracker()
-
-        return {
-            "success": True,
-            "data": tracker_data
-        }
+        cache = get_tracker_cache()
+        snapshot = await cache.get()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    headers = {
+        "ETag": snapshot.etag,
+        "Last-Modified": snapshot.last_modified,
+        "Cache-Control": f"max-age={int(cache.ttl)}",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = snapshot.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    elif if_modified_since is not None:
+        try:
+            not_modified = parsedate_to_datetime(if_modified_since).timestamp() >= int(snapshot.modified_at)
+        except (TypeError, ValueError):
+            not_modified = False
+    else:
+        not_modified = False
+
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse({"success": True, "data": snapshot.data}, headers=headers)
+
 class RowUpdateRequest(BaseModel):
     spreadsheet_id: str
     sheet_name: str = "Sheet1"
     row_index: Optional[int] = None  # Si es None, añade una nueva fila
     values: List[Any]
 
+class BulkRowAddRequest(BaseModel):
+    spreadsheet_id: str
+    sheet_name: str = "Sheet1"
+    rows: List[List[Any]]
+
+class RowUpdate(BaseModel):
+    row_index: int
+    values: List[Any]
+
+class BulkRowUpdateRequest(BaseModel):
+    spreadsheet_id: str
+    sheet_name: str = "Sheet1"
+    updates: List[RowUpdate]
+
 class ColumnAddRequest(BaseModel):
     spreadsheet_id: str
     sheet_name: str = "Sheet1"
     column_name: str
 
+def _idempotency_error(e: Exception) -> HTTPException:
+    if isinstance(e, IdempotencyKeyReused):
+        return HTTPException(status_code=422, detail=str(e))
+    return HTTPException(status_code=409, detail=str(e))
+
+def _bulk_key(idempotency_key: Optional[str], index: int) -> Optional[str]:
+    return f"{idempotency_key}:{index}" if idempotency_key else None
+
 @router.post("/rows/add")
-async def add_row(request: RowUpdateRequest):
+async def add_row(request: RowUpdateRequest, idempotency_key: Optional[str] = Header(None)):
     try:
-        client = get_sheets_client()
-        result = client.add_row(
+        return await get_sheets_batcher().add_row(
             request.spreadsheet_id,
             request.sheet_name,
-            request.values
+            request.values,
+            idempotency_key
         )
-        return result
+    except (IdempotencyConflict, IdempotencyKeyReused) as e:
+        raise _idempotency_error(e)
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/rows/update")
-async def update_row(request: RowUpdateRequest):
+async def update_row(request: RowUpdateRequest, idempotency_key: Optional[str] = Header(None)):
     if request.row_index is None:
         raise HTTPException(status_code=400, detail="Row index is required for updates")
 
     try:
-        client = get_sheets_client()
-        result = client.update_row(
+        return await get_sheets_batcher().update_row(
             request.spreadsheet_id,
             request.sheet_name,
             request.row_index,
-            request.values
+            request.values,
+            idempotency_key
         )
-        return result
+    except (IdempotencyConflict, IdempotencyKeyReused) as e:
+        raise _idempotency_error(e)
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/columns/add")
-async def add_column(request: ColumnAddRequest):
+async def add_column(request: ColumnAddRequest, idempotency_key: Optional[str] = Header(None)):
     try:
-        client = get_sheets_client()
-        result = client.add_column(
+        return await get_sheets_batcher().add_column(
             request.spreadsheet_id,
             request.sheet_name,
-            request.column_name
+            request.column_name,
+            idempotency_key
         )
-        return result
+    except (IdempotencyConflict, IdempotencyKeyReused) as e:
+        raise _idempotency_error(e)
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/rows/bulk-add")
+async def bulk_add_rows(request: BulkRowAddRequest, idempotency_key: Optional[str] = Header(None)):
+    """With an Idempotency-Key header, row ``i`` uses the key ``<key>:<i>``"""
+    results = await get_sheets_batcher().submit_many(
+        request.spreadsheet_id,
+        [
+            {'op': 'add_row', 'sheet_name': request.sheet_name, 'values': row,
+             'idempotency_key': _bulk_key(idempotency_key, i)}
+            for i, row in enumerate(request.rows)
+        ]
+    )
+    return {
+        'success': all(r.get('success', False) for r in results),
+        'results': results
+    }
+
+@router.post("/rows/bulk-update")
+async def bulk_update_rows(request: BulkRowUpdateRequest, idempotency_key: Optional[str] = Header(None)):
+    results = await get_sheets_batcher().submit_many(
+        request.spreadsheet_id,
+        [
+            {'op': 'update_row', 'sheet_name': request.sheet_name,
+             'row_index': row_update.row_index, 'values': row_update.values,
+             'idempotency_key': _bulk_key(idempotency_key, i)}
+            for i, row_update in enumerate(request.updates)
+        ]
+    )
+    return {
+        'success': all(r.get('success', False) for r in results),
+        'results': results
+    }
@@ -1,5 +1,11 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class ChatRequest(BaseModel):
     conversation_id: str           # lo envía el FE (por ej. UUID)
-    content: str
\ No newline at end of file
+    content: str
+
+class UploadSessionRequest(BaseModel):
+    conversation_id: str
+    filename: str
+    size: Optional[int] = None     # bytes totales, si se conocen
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import weakref
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from src.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken es opcional, se estima por caracteres
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens extra que OpenAI cuenta por cada mensaje (rol, separadores)
+MESSAGE_OVERHEAD = 4
+
+# Por debajo de esto un mensaje de sistema truncado no aporta nada
+MIN_TRUNCATED_TOKENS = 32
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and an assistant that "
+    "manages Google Sheets. Keep spreadsheet IDs, URLs, titles, column names, "
+    "decisions and pending requests. Be concise."
+)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = "gpt-4-turbo-2024-04-09") -> int:
+    """Cuenta los tokens de un texto (aproximado si tiktoken no está instalado)"""
+    if not text:
+        return 0
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4-turbo-2024-04-09") -> str:
+    """Recorta ``text`` a ~``max_tokens`` tokens, marcando el corte"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    marker = "\n[truncated]"
+    limit = max(0, max_tokens - count_tokens(marker, model))
+    if tiktoken is None:
+        return text[:limit * 4] + marker
+    encoding = _encoding(model)
+    return encoding.decode(encoding.encode(text)[:limit]) + marker
+
+
+def message_tokens(message: Dict[str, Any], model: str = "gpt-4-turbo-2024-04-09") -> int:
+    tokens = MESSAGE_OVERHEAD + count_tokens(message.get("content") or "", model)
+    for call in message.get("tool_calls") or []:
+        tokens += count_tokens(call["function"]["name"], model)
+        tokens += count_tokens(call["function"]["arguments"], model)
+    return tokens
+
+
+def split_turns(messages: Sequence[Dict[str, Any]]) -> List[List[int]]:
+    """Agrupa índices de mensajes en turnos; cada turno empieza con un mensaje del usuario"""
+    turns: List[List[int]] = []
+    for index, message in enumerate(messages):
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(index)
+    return turns
+
+
+class ContextBuilder:
+    """
+    Construye la lista de mensajes que se envía al modelo con un presupuesto de tokens.
+
+    - Los mensajes de sistema se deduplican por contenido. Los del historial
+      ocupan como mucho la mitad del presupuesto que dejan los prompts: se
+      conservan los más recientes y el primero que no cabe se trunca.
+    - Los últimos ``keep_turns`` turnos se envían literalmente, siempre que
+      quepan en ``max_tokens``.
+    - Los turnos anteriores se resumen de forma incremental; el resumen se
+      guarda en ``conversation.metadata`` y solo se amplía con los turnos
+      que han salido de la ventana desde la última vez.
+
+    El resumen no se calcula mientras el usuario espera: ``build`` usa el que
+    haya y ``summarize_later`` lo amplía en segundo plano, una vez enviada la
+    respuesta. Mientras tanto los turnos recién salidos de la ventana no se
+    envían.
+    """
+
+    def __init__(self, max_tokens: int = 6000, keep_turns: int = 6,
+                 summary_model: str = "gpt-4o-mini", summary_max_tokens: int = 512):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_model = summary_model
+        self.summary_max_tokens = summary_max_tokens
+        self._cutoffs: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def build(self, conversation, system_prompts: Sequence[Optional[str]] = ()) -> List[Dict[str, Any]]:
+        history = conversation.message_history
+        model = conversation.model
+
+        system_messages = self._system_messages(system_prompts, history, model)
+        dialogue = [i for i, m in enumerate(history) if m["role"] != "system"]
+        turns = split_turns([history[i] for i in dialogue])
+
+        budget = self.max_tokens - sum(message_tokens(m, model) for m in system_messages)
+        budget -= self.summary_max_tokens
+
+        # Elegir los turnos recientes que caben en el presupuesto
+        kept: List[int] = []
+        for turn in reversed(turns[-self.keep_turns:] if self.keep_turns else []):
+            indexes = [dialogue[i] for i in turn]
+            cost = sum(message_tokens(history[i], model) for i in indexes)
+            if kept and cost > budget:
+                break
+            budget -= cost
+            kept = indexes + kept
+
+        cutoff = kept[0] if kept else len(history)
+        summary = conversation.metadata.get("summary")
+        summarized = conversation.metadata.get("summary_upto", 0)
+        if summary:
+            # Lo que ya cubre el resumen no se repite literalmente
+            kept = [i for i in kept if i >= summarized]
+        if cutoff > summarized:
+            self._cutoffs[conversation] = cutoff
+
+        messages = list(system_messages)
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        messages.extend(_api_message(history[i]) for i in kept)
+        return messages
+
+    def _system_messages(self, system_prompts, history, model: str) -> List[Dict[str, Any]]:
+        seen = set()
+        messages = []
+        for content in system_prompts:
+            if not content or content.strip() in seen:
+                continue
+            seen.add(content.strip())
+            messages.append({"role": "system", "content": content})
+
+        # Los del historial (ficheros subidos, contexto de hojas) no pueden dejar sin sitio al diálogo
+        budget = self.max_tokens - self.summary_max_tokens - sum(message_tokens(m, model) for m in messages)
+        budget //= 2
+        from_history = []
+        for message in reversed(history):
+            content = message.get("content")
+            if message["role"] != "system" or not content or content.strip() in seen:
+                continue
+            seen.add(content.strip())
+            cost = message_tokens(message, model)
+            if cost > budget:
+                if budget - MESSAGE_OVERHEAD >= MIN_TRUNCATED_TOKENS:
+                    content = truncate_tokens(content, budget - MESSAGE_OVERHEAD, model)
+                    from_history.append({"role": "system", "content": content})
+                break
+            budget -= cost
+            from_history.append({"role": "system", "content": content})
+        return messages + from_history[::-1]
+
+    def summarize_later(self, conversation) -> None:
+        """Amplía en segundo plano el resumen con los turnos que ``build`` dejó fuera"""
+        conversation_id = conversation.conversation_id
+        cutoff = self._cutoffs.pop(conversation, None)
+        if cutoff is None or conversation_id in self._running:
+            return
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._summary_until(conversation, cutoff))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._running.discard(conversation_id))
+
+    async def _summary_until(self, conversation, cutoff: int) -> Optional[str]:
+        """Devuelve el resumen de ``message_history[:cutoff]``, ampliándolo si hace falta"""
+        summary = conversation.metadata.get("summary")
+        summarized = conversation.metadata.get("summary_upto", 0)
+        if cutoff <= summarized:
+            return summary
+
+        pending = [
+            m for m in conversation.message_history[summarized:cutoff]
+            if m["role"] in ("user", "assistant") and m.get("content")
+        ]
+        if not pending:
+            return summary
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in pending)
+        if summary:
+            transcript = f"Previous summary:\n{summary}\n\nNew messages:\n{transcript}"
+
+        try:
+            response = await conversation.client.chat.completions.create(
+                model=self.summary_model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
+                max_tokens=self.summary_max_tokens,
+            )
+            summary = response.choices[0].message.content
+        except Exception as e:
+            # Sin resumen nuevo: los turnos antiguos simplemente se descartan
+            logger.warning(f"Error al resumir la conversación: {str(e)}")
+            return summary
+
+        conversation.metadata["summary"] = summary
+        await conversation.aset_metadata("summary_upto", cutoff)
+        return summary
+
+
+def _api_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in message.items() if v is not None or k == "content"}
+
+
+_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    global _builder
+    if _builder is None:
+        _builder = ContextBuilder(
+            max_tokens=settings.context_max_tokens,
+            keep_turns=settings.context_keep_turns,
+            summary_model=settings.summary_model,
+        )
+    return _builder
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from src.core.config import settings
+from src.models.conversation import Conversation, ConversationMessage
+from src.services.message_search import index_message
+from src.utils.lru_cache import LRUCache
+from src.utils.openai_client import OpenAIConversation, create_conversation
+
+DEFAULT_MODEL = "gpt-4-turbo-2024-04-09"
+
+_MESSAGE_KEYS = ("role", "content")
+
+
+class ConversationStore(ABC):
+    """
+    Interfaz para persistir conversaciones.
+
+    Las implementaciones guardan ``message_history`` y ``metadata`` por
+    ``conversation_id``. ``append_message`` y ``save_metadata`` devuelven la
+    nueva versión de la conversación, que permite detectar escrituras hechas
+    por otros workers.
+
+    Los métodos son síncronos (pueden esperar al lock de SQLite); desde el
+    event loop se usan ``aget`` / ``aget_or_create`` y los métodos ``a*`` de
+    la conversación, que los ejecutan en un hilo.
+    """
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> Optional[OpenAIConversation]:
+        ...
+
+    @abstractmethod
+    def create(self, conversation_id: str, model: str = DEFAULT_MODEL) -> OpenAIConversation:
+        ...
+
+    @abstractmethod
+    def append_message(self, conversation: OpenAIConversation, message: Dict[str, Any]) -> int:
+        ...
+
+    @abstractmethod
+    def save_metadata(self, conversation: OpenAIConversation) -> int:
+        ...
+
+    @abstractmethod
+    def get_version(self, conversation_id: str) -> Optional[int]:
+        ...
+
+    def create_or_get(self, conversation_id: str, model: str = DEFAULT_MODEL) -> Tuple[OpenAIConversation, bool]:
+        """
+        Crea la conversación o, si otra petición se adelantó, devuelve la
+        existente; ``created`` solo es True para quien la creó de verdad
+        """
+        return self.create(conversation_id, model), True
+
+    def get_or_create(self, conversation_id: str, model: str = DEFAULT_MODEL) -> Tuple[OpenAIConversation, bool]:
+        """Devuelve ``(conversation, created)``"""
+        conversation = self.get(conversation_id)
+        if conversation is not None:
+            return conversation, False
+        return self.create_or_get(conversation_id, model)
+
+    async def aget(self, conversation_id: str) -> Optional[OpenAIConversation]:
+        return await asyncio.to_thread(self.get, conversation_id)
+
+    async def aget_or_create(self, conversation_id: str,
+                             model: str = DEFAULT_MODEL) -> Tuple[OpenAIConversation, bool]:
+        return await asyncio.to_thread(self.get_or_create, conversation_id, model)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return self.get(conversation_id) is not None
+
+
+class SQLConversationStore(ConversationStore):
+    """Store persistente sobre el engine de ``src/db.py``"""
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from src.db import engine
+        self.engine = engine
+
+    def get(self, conversation_id: str) -> Optional[OpenAIConversation]:
+        with Session(self.engine) as session:
+            record = session.get(Conversation, conversation_id)
+            if record is None:
+                return None
+            messages = session.exec(
+                select(ConversationMessage)
+                .where(ConversationMessage.conversation_id == conversation_id)
+                .order_by(ConversationMessage.id)
+            ).all()
+
+        conversation = create_conversation(conversation_id, record.model, store=self)
+        conversation.metadata = json.loads(record.metadata_json or "{}")
+        conversation.message_history = [_message_to_dict(m) for m in messages]
+        conversation.version = record.version
+        return conversation
+
+    def create(self, conversation_id: str, model: str = DEFAULT_MODEL) -> OpenAIConversation:
+        return self.create_or_get(conversation_id, model)[0]
+
+    def create_or_get(self, conversation_id: str, model: str = DEFAULT_MODEL) -> Tuple[OpenAIConversation, bool]:
+        with Session(self.engine) as session:
+            if session.get(Conversation, conversation_id) is None:
+                session.add(Conversation(id=conversation_id, model=model))
+                try:
+                    session.commit()
+                    return create_conversation(conversation_id, model, store=self), True
+                except IntegrityError:
+                    session.rollback()
+
+        # Otro worker la creó mientras tanto: cargar su estado
+        return self.get(conversation_id), False
+
+    def append_message(self, conversation: OpenAIConversation, message: Dict[str, Any]) -> int:
+        extra = {k: v for k, v in message.items() if k not in _MESSAGE_KEYS}
+        with Session(self.engine) as session:
+            record = ConversationMessage(
+                conversation_id=conversation.conversation_id,
+                role=message["role"],
+                content=message.get("content"),
+                extra_json=json.dumps(extra) if extra else None,
+            )
+            session.add(record)
+            session.flush()
+            index_message(session, record.id, record.content)
+            version = self._bump_version(session, conversation.conversation_id)
+            session.commit()
+        return version
+
+    def save_metadata(self, conversation: OpenAIConversation) -> int:
+        with Session(self.engine) as session:
+            version = self._bump_version(
+                session,
+                conversation.conversation_id,
+                metadata_json=json.dumps(conversation.metadata),
+            )
+            session.commit()
+        return version
+
+    def get_version(self, conversation_id: str) -> Optional[int]:
+        with Session(self.engine) as session:
+            return session.exec(
+                select(Conversation.version).where(Conversation.id == conversation_id)
+            ).first()
+
+    def _bump_version(self, session: Session, conversation_id: str, **values) -> int:
+        session.exec(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(version=Conversation.version + 1, updated_at=datetime.utcnow(), **values)
+        )
+        return session.exec(
+            select(Conversation.version).where(Conversation.id == conversation_id)
+        ).one()
+
+
+class CachedConversationStore(ConversationStore):
+    """
+    Hot tier LRU en memoria delante de otro store.
+
+    Las conversaciones se cargan de forma perezosa en el primer acceso y se
+    expulsan por tamaño o TTL. Con ``validate=True`` cada acceso compara la
+    versión en memoria con la de la base de datos, de modo que varios workers
+    de uvicorn pueden compartir conversaciones sin sticky sessions.
+    """
+
+    def __init__(self, backend: ConversationStore, maxsize: int = 512,
+                 ttl: Optional[float] = 900.0, validate: bool = True):
+        self.backend = backend
+        self.validate = validate
+        self._cache: LRUCache[OpenAIConversation] = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._writing: Dict[str, int] = {}
+
+    def get(self, conversation_id: str) -> Optional[OpenAIConversation]:
+        conversation = self._cache.get(conversation_id)
+        if conversation is not None:
+            if not self.validate or self.backend.get_version(conversation_id) == conversation.version:
+                return conversation
+
+        conversation = self.backend.get(conversation_id)
+        if conversation is not None:
+            self._adopt(conversation)
+        return conversation
+
+    def create(self, conversation_id: str, model: str = DEFAULT_MODEL) -> OpenAIConversation:
+        return self.create_or_get(conversation_id, model)[0]
+
+    def create_or_get(self, conversation_id: str, model: str = DEFAULT_MODEL) -> Tuple[OpenAIConversation, bool]:
+        conversation, created = self.backend.create_or_get(conversation_id, model)
+        with self._lock:
+            cached = self._cache.get(conversation_id)
+            if not created and cached is not None:
+                # La petición que ganó ya la dejó en cache: compartir su objeto
+                return cached, False
+            self._adopt(conversation)
+        return conversation, created
+
+    def append_message(self, conversation: OpenAIConversation, message: Dict[str, Any]) -> int:
+        return self._write(conversation, self.backend.append_message, conversation, message)
+
+    def save_metadata(self, conversation: OpenAIConversation) -> int:
+        return self._write(conversation, self.backend.save_metadata, conversation)
+
+    def get_version(self, conversation_id: str) -> Optional[int]:
+        return self.backend.get_version(conversation_id)
+
+    def evict(self, conversation_id: str) -> None:
+        self._cache.pop(conversation_id)
+
+    def _adopt(self, conversation: OpenAIConversation) -> None:
+        conversation.store = self
+        self._cache.set(conversation.conversation_id, conversation)
+
+    def _write(self, conversation: OpenAIConversation, fn, *args) -> int:
+        conversation_id = conversation.conversation_id
+        with self._lock:
+            self._writing[conversation_id] = self._writing.get(conversation_id, 0) + 1
+        try:
+            version = fn(*args)
+        except BaseException:
+            with self._lock:
+                self._release_writer(conversation_id)
+            raise
+        with self._lock:
+            # Escrituras de este proceso aún sin registrar: pueden haber tomado
+            # las versiones intermedias y terminar en cualquier orden
+            concurrent = self._release_writer(conversation_id)
+            if version > conversation.version + concurrent:
+                # Otro worker escribió en medio: la copia en memoria está incompleta
+                self._cache.pop(conversation_id)
+            conversation.version = max(conversation.version, version)
+        return version
+
+    def _release_writer(self, conversation_id: str) -> int:
+        """Quita una escritura en curso; devuelve cuántas había contando esta"""
+        writers = self._writing.pop(conversation_id)
+        if writers > 1:
+            self._writing[conversation_id] = writers - 1
+        return writers
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Store sin persistencia, útil para desarrollo o un único worker"""
+
+    def __init__(self):
+        self._conversations: Dict[str, OpenAIConversation] = {}
+
+    def get(self, conversation_id: str) -> Optional[OpenAIConversation]:
+        return self._conversations.get(conversation_id)
+
+    def create(self, conversation_id: str, model: str = DEFAULT_MODEL) -> OpenAIConversation:
+        conversation = create_conversation(conversation_id, model, store=self)
+        self._conversations[conversation_id] = conversation
+        return conversation
+
+    def create_or_get(self, conversation_id: str, model: str = DEFAULT_MODEL) -> Tuple[OpenAIConversation, bool]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is not None:
+            return conversation, False
+        return self.create(conversation_id, model), True
+
+    def append_message(self, conversation: OpenAIConversation, message: Dict[str, Any]) -> int:
+        conversation.version += 1
+        return conversation.version
+
+    def save_metadata(self, conversation: OpenAIConversation) -> int:
+        conversation.version += 1
+        return conversation.version
+
+    def get_version(self, conversation_id: str) -> Optional[int]:
+        conversation = self._conversations.get(conversation_id)
+        return conversation.version if conversation else None
+
+
+def _message_to_dict(message: ConversationMessage) -> Dict[str, Any]:
+    data = {"role": message.role, "content": message.content}
+    if message.extra_json:
+        data.update(json.loads(message.extra_json))
+    return data
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Devuelve el store compartido (SQL + hot tier LRU)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CachedConversationStore(
+                    SQLConversationStore(),
+                    maxsize=settings.conversation_cache_size,
+                    ttl=settings.conversation_cache_ttl,
+                    validate=settings.conversation_cache_validate,
+                )
+    return _store
+
+
+def set_conversation_store(store: ConversationStore) -> None:
+    """Permite sustituir el store (por ejemplo por uno en memoria)"""
+    global _store
+    _store = store
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Separador de páginas en los ficheros de texto extraído
+PAGE_BREAK = "\f"
+
+_READ_CHUNK = 1024 * 1024
+
+# Bytes de control que no aparecen en texto (se permiten \t \n \f \r y ESC)
+_BINARY_BYTES = bytes(set(range(32)) - {8, 9, 10, 12, 13, 27})
+
+
+class UnsupportedFile(Exception):
+    """El fichero no es un PDF ni texto (imagen, zip, docx...)"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_pdf(path: str) -> bool:
+    """Por contenido: los blobs del almacén de subidas no tienen extensión"""
+    if path.lower().endswith(".pdf"):
+        return True
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def is_text(path: str, sample_size: int = 8192) -> bool:
+    """
+    Si el fichero parece texto: sin bytes nulos y UTF-8 válido o, en otra
+    codificación, con pocos caracteres de control
+    """
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if not sample:
+        return True
+    if b"\x00" in sample:
+        return False
+    try:
+        sample.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # El corte de la muestra puede partir un carácter multibyte
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return True
+    control = sum(1 for byte in sample if byte in _BINARY_BYTES)
+    return control / len(sample) < 0.05
+
+
+def _extract_to_file(source: str, destination: str) -> str:
+    """
+    Extrae el texto de ``source`` y lo escribe en ``destination`` página a página.
+
+    Se ejecuta en un proceso del pool: el parseo de PDF es CPU-bound y no
+    debe bloquear el event loop. El texto se escribe a medida que se extrae
+    (sin concatenar en memoria) y el fichero final se publica con un rename
+    atómico, así que nunca se lee una extracción a medias.
+    """
+    pdf = is_pdf(source)
+    if not pdf and not is_text(source):
+        raise UnsupportedFile("Only PDF and text files can be read")
+
+    partial = f"{destination}.{os.getpid()}.part"
+    with open(partial, "w", encoding="utf-8") as out:
+        if pdf:
+            import PyPDF2
+
+            with open(source, "rb") as f:
+                reader = PyPDF2.PdfReader(f)
+                for number, page in enumerate(reader.pages):
+                    if number:
+                        out.write(PAGE_BREAK)
+                    out.write(page.extract_text() or "")
+        else:
+            with open(source, "r", encoding="utf-8", errors="replace") as f:
+                for block in iter(lambda: f.read(_READ_CHUNK), ""):
+                    out.write(block)
+    os.replace(partial, destination)
+    return destination
+
+
+class FileExtractor:
+    """
+    Extracción de texto fuera del event loop con cache en disco.
+
+    El resultado se guarda en ``cache_dir/<sha256>.txt``, de modo que un
+    mismo fichero se extrae una sola vez aunque se suba varias veces o a
+    varias conversaciones. Las extracciones concurrentes del mismo contenido
+    comparten una única tarea.
+    """
+
+    def __init__(self, cache_dir: str, max_workers: int = 2):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def cache_path(self, sha256: str) -> Path:
+        return self.cache_dir / f"{sha256}.txt"
+
+    def start(self, path: str, sha256: Optional[str] = None) -> asyncio.Task:
+        """Lanza la extracción en segundo plano (o reutiliza la que está en curso)"""
+        key = sha256 or path
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._extract(path, sha256))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            task.add_done_callback(_log_failure)
+        return task
+
+    async def extract(self, path: str, sha256: Optional[str] = None) -> Path:
+        return await asyncio.shield(self.start(path, sha256))
+
+    async def _extract(self, path: str, sha256: Optional[str]) -> Path:
+        if sha256 is None:
+            sha256 = await asyncio.to_thread(file_sha256, path)
+
+        cached = self.cache_path(sha256)
+        if cached.exists():
+            return cached
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, _extract_to_file, path, str(cached))
+        return cached
+
+    async def read_text(self, path: str, sha256: Optional[str] = None) -> str:
+        cached = await self.extract(path, sha256)
+        text = await asyncio.to_thread(cached.read_text, encoding="utf-8")
+        return text.replace(PAGE_BREAK, "\n")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    # Marca la excepción como vista aunque nadie espere la tarea
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Error al extraer el texto de un fichero: {str(task.exception())}")
+
+
+def iter_pages(cached: Path) -> Iterator[str]:
+    """Lee un texto extraído página a página sin cargarlo entero"""
+    page = []
+    with open(cached, "r", encoding="utf-8") as f:
+        for block in iter(lambda: f.read(64 * 1024), ""):
+            parts = block.split(PAGE_BREAK)
+            for part in parts[:-1]:
+                page.append(part)
+                yield "".join(page)
+                page = []
+            page.append(parts[-1])
+    yield "".join(page)
+
+
+_extractor: Optional[FileExtractor] = None
+
+
+def get_file_extractor() -> FileExtractor:
+    global _extractor
+    if _extractor is None:
+        _extractor = FileExtractor(
+            os.path.join(settings.upload_dir, ".extracted"),
+            max_workers=settings.extraction_workers,
+        )
+    return _extractor
+
+
+def shutdown_file_extractor() -> None:
+    if _extractor is not None:
+        _extractor.shutdown()
@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from src.core.config import settings
+from src.models.file_chunk import EMPTY_MARKER_INDEX, FileChunk
+from src.services.context_builder import count_tokens
+from src.services.file_extraction import get_file_extractor, iter_pages
+from src.utils.lru_cache import LRUCache
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional, solo hace falta para los embeddings
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+
+def chunk_pages(pages, chunk_tokens: int = 300, overlap: int = 50):
+    """
+    Divide el texto en fragmentos de ~``chunk_tokens`` tokens con solapamiento.
+
+    Devuelve tuplas ``(page, text)``; los fragmentos no cruzan páginas para
+    poder citar la página de origen.
+    """
+    # Aproximación: ~0.75 palabras por token
+    size = max(1, int(chunk_tokens * 0.75))
+    step = max(1, size - int(overlap * 0.75))
+    for page_number, page in enumerate(pages, start=1):
+        words = page.split()
+        for start in range(0, len(words), step):
+            text = " ".join(words[start:start + size])
+            if text:
+                yield page_number, text
+            if start + size >= len(words):
+                break
+
+
+@dataclass
+class Passage:
+    file_name: str
+    page: int
+    chunk_index: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+class BM25Index:
+    """Índice invertido BM25 en memoria sobre los fragmentos de una conversación"""
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, text in enumerate(documents):
+            terms = Counter(tokenize(text))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, query: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        total = len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+class FileRetriever:
+    """
+    Fragmenta, indexa y recupera pasajes de los ficheros subidos.
+
+    Los fragmentos se guardan en SQLite por hash de contenido (un fichero se
+    indexa una sola vez aunque esté en varias conversaciones). Para cada
+    conversación se construye un índice BM25 en memoria, cacheado por el
+    conjunto de ficheros. Con ``use_embeddings`` (requiere numpy) los
+    fragmentos también se embeben y la búsqueda combina BM25 y similitud
+    coseno por reciprocal rank fusion.
+    """
+
+    def __init__(self, top_k: int = 8, token_budget: int = 2000, chunk_tokens: int = 300,
+                 chunk_overlap: int = 50, use_embeddings: bool = False,
+                 embedding_model: str = "text-embedding-3-small"):
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.use_embeddings = use_embeddings and np is not None
+        self.embedding_model = embedding_model
+        self._indexes: LRUCache[tuple] = LRUCache(maxsize=64, ttl=3600)
+        self._indexing: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def engine(self):
+        from src.db import engine
+        return engine
+
+    def prepare(self, path: str, sha256: Optional[str] = None) -> asyncio.Task:
+        """Extrae e indexa un fichero en segundo plano (se llama al subirlo)"""
+        task = asyncio.create_task(self._ensure_indexed(path, sha256))
+        self._background.add(task)
+        task.add_done_callback(self._prepared)
+        return task
+
+    def _prepared(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Error al indexar un fichero: {str(task.exception())}")
+
+    async def _ensure_indexed(self, path: str, sha256: Optional[str]) -> str:
+        cached = await get_file_extractor().extract(path, sha256)
+        sha256 = cached.stem
+
+        task = self._indexing.get(sha256)
+        if task is None:
+            task = asyncio.create_task(self._index(sha256, cached))
+            self._indexing[sha256] = task
+            task.add_done_callback(lambda _: self._indexing.pop(sha256, None))
+        await asyncio.shield(task)
+        return sha256
+
+    async def _index(self, sha256: str, cached: Path) -> None:
+        if await asyncio.to_thread(self._has_chunks, sha256):
+            return
+
+        chunks = await asyncio.to_thread(
+            lambda: list(chunk_pages(iter_pages(cached), self.chunk_tokens, self.chunk_overlap))
+        )
+        embeddings = [None] * len(chunks)
+        if self.use_embeddings and chunks:
+            try:
+                vectors = await self._embed([text for _, text in chunks])
+                embeddings = [v.astype(np.float32).tobytes() for v in vectors]
+            except Exception as e:
+                logger.warning(f"Error al calcular embeddings: {str(e)}")
+
+        rows = [
+            FileChunk(sha256=sha256, chunk_index=i, page=page, text=text,
+                      tokens=count_tokens(text), embedding=embeddings[i])
+            for i, (page, text) in enumerate(chunks)
+        ]
+        if not rows:
+            # Sin texto: una fila marcador para no volver a extraerlo en cada turno
+            rows = [FileChunk(sha256=sha256, chunk_index=EMPTY_MARKER_INDEX, page=0, text="", tokens=0)]
+        await asyncio.to_thread(self._save_chunks, rows)
+
+    def _has_chunks(self, sha256: str) -> bool:
+        with Session(self.engine) as session:
+            return session.exec(select(FileChunk.id).where(FileChunk.sha256 == sha256)).first() is not None
+
+    def _save_chunks(self, rows: List[FileChunk]) -> None:
+        if not rows:
+            return
+        with Session(self.engine) as session:
+            dialect = session.get_bind().dialect.name
+            if dialect in ("sqlite", "postgresql"):
+                if dialect == "sqlite":
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                # Otro worker puede estar indexando el mismo contenido a la vez
+                session.exec(insert(FileChunk).values([r.model_dump(exclude={"id"}) for r in rows])
+                             .on_conflict_do_nothing(index_elements=["sha256", "chunk_index"]))
+                session.commit()
+                return
+            session.add_all(rows)
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+
+    def _load_chunks(self, sha256s: Sequence[str]) -> List[FileChunk]:
+        with Session(self.engine) as session:
+            return list(session.exec(
+                select(FileChunk)
+                .where(FileChunk.sha256.in_(sha256s))
+                .where(FileChunk.chunk_index != EMPTY_MARKER_INDEX)
+                .order_by(FileChunk.sha256, FileChunk.chunk_index)
+            ).all())
+
+    async def _embed(self, texts: List[str]):
+        from src.utils.openai_client import get_openai_client
+
+        vectors = []
+        for start in range(0, len(texts), 100):
+            response = await get_openai_client().embeddings.create(
+                model=self.embedding_model, input=texts[start:start + 100]
+            )
+            vectors.extend(np.asarray(item.embedding, dtype=np.float32) for item in response.data)
+        return vectors
+
+    async def retrieve(self, files: Sequence[Tuple[str, str, Optional[str]]], query: str) -> List[Passage]:
+        """
+        Devuelve los pasajes más relevantes para ``query`` dentro del presupuesto de tokens.
+
+        ``files`` son tuplas ``(nombre, ruta, sha256 o None)``. Si todo el
+        contenido cabe en el presupuesto se devuelve completo y en orden.
+        """
+        names: Dict[str, str] = {}
+        for name, path, sha256 in files:
+            try:
+                names[await self._ensure_indexed(path, sha256)] = name
+            except Exception as e:
+                # Un fichero ilegible no impide usar los demás
+                logger.warning(f"Se omite un fichero al recuperar pasajes: {str(e)}", extra={"file": name})
+        if not names:
+            return []
+
+        key = tuple(sorted(names))
+        entry = self._indexes.get(key)
+        if entry is None:
+            chunks = await asyncio.to_thread(self._load_chunks, key)
+            entry = (chunks, BM25Index([c.text for c in chunks]))
+            self._indexes.set(key, entry)
+        chunks, index = entry
+
+        def passage(chunk: FileChunk, score: float = 0.0) -> Passage:
+            return Passage(names[chunk.sha256], chunk.page, chunk.chunk_index, chunk.text, chunk.tokens, score)
+
+        if sum(c.tokens for c in chunks) <= self.token_budget:
+            return [passage(c) for c in chunks]
+
+        scores = index.search(query)
+        if self.use_embeddings:
+            scores = await self._fuse_embeddings(chunks, scores, query)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            # Ninguna coincidencia: el principio de los documentos
+            ranked = [(doc_id, 0.0) for doc_id in range(len(chunks))]
+        selected: List[Passage] = []
+        budget = self.token_budget
+        for doc_id, score in ranked:
+            if len(selected) >= self.top_k:
+                break
+            if chunks[doc_id].tokens > budget:
+                continue
+            budget -= chunks[doc_id].tokens
+            selected.append(passage(chunks[doc_id], score))
+
+        # Orden de lectura: por fichero y posición
+        selected.sort(key=lambda p: (p.file_name, p.chunk_index))
+        return selected
+
+    async def _fuse_embeddings(self, chunks: List[FileChunk], bm25: Dict[int, float], query: str) -> Dict[int, float]:
+        with_vectors = [i for i, c in enumerate(chunks) if c.embedding]
+        if not with_vectors:
+            return bm25
+        try:
+            query_vector = (await self._embed([query]))[0]
+        except Exception as e:
+            logger.warning(f"Error al calcular el embedding de la consulta: {str(e)}")
+            return bm25
+
+        matrix = np.stack([np.frombuffer(chunks[i].embedding, dtype=np.float32) for i in with_vectors])
+        similarity = matrix @ query_vector / (
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector) + 1e-9
+        )
+
+        # Reciprocal rank fusion de ambos rankings
+        fused: Dict[int, float] = {}
+        for rank, (doc_id, _) in enumerate(sorted(bm25.items(), key=lambda x: x[1], reverse=True)):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (60 + rank)
+        for rank, position in enumerate(np.argsort(-similarity)):
+            doc_id = with_vectors[int(position)]
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (60 + rank)
+        return fused
+
+
+def format_passages(passages: Sequence[Passage]) -> Optional[str]:
+    if not passages:
+        return None
+    sections = [f"[{p.file_name}, page {p.page}]\n{p.text}" for p in passages]
+    return "Relevant passages from the files uploaded by the user:\n\n" + "\n\n".join(sections)
+
+
+_retriever: Optional[FileRetriever] = None
+
+
+def get_file_retriever() -> FileRetriever:
+    global _retriever
+    if _retriever is None:
+        _retriever = FileRetriever(
+            top_k=settings.retrieval_top_k,
+            token_budget=settings.retrieval_token_budget,
+            chunk_tokens=settings.retrieval_chunk_tokens,
+            chunk_overlap=settings.retrieval_chunk_overlap,
+            use_embeddings=settings.retrieval_use_embeddings,
+            embedding_model=settings.embedding_model,
+        )
+    return _retriever
@@ -1,39 +1,12 @@
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from pathlib import Path
-
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-CREDS_FILE = Path(__file__).parent.parent / "service-account.json"
+from src.services.spreadsheet_pool import VENDOR_HEADERS
+from src.utils.google_services import get_google_services
+from src.utils.google_sheets_client import get_sheets_client
 
 def get_sheets_service():
-    creds = service_account.Credentials.from_service_account_file(
-        CREDS_FILE, scopes=SCOPES
-    )
-    return build("sheets", "v4", credentials=creds, cache_discovery=False)
+    # Servicio compartido: credenciales y discovery se cargan una vez por proceso
+    return get_google_services().service("sheets", "v4")
 
 def create_vendor_sheet(title: str = "Vendor Inventory"):
-    service = get_sheets_service()
-    spreadsheet = (
-        service.spreadsheets()
-        .create(body={"properties": {"title": title}})
-        .execute()
-    )
-    sheet_id = spreadsheet["spreadsheetId"]
-    # Escribe cabeceras
-    headers = [
-        ["Vendor Name", "Services Provided", "Contract Terms",
-         "Compliance Info", "Usage Criticality"]
-    ]
-    (
-        service.spreadsheets()
-        .values()
-        .update(
-            spreadsheetId=sheet_id,
-            range="A1:E1",
-            valueInputOption="RAW",
-            body={"values": headers},
-        )
-        .execute()
-    )
-    url = f"https://docs.google.com/spreadsheets/d/{sheet_id}"
-    return sheet_id, url
\ No newline at end of file
+    # Mismo flujo que create_spreadsheet: cabeceras en la petición de creación
+    result = get_sheets_client().create_sheet(title, VENDOR_HEADERS)
+    return result["spreadsheet_id"], result["url"]
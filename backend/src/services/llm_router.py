@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+from src.core.config import settings
+from src.core.metrics import (
+    LLM_FAILOVERS, LLM_FIRST_TOKEN_SECONDS, LLM_STREAM_SECONDS, LLM_TOKENS, LLM_TOKENS_PER_SECOND,
+    end_span, start_span,
+)
+from src.utils.llm_providers import PROVIDERS, LLMDelta, LLMProvider, error_status, is_retryable
+
+# Mensajes que piden operar sobre hojas: van al modelo grande
+_PLANNING_WORDS = re.compile(
+    r"\b(sheets?|spreadsheets?|hojas?|rows?|filas?|columns?|columnas?|create|crear|crea|add|añad\w*|agreg\w*|update|actualiz\w*)\b",
+    re.IGNORECASE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Route:
+    provider: str
+    model: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_routes(spec: str) -> List[Route]:
+    """``"openai:gpt-4o-mini,gemini:gemini-2.0-flash"`` → rutas en orden de preferencia"""
+    routes = []
+    for item in spec.split(","):
+        provider, _, model = item.strip().partition(":")
+        if provider and model:
+            routes.append(Route(provider, model))
+    return routes
+
+
+class RouteHealth:
+    """Latencia al primer token (media exponencial) y enfriamiento tras 429/timeouts"""
+
+    def __init__(self):
+        self.ttft: Optional[float] = None
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def record_ttft(self, seconds: float, alpha: float = 0.2) -> None:
+        self.requests += 1
+        self.ttft = seconds if self.ttft is None else (1 - alpha) * self.ttft + alpha * seconds
+
+    def record_failure(self, cooldown: float) -> None:
+        self.failures += 1
+        self.cooldown_until = time.monotonic() + cooldown
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+async def _until_first_token(stream: AsyncIterator[LLMDelta]) -> List[LLMDelta]:
+    """Lee deltas hasta el primero con contenido o tool calls; el que solo trae el rol no cuenta"""
+    deltas = []
+    while True:
+        try:
+            delta = await stream.__anext__()
+        except StopAsyncIteration:
+            return deltas
+        deltas.append(delta)
+        if delta.content or delta.tool_calls:
+            return deltas
+
+
+class LLMRouter:
+    """
+    Enruta las completions entre proveedores (OpenAI, Gemini).
+
+    - Routing por coste/latencia: las consultas cortas sin operaciones de
+      hojas van al nivel ``fast`` (modelo barato); el resto al nivel
+      ``planning``. Dentro de un nivel se respeta el orden configurado, pero
+      las rutas en enfriamiento o por encima del SLO de primer token pasan
+      al final.
+    - Failover: un timeout, 429 o 5xx antes del primer token prueba la
+      siguiente ruta. Una vez llega el primer token la respuesta queda
+      ligada a esa ruta.
+    - Hedging: si la ruta principal no ha dado el primer token en
+      ``hedge_after`` segundos se lanza la siguiente en paralelo y se queda
+      la que responda antes; la otra se cancela.
+    """
+
+    def __init__(self, tiers: Dict[str, List[Route]], first_token_timeout: float = 20.0,
+                 hedge_after: float = 0.0, ttft_slo: float = 3.0, cooldown: float = 30.0,
+                 providers: Optional[Dict[str, LLMProvider]] = None):
+        self.tiers = tiers
+        self.first_token_timeout = first_token_timeout
+        self.hedge_after = hedge_after
+        self.ttft_slo = ttft_slo
+        self.cooldown = cooldown
+        self.providers = providers if providers is not None else PROVIDERS
+        self._health: Dict[Route, RouteHealth] = {}
+
+    def health(self, route: Route) -> RouteHealth:
+        return self._health.setdefault(route, RouteHealth())
+
+    def classify(self, content: str, has_spreadsheet: bool) -> str:
+        if has_spreadsheet or len(content) > 300 or _PLANNING_WORDS.search(content):
+            return "planning"
+        return "fast"
+
+    def routes_for(self, tier: str) -> List[Route]:
+        routes = [
+            r for r in self.tiers.get(tier) or self.tiers["planning"]
+            if r.provider in self.providers and self.providers[r.provider].available()
+        ]
+
+        def penalty(route: Route) -> int:
+            health = self.health(route)
+            if health.cooling_down:
+                return 2
+            if health.ttft is not None and health.ttft > self.ttft_slo:
+                return 1
+            return 0
+
+        return sorted(routes, key=penalty)  # sorted es estable: conserva el orden configurado
+
+    async def stream(self, routes: List[Route], messages: List[dict],
+                     tools: Optional[List[dict]] = None) -> AsyncIterator[LLMDelta]:
+        if not routes:
+            raise RuntimeError("No LLM provider is available")
+
+        started = time.perf_counter()
+        current = start_span("llm.stream", candidates=",".join(r.label for r in routes))
+        winner = None
+        usage = LLMDelta()
+        try:
+            winner, stream, first = await self._first_delta(routes, messages, tools)
+            first_token_at = time.perf_counter()
+            LLM_FIRST_TOKEN_SECONDS.labels(route=winner.label).observe(first_token_at - started)
+            try:
+                for delta in first:
+                    if delta.completion_tokens is not None:
+                        usage = delta
+                    yield delta
+                if first:
+                    async for delta in stream:
+                        if delta.completion_tokens is not None:
+                            usage = delta
+                        yield delta
+            finally:
+                await stream.aclose()
+                self._record_stream(winner, started, first_token_at, usage)
+        finally:
+            end_span(current, route=winner.label if winner else None,
+                     prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+    def _record_stream(self, route: Route, started: float, first_token_at: float, usage: LLMDelta) -> None:
+        finished = time.perf_counter()
+        LLM_STREAM_SECONDS.labels(route=route.label).observe(finished - started)
+        if usage.completion_tokens is None:
+            return
+        LLM_TOKENS.labels(route=route.label, kind="prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels(route=route.label, kind="completion").inc(usage.completion_tokens)
+        if finished > first_token_at and usage.completion_tokens:
+            LLM_TOKENS_PER_SECOND.labels(route=route.label).observe(
+                usage.completion_tokens / (finished - first_token_at))
+        logger.info("LLM stream finished", extra={
+            "route": route.label,
+            "duration": round(finished - started, 3),
+            "ttft": round(first_token_at - started, 3),
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+        })
+
+    async def _first_delta(self, routes: List[Route], messages: List[dict], tools):
+        """
+        Lanza las rutas (con failover y hedging) hasta que una da su primer token.
+
+        Devuelve la ruta, su stream y los deltas leídos hasta el primero con
+        contenido o tool calls, inclusive (vacío si el stream terminó sin nada).
+        """
+        pending = list(routes)
+        attempts: Dict[asyncio.Future, tuple] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            route = pending.pop(0)
+            stream = self.providers[route.provider].stream(route.model, messages, tools)
+            attempts[asyncio.ensure_future(_until_first_token(stream))] = (route, stream, time.monotonic())
+
+        async def discard(task, stream):
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await stream.aclose()
+
+        launch()
+        try:
+            while attempts:
+                now = time.monotonic()
+                deadlines = [started + self.first_token_timeout for _, _, started in attempts.values()]
+                if pending and self.hedge_after > 0:
+                    newest = max(started for _, _, started in attempts.values())
+                    deadlines.append(newest + self.hedge_after)
+                done, _ = await asyncio.wait(
+                    list(attempts), timeout=max(0.0, min(deadlines) - now),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                for task in done:
+                    route, stream, started = attempts.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        last_error = e
+                        if not is_retryable(e):
+                            raise
+                        reason = str(error_status(e) or type(e).__name__)
+                        logger.warning("Fallo en la ruta, probando otra", extra={"route": route.label, "reason": reason})
+                        LLM_FAILOVERS.labels(route=route.label, reason=reason).inc()
+                        self.health(route).record_failure(self.cooldown)
+                        await stream.aclose()
+                        continue
+
+                    self.health(route).record_ttft(time.monotonic() - started)
+                    return route, stream, first
+
+                now = time.monotonic()
+                for task, (route, stream, started) in list(attempts.items()):
+                    if now - started >= self.first_token_timeout:
+                        logger.warning("Sin primer token a tiempo", extra={
+                            "route": route.label, "timeout": self.first_token_timeout})
+                        LLM_FAILOVERS.labels(route=route.label, reason="first_token_timeout").inc()
+                        last_error = asyncio.TimeoutError(f"{route.label} first token timeout")
+                        self.health(route).record_failure(self.cooldown)
+                        del attempts[task]
+                        await discard(task, stream)
+
+                if pending and (not attempts or (
+                        self.hedge_after > 0 and
+                        now - max(s for _, _, s in attempts.values()) >= self.hedge_after)):
+                    launch()
+
+            raise last_error or RuntimeError("No LLM route answered")
+        finally:
+            for task, (_, stream, _) in attempts.items():
+                await discard(task, stream)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            route.label: {
+                "ttft": health.ttft,
+                "requests": health.requests,
+                "failures": health.failures,
+                "cooling_down": health.cooling_down,
+            }
+            for route, health in self._health.items()
+        }
+
+
+_router: Optional[LLMRouter] = None
+
+
+def get_llm_router() -> LLMRouter:
+    global _router
+    if _router is None:
+        _router = LLMRouter(
+            {
+                "fast": parse_routes(settings.llm_fast_routes),
+                "planning": parse_routes(settings.llm_planning_routes),
+            },
+            first_token_timeout=settings.llm_first_token_timeout,
+            hedge_after=settings.llm_hedge_after,
+            ttft_slo=settings.llm_ttft_slo,
+            cooldown=settings.llm_cooldown,
+        )
+    return _router
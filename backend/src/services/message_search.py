@@ -0,0 +1,128 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from src.db import run_in_session
+
+FTS_TABLE = "message_fts"
+
+_TOKEN = re.compile(r"\w+\*?", re.UNICODE)
+
+_SEARCH_SQL = """
+SELECT m.id, m.conversation_id, m.role, m.created_at,
+       snippet(message_fts, 0, :mark_start, :mark_end, '…', :snippet_tokens) AS snippet,
+       bm25(message_fts) AS score,
+       json_extract(c.metadata_json, '$.spreadsheet_id') AS spreadsheet_id
+FROM message_fts
+JOIN conversationmessage m ON m.id = message_fts.rowid
+JOIN conversation c ON c.id = m.conversation_id
+WHERE message_fts MATCH :query {filters}
+ORDER BY score
+LIMIT :limit OFFSET :offset
+"""
+
+_COUNT_SQL = """
+SELECT count(*)
+FROM message_fts
+JOIN conversationmessage m ON m.id = message_fts.rowid
+WHERE message_fts MATCH :query {filters}
+"""
+
+
+class SearchUnavailable(Exception):
+    """SQLite se compiló sin FTS5 o la base no tiene el índice"""
+
+
+def fts_query(query: str) -> Optional[str]:
+    """
+    Convierte el texto del usuario en una consulta FTS5 segura.
+
+    Cada palabra va entre comillas (se buscan todas); un ``*`` final se
+    mantiene como búsqueda por prefijo. Así la sintaxis de FTS5 (``OR``,
+    ``NEAR``, ``:``...) que escriba el usuario no rompe la consulta.
+    """
+    terms = []
+    for token in _TOKEN.findall(query):
+        prefix = token.endswith("*")
+        word = token.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+_available: Dict[int, bool] = {}
+_available_lock = threading.Lock()
+
+
+def fts_available(session: Session) -> bool:
+    """Si existe la tabla FTS (se comprueba una vez por engine)"""
+    key = id(session.get_bind())
+    with _available_lock:
+        if key not in _available:
+            _available[key] = session.exec(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                params={"name": FTS_TABLE},
+            ).first() is not None
+        return _available[key]
+
+
+def index_message(session: Session, message_id: int, content: Optional[str]) -> None:
+    """Añade un mensaje al índice en la misma transacción que lo guarda"""
+    if not content or not fts_available(session):
+        return
+    session.exec(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (:id, :content)"),
+        params={"id": message_id, "content": content},
+    )
+
+
+def _search(session: Session, query: str, limit: int, offset: int,
+            role: Optional[str], conversation_id: Optional[str]) -> Dict[str, Any]:
+    if not fts_available(session):
+        raise SearchUnavailable("Full-text search is not available (SQLite without FTS5)")
+
+    filters = ""
+    params: Dict[str, Any] = {"query": query, "limit": limit, "offset": offset}
+    if role:
+        filters += " AND m.role = :role"
+        params["role"] = role
+    if conversation_id:
+        filters += " AND m.conversation_id = :conversation_id"
+        params["conversation_id"] = conversation_id
+
+    total = session.exec(text(_COUNT_SQL.format(filters=filters)), params=params).one()[0]
+    rows = session.exec(
+        text(_SEARCH_SQL.format(filters=filters)),
+        params={**params, "mark_start": "<mark>", "mark_end": "</mark>", "snippet_tokens": 16},
+    ).all()
+
+    results: List[Dict[str, Any]] = [
+        {
+            "message_id": row.id,
+            "conversation_id": row.conversation_id,
+            "role": row.role,
+            "created_at": row.created_at,
+            "snippet": row.snippet,
+            "score": -row.score,          # bm25 es menor cuanto más relevante
+            "spreadsheet_id": row.spreadsheet_id,
+        }
+        for row in rows
+    ]
+    return {"total": total, "limit": limit, "offset": offset, "results": results}
+
+
+async def search_messages(query: str, limit: int = 20, offset: int = 0, role: Optional[str] = None,
+                          conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Búsqueda en el historial de conversaciones, ordenada por BM25.
+
+    Devuelve una página de mensajes con un fragmento resaltado (``<mark>``)
+    y la hoja de cálculo de su conversación, si la tiene.
+    """
+    match = fts_query(query)
+    if match is None:
+        return {"total": 0, "limit": limit, "offset": offset, "results": []}
+    return await run_in_session(lambda session: _search(session, match, limit, offset, role, conversation_id))
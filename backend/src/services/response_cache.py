@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from src.core.config import settings
+from src.utils.lru_cache import LRUCache
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional, solo hace falta para la búsqueda semántica
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Minúsculas, espacios colapsados y sin puntuación final"""
+    return _WHITESPACE.sub(" ", prompt.lower()).strip().rstrip("?!.¿¡ ").strip()
+
+
+@dataclass
+class CacheProbe:
+    """Resultado de una búsqueda; se reutiliza para guardar la respuesta si no hubo acierto"""
+    key: str
+    scope: Tuple[str, str]                 # (modelo, versión del tracker)
+    answer: Optional[str] = None
+    vector: Optional[object] = None        # embedding del prompt, si se calculó
+
+
+class ResponseCache:
+    """
+    Cache de respuestas para preguntas repetidas sobre el Integration Tracker.
+
+    La clave es (prompt normalizado, versión del snapshot del tracker,
+    modelo), así que al cambiar el tracker las respuestas viejas dejan de
+    usarse sin invalidarlas a mano. Primero se busca la coincidencia exacta;
+    con ``use_embeddings`` (requiere numpy) también se acepta la respuesta a
+    una pregunta cuyo embedding tenga similitud coseno ≥ ``similarity``
+    dentro del mismo (modelo, versión). Las entradas caducan por TTL y LRU.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0, similarity: float = 0.95,
+                 use_embeddings: bool = False, embedding_model: str = "text-embedding-3-small"):
+        self.similarity = similarity
+        self.use_embeddings = use_embeddings and np is not None
+        self.embedding_model = embedding_model
+        self._entries: LRUCache[str] = LRUCache(maxsize=maxsize, ttl=ttl, on_evict=self._forget_vector)
+        self._vectors: Dict[str, Tuple[Tuple[str, str], object]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt: str, version: str, model: str) -> str:
+        raw = "\x00".join((model, version, normalize_prompt(prompt)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def lookup(self, prompt: str, version: str, model: str) -> CacheProbe:
+        probe = CacheProbe(self.make_key(prompt, version, model), (model, version))
+        probe.answer = self._entries.get(probe.key)
+
+        if probe.answer is None and self.use_embeddings:
+            try:
+                probe.vector = await self._embed(normalize_prompt(prompt))
+                probe.answer = self._nearest(probe.scope, probe.vector)
+            except Exception as e:
+                logger.warning(f"Error al calcular el embedding de la pregunta: {str(e)}")
+
+        if probe.answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return probe
+
+    def store(self, probe: CacheProbe, answer: str) -> None:
+        if not answer:
+            return
+        self._entries.set(probe.key, answer)
+        if probe.vector is not None:
+            with self._lock:
+                self._vectors[probe.key] = (probe.scope, probe.vector)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        with self._lock:
+            self._vectors.clear()
+
+    def _nearest(self, scope: Tuple[str, str], vector) -> Optional[str]:
+        with self._lock:
+            candidates = [(key, v) for key, (s, v) in self._vectors.items() if s == scope]
+        if not candidates:
+            return None
+
+        matrix = np.stack([v for _, v in candidates])
+        similarity = matrix @ vector / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector) + 1e-9)
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.similarity:
+            return None
+        return self._entries.get(candidates[best][0])
+
+    def _forget_vector(self, key: str, _answer: str) -> None:
+        with self._lock:
+            self._vectors.pop(key, None)
+
+    async def _embed(self, text: str):
+        from src.utils.openai_client import get_openai_client
+
+        response = await get_openai_client().embeddings.create(model=self.embedding_model, input=[text])
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """La cache es opt-in: devuelve None si ``response_cache_enabled`` está desactivado"""
+    global _cache
+    if not settings.response_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            maxsize=settings.response_cache_size,
+            ttl=settings.response_cache_ttl,
+            similarity=settings.response_cache_similarity,
+            use_embeddings=settings.response_cache_use_embeddings,
+            embedding_model=settings.embedding_model,
+        )
+    return _cache
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from src.core.config import settings
+from src.models.sheet_write import IdempotencyRecord, SpreadsheetLease
+from src.utils.lru_cache import LRUCache
+
+
+class IdempotencyConflict(Exception):
+    """La clave está en uso por otra petición que aún no ha terminado"""
+
+
+class IdempotencyKeyReused(Exception):
+    """La clave ya se usó con una mutación distinta"""
+
+
+def request_hash(spreadsheet_id: str, mutation: Dict[str, Any]) -> str:
+    raw = json.dumps([spreadsheet_id, mutation], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Claves de idempotencia para mutaciones de Sheets, guardadas en SQLite.
+
+    ``claim`` reserva la clave (``pending``) o devuelve el resultado guardado
+    si la mutación ya se hizo, así que un reintento no duplica filas aunque
+    llegue a otro worker. Si otra petición tiene la clave reservada se espera
+    hasta ``wait`` segundos a que termine. Si la mutación falla la reserva
+    se libera para poder reintentar; una reserva ``pending`` más antigua que
+    ``pending_ttl`` (el worker que la hizo se cayó) se puede volver a tomar.
+    """
+
+    def __init__(self, ttl: float = 86400.0, wait: float = 30.0, pending_ttl: float = 60.0, engine=None):
+        self.ttl = ttl
+        self.wait = wait
+        self.pending_ttl = pending_ttl
+        self._engine = engine
+        self._last_purge = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from src.db import engine
+            self._engine = engine
+        return self._engine
+
+    async def claim(self, key: str, spreadsheet_id: str, mutation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Devuelve el resultado previo, o None si la clave queda reservada para esta petición"""
+        digest = request_hash(spreadsheet_id, mutation)
+        deadline = time.monotonic() + self.wait
+        while True:
+            claimed, record = await asyncio.to_thread(self._try_claim, key, spreadsheet_id, digest)
+            if claimed:
+                return None
+            if record.request_hash != digest:
+                raise IdempotencyKeyReused(f"Idempotency key {key!r} was used for a different request")
+            if record.status == "done":
+                return json.loads(record.result_json)
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict(f"A request with idempotency key {key!r} is still in progress")
+            await asyncio.sleep(0.1)
+
+    async def complete(self, key: str, result: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._complete, key, result)
+
+    async def release(self, key: str) -> None:
+        await asyncio.to_thread(self._release, key)
+
+    def _try_claim(self, key: str, spreadsheet_id: str, digest: str):
+        self._maybe_purge()
+        with Session(self.engine) as session:
+            session.add(IdempotencyRecord(key=key, spreadsheet_id=spreadsheet_id, request_hash=digest))
+            try:
+                session.commit()
+                return True, None
+            except IntegrityError:
+                session.rollback()
+            record = session.get(IdempotencyRecord, key)
+            if record is None:
+                # Se liberó entre el INSERT y la lectura
+                return self._try_claim(key, spreadsheet_id, digest)
+            # Se devuelve tal como se leyó; el commit de abajo no debe expirarlo
+            session.expunge(record)
+            if record.status == "pending" and record.request_hash == digest:
+                now = datetime.utcnow()
+                # Reserva abandonada: solo uno de los que compiten la renueva
+                taken = session.exec(
+                    update(IdempotencyRecord)
+                    .where(IdempotencyRecord.key == key)
+                    .where(IdempotencyRecord.status == "pending")
+                    .where(IdempotencyRecord.created_at < now - timedelta(seconds=self.pending_ttl))
+                    .values(created_at=now)
+                ).rowcount
+                session.commit()
+                if taken:
+                    return True, None
+            return False, record
+
+    def _complete(self, key: str, result: Dict[str, Any]) -> None:
+        with Session(self.engine) as session:
+            session.exec(
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.key == key)
+                .values(status="done", result_json=json.dumps(result, default=str))
+            )
+            session.commit()
+
+    def _release(self, key: str) -> None:
+        with Session(self.engine) as session:
+            session.exec(delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == key, IdempotencyRecord.status == "pending"
+            ))
+            session.commit()
+
+    def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < 600:
+            return
+        self._last_purge = now
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        with Session(self.engine) as session:
+            session.exec(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff))
+            session.commit()
+
+
+class SpreadsheetLocks:
+    """
+    Serialización de escrituras por hoja de cálculo.
+
+    - ``local``: un ``asyncio.Lock`` por hoja, así que en un proceso los
+      lotes de una misma hoja se envían de uno en uno y en orden.
+    - ``lease``: un lease con expiración en SQLite para las escrituras que
+      dependen del estado de la hoja (añadir columnas, reescribir cabeceras)
+      y que varios workers no pueden hacer a la vez. Cada lease devuelve si
+      otro worker cambió las cabeceras desde la última vez, para invalidar
+      los metadatos en cache.
+
+    Ninguno de los dos registros crece con cada hoja tocada: un lock local
+    desaparece cuando nadie lo tiene ni lo espera, y de las versiones vistas
+    solo se guardan las más recientes (perder una solo fuerza a recargar
+    los metadatos).
+    """
+
+    def __init__(self, lease_ttl: float = 30.0, engine=None, max_versions: int = 1024):
+        self.lease_ttl = lease_ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._engine = engine
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._seen_versions: LRUCache[int] = LRUCache(maxsize=max_versions)
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from src.db import engine
+            self._engine = engine
+        return self._engine
+
+    def local(self, spreadsheet_id: str) -> asyncio.Lock:
+        lock = self._locks.get(spreadsheet_id)
+        if lock is None:
+            lock = self._locks[spreadsheet_id] = asyncio.Lock()
+        return lock
+
+    @asynccontextmanager
+    async def lease(self, spreadsheet_id: str, bump: bool = True):
+        """Lease entre workers; produce True si otro worker cambió la hoja desde nuestra última escritura"""
+        deadline = time.monotonic() + self.lease_ttl
+        while True:
+            version = await asyncio.to_thread(self._acquire, spreadsheet_id)
+            if version is not None:
+                break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Could not lock spreadsheet {spreadsheet_id} for writing")
+            await asyncio.sleep(0.05)
+
+        seen = self._seen_versions.get(spreadsheet_id)
+        try:
+            # Sin versión vista (primer lease del proceso) se asume que cambió
+            yield seen != version
+        finally:
+            self._seen_versions.set(spreadsheet_id, await asyncio.to_thread(
+                self._release, spreadsheet_id, bump
+            ))
+
+    def _acquire(self, spreadsheet_id: str) -> Optional[int]:
+        now = datetime.utcnow()
+        with Session(self.engine) as session:
+            if session.get(SpreadsheetLease, spreadsheet_id) is None:
+                session.add(SpreadsheetLease(spreadsheet_id=spreadsheet_id))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+
+            acquired = session.exec(
+                update(SpreadsheetLease)
+                .where(SpreadsheetLease.spreadsheet_id == spreadsheet_id)
+                .where(or_(SpreadsheetLease.owner.is_(None), SpreadsheetLease.expires_at < now))
+                .values(owner=self.owner, expires_at=now + timedelta(seconds=self.lease_ttl))
+            ).rowcount
+            session.commit()
+            if not acquired:
+                return None
+            return session.exec(
+                select(SpreadsheetLease.version).where(SpreadsheetLease.spreadsheet_id == spreadsheet_id)
+            ).one()
+
+    def _release(self, spreadsheet_id: str, bump: bool) -> int:
+        values = {"owner": None, "expires_at": None}
+        if bump:
+            values["version"] = SpreadsheetLease.version + 1
+        with Session(self.engine) as session:
+            session.exec(
+                update(SpreadsheetLease)
+                .where(SpreadsheetLease.spreadsheet_id == spreadsheet_id)
+                .where(SpreadsheetLease.owner == self.owner)
+                .values(**values)
+            )
+            session.commit()
+            return session.exec(
+                select(SpreadsheetLease.version).where(SpreadsheetLease.spreadsheet_id == spreadsheet_id)
+            ).one()
+
+
+_idempotency: Optional[IdempotencyStore] = None
+_locks: Optional[SpreadsheetLocks] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _idempotency
+    if _idempotency is None:
+        _idempotency = IdempotencyStore(
+            ttl=settings.idempotency_ttl,
+            wait=settings.sheets_call_timeout,
+            # Un lote puede esperar el lease y luego la llamada a Sheets
+            pending_ttl=2 * settings.sheets_call_timeout,
+        )
+    return _idempotency
+
+
+def get_spreadsheet_locks() -> SpreadsheetLocks:
+    global _locks
+    if _locks is None:
+        _locks = SpreadsheetLocks(lease_ttl=settings.sheets_call_timeout)
+    return _locks
@@ -1,9 +1,14 @@
-from googleapiclient.discovery import build
+from src.utils.google_services import get_google_services
 
-def get_service(creds):
-    return build("sheets", "v4", credentials=creds)
+def get_service(creds=None):
+    services = get_google_services()
+    # Sin cargar las del registro: puede no haber cuenta de servicio configurada
+    if creds is None or creds is services.loaded_credentials():
+        return services.service("sheets", "v4")
+    # Credenciales ajenas al registro: servicio propio, pero sin volver a cargar el discovery
+    return services.build("sheets", "v4", creds)
 
-def append_row(spreadsheet_id: str, values: list[str], creds):
+def append_row(spreadsheet_id: str, values: list[str], creds=None):
     service = get_service(creds)
     body = {"values": [values]}
     service.spreadsheets().values().append(
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from src.core.config import settings
+from src.services.sheet_writes import get_idempotency_store, get_spreadsheet_locks
+from src.utils.async_sheets_client import get_async_sheets_client
+
+logger = logging.getLogger(__name__)
+
+
+def _changes_headers(mutation: Dict[str, Any]) -> bool:
+    """Mutaciones que dependen de las cabeceras actuales o las cambian"""
+    return mutation['op'] == 'add_column' or (mutation['op'] == 'update_row' and mutation['row_index'] == 1)
+
+
+class SpreadsheetMutationQueue:
+    """
+    Cola write-behind de mutaciones para una hoja de cálculo.
+
+    Las mutaciones que llegan dentro de ``window`` segundos se envían juntas
+    con ``GoogleSheetsClient.batch_mutate``; cada llamante recibe el
+    resultado de su propia mutación. Los lotes de una hoja se envían de uno
+    en uno; los que tocan cabeceras además toman el lease entre workers.
+    """
+
+    def __init__(self, spreadsheet_id: str, window: float = 0.05, max_batch: int = 100,
+                 on_idle: Optional[Callable[["SpreadsheetMutationQueue"], None]] = None):
+        self.spreadsheet_id = spreadsheet_id
+        self.window = window
+        self.max_batch = max_batch
+        self.on_idle = on_idle
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def idle(self) -> bool:
+        """Sin mutaciones pendientes ni lotes en curso"""
+        return not self._pending and not self._tasks
+
+    async def submit(self, mutation: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.enqueue(mutation)
+
+    def enqueue(self, mutation: Dict[str, Any]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((mutation, future))
+
+        if len(self._pending) >= self.max_batch:
+            batch, self._pending = self._pending, []
+            self._track(asyncio.create_task(self._send(batch)))
+        elif self._timer is None:
+            self._timer = self._track(asyncio.create_task(self._flush_after_window()))
+
+        return future
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+        return task
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error al enviar un lote de mutaciones", exc_info=task.exception(),
+                         extra={"spreadsheet_id": self.spreadsheet_id})
+        if self.idle and self.on_idle is not None:
+            self.on_idle(self)
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.window)
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            await self._send(batch)
+
+    async def _send(self, batch: List[tuple]) -> None:
+        mutations = [mutation for mutation, _ in batch]
+        client = get_async_sheets_client()
+        locks = get_spreadsheet_locks()
+        try:
+            async with locks.local(self.spreadsheet_id):
+                if any(_changes_headers(m) for m in mutations):
+                    async with locks.lease(self.spreadsheet_id) as changed:
+                        if changed:
+                            # Otro worker cambió las cabeceras: no fiarse de la cache
+                            client.client.invalidate_metadata(self.spreadsheet_id)
+                        results = await client.run(client.client.batch_mutate, self.spreadsheet_id, mutations)
+                else:
+                    results = await client.run(client.client.batch_mutate, self.spreadsheet_id, mutations)
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class SheetsBatcher:
+    """
+    Registro de colas por hoja de cálculo con una API por operación.
+
+    Con ``idempotency_key`` la mutación se registra en el
+    ``IdempotencyStore``: un reintento con la misma clave devuelve el
+    resultado original en lugar de repetir la escritura.
+    """
+
+    def __init__(self, window: float = 0.05, max_batch: int = 100):
+        self.window = window
+        self.max_batch = max_batch
+        self._queues: Dict[str, SpreadsheetMutationQueue] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def queue(self, spreadsheet_id: str) -> SpreadsheetMutationQueue:
+        queue = self._queues.get(spreadsheet_id)
+        if queue is None:
+            queue = SpreadsheetMutationQueue(spreadsheet_id, self.window, self.max_batch, on_idle=self._drop)
+            self._queues[spreadsheet_id] = queue
+        return queue
+
+    def _drop(self, queue: SpreadsheetMutationQueue) -> None:
+        # Las colas vacías se descartan; la próxima mutación crea otra
+        if self._queues.get(queue.spreadsheet_id) is queue:
+            del self._queues[queue.spreadsheet_id]
+
+    async def submit(self, spreadsheet_id: str, mutation: Dict[str, Any],
+                     idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        if idempotency_key is None:
+            return await self.queue(spreadsheet_id).submit(mutation)
+
+        store = get_idempotency_store()
+        previous = await store.claim(idempotency_key, spreadsheet_id, mutation)
+        if previous is not None:
+            return previous
+
+        try:
+            future = self.queue(spreadsheet_id).enqueue(mutation)
+            # Se registra al terminar la mutación aunque quien espera se cancele
+            future.add_done_callback(lambda f: self._track(self._settle(idempotency_key, f)))
+        except BaseException:
+            await store.release(idempotency_key)
+            raise
+        return await asyncio.shield(future)
+
+    def _track(self, coroutine) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._settled)
+
+    def _settled(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error al registrar una clave de idempotencia", exc_info=task.exception())
+
+    @staticmethod
+    async def _settle(idempotency_key: str, future: asyncio.Future) -> None:
+        store = get_idempotency_store()
+        if future.cancelled() or future.exception() is not None or not future.result().get('success', False):
+            # Solo se recuerdan las escrituras hechas; un fallo se puede reintentar
+            await store.release(idempotency_key)
+        else:
+            await store.complete(idempotency_key, future.result())
+
+    async def add_row(self, spreadsheet_id: str, sheet_name: str, values: List[Any],
+                      idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self.submit(
+            spreadsheet_id, {'op': 'add_row', 'sheet_name': sheet_name, 'values': values}, idempotency_key
+        )
+
+    async def update_row(self, spreadsheet_id: str, sheet_name: str, row_index: int, values: List[Any],
+                         idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self.submit(
+            spreadsheet_id,
+            {'op': 'update_row', 'sheet_name': sheet_name, 'row_index': row_index, 'values': values},
+            idempotency_key
+        )
+
+    async def add_column(self, spreadsheet_id: str, sheet_name: str, column_name: str,
+                         idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self.submit(
+            spreadsheet_id, {'op': 'add_column', 'sheet_name': sheet_name, 'column_name': column_name},
+            idempotency_key
+        )
+
+    async def submit_many(self, spreadsheet_id: str, mutations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Encola varias mutaciones y devuelve un resultado por cada una (los errores incluidos).
+
+        Cada mutación puede llevar su propia ``idempotency_key``.
+        """
+        results = await asyncio.gather(*[
+            self.submit(spreadsheet_id, {k: v for k, v in m.items() if k != 'idempotency_key'},
+                        m.get('idempotency_key'))
+            for m in mutations
+        ], return_exceptions=True)
+        return [
+            {'success': False, 'message': str(r)} if isinstance(r, Exception) else r
+            for r in results
+        ]
+
+
+_batcher: Optional[SheetsBatcher] = None
+
+
+def get_sheets_batcher() -> SheetsBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = SheetsBatcher(
+            window=settings.sheets_batch_window,
+            max_batch=settings.sheets_batch_max_size,
+        )
+    return _batcher
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+
+from src.core.config import settings
+from src.models.sheet_write import SpareSpreadsheet
+from src.utils.async_sheets_client import SheetsTimeoutError, get_async_sheets_client
+
+logger = logging.getLogger(__name__)
+
+VENDOR_HEADERS = ["Vendor Name", "Services Provided", "Contract Terms",
+                  "Compliance Info", "Usage Criticality"]
+
+
+class SpreadsheetPool:
+    """
+    Pool de hojas de cálculo en blanco, creadas y compartidas de antemano.
+
+    ``claim`` toma una, la renombra y escribe las cabeceras en una sola
+    llamada a Google, y pide reponer el pool en segundo plano; si esa
+    llamada falla la hoja vuelve al pool (o se borra). Las hojas
+    libres se guardan en SQLite, así que sobreviven a un reinicio y los
+    workers se las reparten sin tomar la misma dos veces (el ``DELETE`` de
+    la fila decide quién se la queda). Varios workers reponiendo a la vez
+    pueden dejar alguna hoja de más.
+    """
+
+    def __init__(self, size: int, engine=None):
+        self.size = size
+        self._engine = engine
+        self._refill: Optional[asyncio.Task] = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from src.db import engine
+            self._engine = engine
+        return self._engine
+
+    async def claim(self, title: str, headers: List[str]) -> Optional[Dict[str, Any]]:
+        """Devuelve la hoja ya preparada, o None si el pool está vacío o falla"""
+        spare = await self.take()
+        if spare is None:
+            return None
+        return await _adopt_or_release(spare, title, headers, pool=self)
+
+    async def take(self) -> Optional[SpareSpreadsheet]:
+        """Saca una hoja en blanco del pool (None si está vacío)"""
+        spare = await asyncio.to_thread(self._take)
+        self.refill_soon()
+        return spare
+
+    async def put_back(self, spare: SpareSpreadsheet) -> None:
+        """Devuelve al pool una hoja que no se llegó a usar"""
+        await asyncio.to_thread(self._add, spare)
+
+    def refill_soon(self) -> None:
+        """Repone el pool en segundo plano (una sola tarea a la vez)"""
+        if self.size > 0 and (self._refill is None or self._refill.done()):
+            self._refill = asyncio.ensure_future(self._fill())
+
+    async def stop(self) -> None:
+        if self._refill is not None:
+            self._refill.cancel()
+            await asyncio.gather(self._refill, return_exceptions=True)
+            self._refill = None
+
+    async def _fill(self) -> None:
+        client = get_async_sheets_client()
+        while await asyncio.to_thread(self._count) < self.size:
+            try:
+                spare = await client.run(client.client.create_spare)
+            except Exception as e:
+                # Se vuelve a intentar en el próximo claim
+                logger.warning(f"No se pudo reponer el pool de hojas: {str(e)}")
+                return
+            await asyncio.to_thread(self._add, SpareSpreadsheet(**spare))
+
+    def _take(self) -> Optional[SpareSpreadsheet]:
+        with Session(self.engine) as session:
+            candidates = session.exec(select(SpareSpreadsheet).order_by(SpareSpreadsheet.created_at).limit(5)).all()
+            # Copias: tras el commit las instancias de la sesión quedan expiradas
+            for spare in [SpareSpreadsheet.model_validate(c.model_dump()) for c in candidates]:
+                taken = session.exec(
+                    delete(SpareSpreadsheet).where(SpareSpreadsheet.spreadsheet_id == spare.spreadsheet_id)
+                ).rowcount
+                session.commit()
+                if taken:
+                    return spare
+        return None
+
+    def _count(self) -> int:
+        with Session(self.engine) as session:
+            return session.exec(select(func.count()).select_from(SpareSpreadsheet)).one()
+
+    def _add(self, spare: SpareSpreadsheet) -> None:
+        with Session(self.engine) as session:
+            session.add(SpareSpreadsheet.model_validate(spare.model_dump()))
+            session.commit()
+
+
+_pool: Optional[SpreadsheetPool] = None
+
+
+def get_spreadsheet_pool() -> Optional[SpreadsheetPool]:
+    """El pool es opcional: devuelve None si ``sheets_pool_size`` es 0"""
+    global _pool
+    if settings.sheets_pool_size <= 0:
+        return None
+    if _pool is None:
+        _pool = SpreadsheetPool(settings.sheets_pool_size)
+    return _pool
+
+
+async def adopt_spare(spare: SpareSpreadsheet, title: str, headers: List[str]) -> Dict[str, Any]:
+    """Renombra la hoja en blanco y escribe las cabeceras (una llamada)"""
+    client = get_async_sheets_client()
+    return await client.run(
+        client.client.adopt_spare, spare.spreadsheet_id, spare.sheet_id, title, headers,
+        spare.row_count, spare.column_count,
+    )
+
+
+async def _adopt_or_release(spare: SpareSpreadsheet, title: str, headers: List[str],
+                            pool: Optional[SpreadsheetPool] = None) -> Optional[Dict[str, Any]]:
+    """``adopt_spare``; si falla la hoja no se pierde (``release_spare``) y devuelve None"""
+    try:
+        return await adopt_spare(spare, title, headers)
+    except asyncio.CancelledError:
+        # La llamada sigue en su hilo y puede aplicarse: la hoja ya no se reutiliza
+        release_spare_soon(spare, reusable=False, pool=pool)
+        raise
+    except Exception as e:
+        logger.warning(f"No se pudo usar una hoja en blanco: {str(e)}",
+                       extra={"spreadsheet_id": spare.spreadsheet_id})
+        try:
+            # Tras un timeout no se sabe si se renombró: se borra en lugar de devolverla
+            await release_spare(spare, reusable=not isinstance(e, SheetsTimeoutError), pool=pool)
+        except Exception as error:
+            logger.warning(f"No se pudo liberar una hoja en blanco: {str(error)}",
+                           extra={"spreadsheet_id": spare.spreadsheet_id})
+        return None
+
+
+async def reserve_spare() -> Optional[SpareSpreadsheet]:
+    """Una hoja en blanco y compartida: del pool si hay, si no se crea"""
+    pool = get_spreadsheet_pool()
+    if pool is not None:
+        spare = await pool.take()
+        if spare is not None:
+            return spare
+    client = get_async_sheets_client()
+    return SpareSpreadsheet(**await client.run(client.client.create_spare))
+
+
+async def release_spare(spare: SpareSpreadsheet, reusable: bool = True,
+                        pool: Optional[SpreadsheetPool] = None) -> None:
+    """
+    Deshace ``reserve_spare``: vuelve al pool o, sin pool o si ya no está
+    en blanco (``reusable=False``), se borra
+    """
+    pool = pool or get_spreadsheet_pool()
+    if reusable and pool is not None:
+        await pool.put_back(spare)
+        return
+    client = get_async_sheets_client()
+    await client.run(client.client.delete_spreadsheet, spare.spreadsheet_id)
+
+
+_releasing: Set[asyncio.Task] = set()
+
+
+def release_spare_soon(spare: SpareSpreadsheet, reusable: bool = True,
+                       pool: Optional[SpreadsheetPool] = None) -> asyncio.Task:
+    """``release_spare`` en segundo plano, p. ej. desde una tarea que se está cancelando"""
+    task = asyncio.ensure_future(release_spare(spare, reusable, pool))
+    _releasing.add(task)
+    task.add_done_callback(lambda t: _released(t, spare))
+    return task
+
+
+def _released(task: asyncio.Task, spare: SpareSpreadsheet) -> None:
+    _releasing.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"No se pudo liberar una hoja en blanco: {str(task.exception())}",
+                       extra={"spreadsheet_id": spare.spreadsheet_id})
+
+
+def release_when_ready(spare: asyncio.Future) -> None:
+    """Libera en segundo plano una hoja de ``reserve_spare`` que quizá aún se está creando"""
+    task = asyncio.ensure_future(_release_when_ready(spare))
+    _releasing.add(task)
+    task.add_done_callback(_releasing.discard)
+
+
+async def _release_when_ready(spare: asyncio.Future) -> None:
+    # No se cancela: la hoja se crearía igualmente en el hilo y quedaría huérfana
+    try:
+        reserved: Optional[SpareSpreadsheet] = await spare
+    except BaseException:
+        return
+    if reserved is None:
+        return
+    try:
+        await release_spare(reserved)
+    except Exception as e:
+        logger.warning(f"No se pudo liberar una hoja reservada: {str(e)}",
+                       extra={"spreadsheet_id": reserved.spreadsheet_id})
+
+
+async def provision_spreadsheet(title: str, headers: List[str],
+                                spare: Optional[asyncio.Future] = None) -> Dict[str, Any]:
+    """
+    Crea una hoja con cabeceras: sobre ``spare`` si se reservó una mientras
+    llegaban los argumentos, del pool si hay una libre (una llamada) o
+    creándola con las cabeceras en el cuerpo. Si la hoja reservada o la del
+    pool no se puede usar, vuelve al pool o se borra y se crea una nueva.
+    ``spare`` pasa a ser responsabilidad de esta función, también si se cancela.
+    """
+    if spare is not None:
+        try:
+            reserved = await asyncio.shield(spare)
+        except asyncio.CancelledError:
+            release_when_ready(spare)
+            raise
+        except Exception as e:
+            logger.warning(f"No se pudo reservar una hoja en blanco: {str(e)}")
+            reserved = None
+        if reserved is not None:
+            result = await _adopt_or_release(reserved, title, headers)
+            if result is not None:
+                return result
+
+    pool = get_spreadsheet_pool()
+    if pool is not None:
+        result = await pool.claim(title, headers)
+        if result is not None:
+            return result
+    return await get_async_sheets_client().create_sheet(title, headers)
@@ -0,0 +1,218 @@
+import asyncio
+import itertools
+import logging
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from src.core.config import settings
+from src.core.metrics import SSE_ABANDONED
+from src.utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class StreamGone(Exception):
+    """La generación ya no existe o los eventos pedidos salieron del buffer"""
+
+
+class StreamNotHere(StreamGone):
+    """Este proceso no conoce la generación (la lleva otro worker, o se reinició)"""
+
+
+class Generation:
+    """
+    Una respuesta en curso, desacoplada de las conexiones que la leen.
+
+    Una tarea propia consume los tokens y los guarda numerados en un buffer
+    acotado (``buffer_size`` tokens). Cada conexión es una suscripción que lee
+    del buffer desde el número que ya tenga, así que varias pestañas pueden
+    seguir la misma respuesta y una conexión caída puede retomarla con el
+    ``Last-Event-ID``. Si no queda ningún suscriptor, la generación sigue
+    ``grace`` segundos esperando una reconexión y después se cancela (lo que
+    cierra el stream del proveedor).
+    """
+
+    def __init__(self, conversation_id: str, tokens: AsyncIterator[str],
+                 buffer_size: int, grace: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.conversation_id = conversation_id
+        self.grace = grace
+        self.done = False
+        self._events: Deque[Tuple[int, str]] = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._subscribers = 0
+        self._wakeup = asyncio.Event()
+        self._expiry: Optional[asyncio.TimerHandle] = None
+        self._task = asyncio.create_task(self._run(tokens))
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    async def _run(self, tokens: AsyncIterator[str]) -> None:
+        try:
+            async for token in tokens:
+                if token:
+                    self._append(token)
+        except asyncio.CancelledError:
+            # Los suscriptores reciben el final (finally) y la tarea queda cancelada
+            raise
+        except Exception as e:
+            logger.exception("Error en el stream", extra={"conversation_id": self.conversation_id})
+            self._append(f"Error generating response: {str(e)}")
+        finally:
+            self.done = True
+            self._notify()
+
+    def _append(self, token: str) -> None:
+        self._seq += 1
+        self._events.append((self._seq, token))
+        self._notify()
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def _since(self, seq: int):
+        """Eventos posteriores a ``seq``; StreamGone si alguno ya salió del buffer"""
+        if not self._events:
+            return []
+        oldest = self._events[0][0]
+        if seq < oldest - 1:
+            raise StreamGone("The requested events are no longer buffered")
+        return list(itertools.islice(self._events, max(0, seq - oldest + 1), None))
+
+    def check(self, after: int) -> None:
+        """Falla ya (antes de responder) si no se puede continuar desde ``after``"""
+        if after > self._seq:
+            raise StreamGone("Unknown event id")
+        self._since(after)
+
+    async def subscribe(self, after: int = 0) -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """
+        Pares (event id, token) a partir de ``after``. Al terminar la
+        generación llega un último par con token None.
+
+        Un suscriptor tan lento que el buffer lo adelanta se corta sin ese
+        final: al reconectar recibirá ``StreamGone``.
+        """
+        self._attach()
+        try:
+            seq = after
+            while True:
+                wakeup = self._wakeup
+                try:
+                    events = self._since(seq)
+                except StreamGone:
+                    logger.warning("Suscriptor SSE adelantado por el buffer",
+                                   extra={"conversation_id": self.conversation_id})
+                    return
+                for seq, token in events:
+                    yield self.event_id(seq), token
+                if events:
+                    continue
+                if self.done:
+                    yield self.event_id(self._seq), None
+                    return
+                await wakeup.wait()
+        finally:
+            self._detach()
+
+    def _attach(self) -> None:
+        self._subscribers += 1
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
+    def _detach(self) -> None:
+        self._subscribers -= 1
+        if self._subscribers == 0 and not self.done:
+            self._expiry = asyncio.get_running_loop().call_later(self.grace, self._abandon)
+
+    def _abandon(self) -> None:
+        self._expiry = None
+        if self._subscribers == 0 and not self.done:
+            logger.info("Generación sin clientes, se cancela", extra={"conversation_id": self.conversation_id})
+            SSE_ABANDONED.inc()
+            self._task.cancel()
+
+    def add_done_callback(self, callback: Callable[["Generation"], None]) -> None:
+        self._task.add_done_callback(lambda _: callback(self))
+
+    async def cancel(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class StreamBroker:
+    """
+    Registro de las generaciones en curso de este proceso.
+
+    Se encuentran por id (para ``Last-Event-ID``) o por conversación (para
+    que otra pestaña se una a la respuesta en curso). Una generación
+    terminada se conserva ``grace`` segundos para poder reenviar el final a
+    quien se desconectó justo antes.
+
+    El buffer vive en el proceso: con varios workers una reconexión que
+    llega a otro proceso no puede continuar y ``resume`` lanza
+    ``StreamNotHere`` (409) en lugar de empezar de nuevo; el cliente recarga
+    el historial, que sí está en el store compartido (con la respuesta
+    parcial si la generación se abandonó).
+    """
+
+    def __init__(self, buffer_size: int, grace: float):
+        self.buffer_size = buffer_size
+        self.grace = grace
+        self._by_id: Dict[str, Generation] = {}
+        self._latest: Dict[str, str] = {}
+        # Generaciones olvidadas recientemente: distinguen "expirada" de "no es de este proceso"
+        self._forgotten: LRUCache[bool] = LRUCache(maxsize=4096)
+
+    def start(self, conversation_id: str, tokens: AsyncIterator[str]) -> Generation:
+        generation = Generation(conversation_id, tokens, self.buffer_size, self.grace)
+        self._by_id[generation.id] = generation
+        self._latest[conversation_id] = generation.id
+        generation.add_done_callback(
+            lambda g: asyncio.get_running_loop().call_later(self.grace, self._forget, g))
+        return generation
+
+    def current(self, conversation_id: str) -> Optional[Generation]:
+        """La última generación de la conversación, si sigue en curso"""
+        generation = self._by_id.get(self._latest.get(conversation_id, ""))
+        if generation is None or generation.done:
+            return None
+        return generation
+
+    def resume(self, conversation_id: str, last_event_id: str) -> Tuple[Generation, int]:
+        """La generación y el número de evento desde el que continuar"""
+        generation_id, _, seq = last_event_id.strip().partition(":")
+        generation = self._by_id.get(generation_id)
+        if generation is None and not self._forgotten.get(generation_id) and seq.isdigit():
+            raise StreamNotHere("The stream is not held by this server process; reload the conversation")
+        if generation is None or generation.conversation_id != conversation_id or not seq.isdigit():
+            raise StreamGone("The stream can no longer be resumed")
+        after = int(seq)
+        generation.check(after)
+        return generation, after
+
+    def _forget(self, generation: Generation) -> None:
+        self._forgotten.set(generation.id, True)
+        self._by_id.pop(generation.id, None)
+        if self._latest.get(generation.conversation_id) == generation.id:
+            del self._latest[generation.conversation_id]
+
+    async def stop(self) -> None:
+        generations = list(self._by_id.values())
+        self._by_id.clear()
+        self._latest.clear()
+        await asyncio.gather(*[g.cancel() for g in generations], return_exceptions=True)
+
+
+_broker: Optional[StreamBroker] = None
+
+
+def get_stream_broker() -> StreamBroker:
+    global _broker
+    if _broker is None:
+        _broker = StreamBroker(settings.sse_replay_buffer_tokens, settings.sse_resume_grace)
+    return _broker
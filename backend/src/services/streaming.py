@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from src.core.config import settings
+from src.core.metrics import SSE_DISCONNECTS, SSE_FIRST_TOKEN_SECONDS, SSE_RESUMES, SSE_STREAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # evita que nginx acumule la respuesta
+}
+
+KEEPALIVE = ": keep-alive\n\n"
+
+_END = object()
+
+
+def sse_event(data: str, event: Optional[str] = None, id: Optional[str] = None) -> str:
+    """Formatea un evento SSE; cada línea del texto va en su propio campo ``data:``"""
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+class SSEStream:
+    """
+    Motor de streaming compartido por los endpoints de chat.
+
+    Lee los pares (event id, token) de una suscripción a una ``Generation``
+    (ver ``stream_broker``) en una tarea aparte y los envía como eventos SSE:
+
+    - agrupa los tokens pequeños en menos frames (``min_chunk`` caracteres o
+      ``flush_interval`` segundos); si el cliente lee despacio, los tokens
+      acumulados en la cola salen juntos en el siguiente frame,
+    - cada frame lleva como ``id`` el del último token que incluye, para que
+      el cliente pueda reconectar con ``Last-Event-ID``; el final de la
+      respuesta se marca con un evento ``done``,
+    - la cola es acotada, así que un cliente lento frena su suscripción (la
+      generación sigue llenando su buffer),
+    - envía comentarios keep-alive cuando no hay tokens durante
+      ``heartbeat`` segundos,
+    - si el cliente se desconecta, cancela la suscripción; la generación
+      sigue un tiempo de gracia por si vuelve.
+
+    Registra el tiempo hasta el primer frame con datos (desde el inicio de
+    la petición) y la duración total, etiquetados por ``endpoint``.
+    """
+
+    def __init__(self, request: Request, events: AsyncIterator[Tuple[str, Optional[str]]], *,
+                 heartbeat: float = 15.0, flush_interval: float = 0.05,
+                 min_chunk: int = 32, queue_size: int = 256, endpoint: str = ""):
+        self.request = request
+        self.source = events
+        self.endpoint = endpoint
+        self.started_at = getattr(request.state, "started_at", None) or time.perf_counter()
+        self.heartbeat = heartbeat
+        self.flush_interval = flush_interval
+        self.min_chunk = min_chunk
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._last_disconnect_check = 0.0
+
+    async def _pump(self) -> None:
+        try:
+            async for item in self.source:
+                await self._queue.put(item)
+        except Exception:
+            # Sin evento "done": el cliente reconectará
+            logger.exception("Error en la suscripción SSE", extra={"endpoint": self.endpoint})
+        await self._queue.put(_END)
+
+    async def _client_gone(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._last_disconnect_check < 1.0:
+            return False
+        self._last_disconnect_check = now
+        return await self.request.is_disconnected()
+
+    async def events(self):
+        producer = asyncio.create_task(self._pump())
+        buffer: List[str] = []
+        size = 0
+        last_id = None
+        first_frame = True
+        deadline = None
+        finished = False
+
+        try:
+            while True:
+                if buffer:
+                    timeout = max(0.0, deadline - time.monotonic())
+                else:
+                    timeout = self.heartbeat
+
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if buffer:
+                        yield sse_event("".join(buffer), id=last_id)
+                        buffer, size = [], 0
+                        continue
+                    if await self._client_gone(force=True):
+                        break
+                    yield KEEPALIVE
+                    continue
+
+                # Lo que ya esté en la cola sale en el mismo frame
+                items = [item]
+                while not self._queue.empty() and items[-1] is not _END:
+                    items.append(self._queue.get_nowait())
+
+                finished = items[-1] is _END
+                if finished:
+                    items.pop()
+
+                done_id = None
+                tokens = []
+                for event_id, token in items:
+                    if token is None:
+                        done_id = event_id
+                    else:
+                        tokens.append(token)
+                        last_id = event_id
+
+                if tokens and not buffer:
+                    deadline = time.monotonic() + self.flush_interval
+                buffer.extend(tokens)
+                size += sum(len(token) for token in tokens)
+
+                if buffer and (finished or done_id or first_frame or size >= self.min_chunk):
+                    if first_frame:
+                        SSE_FIRST_TOKEN_SECONDS.labels(endpoint=self.endpoint).observe(
+                            time.perf_counter() - self.started_at)
+                    yield sse_event("".join(buffer), id=last_id)
+                    buffer, size = [], 0
+                    first_frame = False
+
+                if done_id is not None:
+                    yield sse_event("", event="done", id=done_id)
+                if finished:
+                    break
+                if await self._client_gone():
+                    break
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            SSE_STREAM_SECONDS.labels(endpoint=self.endpoint).observe(time.perf_counter() - self.started_at)
+            if not finished:
+                SSE_DISCONNECTS.labels(endpoint=self.endpoint).inc()
+
+
+def event_stream_response(request: Request, events: AsyncIterator[Tuple[str, Optional[str]]],
+                          resumed: bool = False) -> StreamingResponse:
+    """Respuesta SSE para una suscripción de ``Generation.subscribe``"""
+    endpoint = getattr(request.scope.get("route"), "path", request.url.path)
+    if resumed:
+        SSE_RESUMES.labels(endpoint=endpoint).inc()
+    stream = SSEStream(
+        request,
+        events,
+        heartbeat=settings.sse_heartbeat_interval,
+        flush_interval=settings.sse_flush_interval,
+        min_chunk=settings.sse_min_chunk_chars,
+        endpoint=endpoint,
+    )
+    return StreamingResponse(stream.events(), media_type="text/event-stream", headers=SSE_HEADERS)
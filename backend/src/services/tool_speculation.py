@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
+from src.services.spreadsheet_pool import release_when_ready, reserve_spare
+from src.utils.async_sheets_client import get_async_sheets_client
+from src.utils.partial_json import IncrementalObjectParser
+
+logger = logging.getLogger(__name__)
+
+# Tools cuya ejecución lee los metadatos de la hoja (sheetId, tamaño, cabeceras)
+METADATA_TOOLS = {"add_column"}
+
+
+class SpareReservation:
+    """
+    Hoja reservada por adelantado para una tool call. Quien la usa la toma
+    con ``take``; si nadie la toma, ``release`` la devuelve al pool o la borra.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self._task: Optional[asyncio.Task] = task
+
+    def take(self) -> Optional[asyncio.Task]:
+        task, self._task = self._task, None
+        return task
+
+    def release(self) -> None:
+        task = self.take()
+        if task is not None:
+            release_when_ready(task)
+
+
+@dataclass
+class _PendingCall:
+    parser: IncrementalObjectParser = field(default_factory=IncrementalObjectParser)
+    spare: Optional[asyncio.Task] = None
+    prefetched: Set[tuple] = field(default_factory=set)
+
+
+class ToolSpeculator:
+    """
+    Trabajo preparatorio de las tool calls mientras sus argumentos llegan en streaming.
+
+    Los ``arguments`` se parsean de forma incremental y, en cuanto un campo
+    está completo, se adelanta lo que la tool va a necesitar:
+
+    - ``create_spreadsheet``: con el ``title`` se reserva una hoja en blanco y
+      compartida (del pool o creándola). Al ejecutarse la tool solo falta
+      renombrarla y escribir las cabeceras finales, en una llamada.
+    - ``add_column``: con ``spreadsheet_id`` (y ``sheet_name``) se cargan los
+      metadatos y las cabeceras en la cache del cliente.
+
+    Solo se adelanta trabajo que no cambia nada visible: la hoja reservada
+    está en blanco, así que da igual que los argumentos finales difieran. Si
+    la tool call no llega a ejecutarse (stream cortado, argumentos inválidos,
+    otra función) ``discard`` devuelve la hoja al pool o la borra.
+    """
+
+    def __init__(self):
+        self._calls: Dict[int, _PendingCall] = {}
+
+    def feed(self, index: int, name: str, arguments: Optional[str]) -> None:
+        call = self._calls.setdefault(index, _PendingCall())
+        if not arguments:
+            return
+        for key, _ in call.parser.feed(arguments):
+            self._prepare(name, call, key)
+
+    def take(self, index: int, tool_call: dict) -> Optional[SpareReservation]:
+        """
+        La hoja reservada para esta tool call, si sigue siendo válida con los
+        argumentos finales; deja de ser responsabilidad del speculator
+        """
+        call = self._calls.get(index)
+        if call is None or call.spare is None or tool_call["function"]["name"] != "create_spreadsheet":
+            return None
+        try:
+            json.loads(tool_call["function"]["arguments"] or "{}")
+        except json.JSONDecodeError:
+            return None
+        spare, call.spare = call.spare, None
+        return SpareReservation(spare)
+
+    def discard(self) -> None:
+        """Deshace en segundo plano las reservas que nadie tomó (se puede llamar varias veces)"""
+        for call in self._calls.values():
+            if call.spare is not None:
+                release_when_ready(call.spare)
+                call.spare = None
+        self._calls.clear()
+
+    def _prepare(self, name: str, call: _PendingCall, key: str) -> None:
+        values = call.parser.values
+        if name == "create_spreadsheet" and key == "title" and call.spare is None:
+            logger.debug("Reservando hoja en blanco por adelantado")
+            call.spare = asyncio.ensure_future(reserve_spare())
+        elif name in METADATA_TOOLS and key in ("spreadsheet_id", "sheet_name") and values.get("spreadsheet_id"):
+            target = (values["spreadsheet_id"], values.get("sheet_name"))
+            if target not in call.prefetched:
+                call.prefetched.add(target)
+                client = get_async_sheets_client()
+                client.run_in_background(client.client.prefetch_metadata, *target)
+
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from typing import Any, List, Optional
+
+from src.core.config import settings
+from src.utils.async_sheets_client import get_async_sheets_client
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TrackerSnapshot:
+    data: List[dict]
+    etag: str
+    modified_at: float                     # epoch del último cambio de contenido
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.modified_at, usegmt=True)
+
+    @property
+    def version(self) -> str:
+        return self.etag
+
+
+class IntegrationTrackerCache:
+    """
+    Cache compartida del Integration Tracker.
+
+    - Durante ``ttl`` segundos se sirve el snapshot sin tocar Google.
+    - Hasta ``stale_ttl`` segundos después se sirve el snapshot viejo y se
+      refresca en segundo plano (stale-while-revalidate).
+    - Todas las peticiones concurrentes comparten un único fetch en vuelo.
+    """
+
+    def __init__(self, spreadsheet_id: str, ttl: float = 300.0, stale_ttl: float = 3600.0):
+        self.spreadsheet_id = spreadsheet_id
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._snapshot: Optional[TrackerSnapshot] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def get(self) -> TrackerSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return await self.refresh()
+
+        age = time.monotonic() - snapshot.loaded_at
+        if age < self.ttl:
+            return snapshot
+        if age < self.ttl + self.stale_ttl:
+            self._start_refresh()
+            return snapshot
+
+        try:
+            return await self.refresh()
+        except Exception as e:
+            logger.warning(f"Error al refrescar el Integration Tracker: {str(e)}")
+            return snapshot
+
+    async def refresh(self) -> TrackerSnapshot:
+        """Fuerza un refresco, reutilizando el que ya esté en vuelo"""
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+            self._inflight.add_done_callback(_log_failure)
+        return self._inflight
+
+    async def _fetch(self) -> TrackerSnapshot:
+        data = await get_async_sheets_client().read_integration_tracker(self.spreadsheet_id)
+        if isinstance(data, dict) and "error" in data:
+            raise RuntimeError(data["error"])
+
+        etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        previous = self._snapshot
+        if previous is not None and previous.etag == etag:
+            modified_at = previous.modified_at
+        else:
+            modified_at = time.time()
+
+        self._snapshot = TrackerSnapshot(data=data, etag=f'"{etag}"', modified_at=modified_at)
+        return self._snapshot
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Error al leer el Integration Tracker: {str(task.exception())}")
+
+
+def format_tracker_context(data: Any) -> str:
+    """Convierte el tracker en el mensaje de sistema que recibe el modelo"""
+    system_message = "Información del proyecto de integración:\n\n"
+
+    for item in data:
+        if all(key in item for key in ["Integration Area", "Completion Status", "% Complete"]):
+            system_message += f"- {item['Integration Area']}: {item['Completion Status']} ({item['% Complete']}% completado)\n"
+
+    return system_message
+
+
+_tracker_cache: Optional[IntegrationTrackerCache] = None
+
+
+def get_tracker_cache() -> IntegrationTrackerCache:
+    global _tracker_cache
+    if _tracker_cache is None:
+        _tracker_cache = IntegrationTrackerCache(
+            settings.integration_tracker_id,
+            ttl=settings.tracker_cache_ttl,
+            stale_ttl=settings.tracker_stale_ttl,
+        )
+    return _tracker_cache
@@ -0,0 +1,360 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlmodel import Session, select, func
+
+from src.core.config import settings
+from src.models.upload import UploadedFile
+
+_WRITE_CHUNK = 1024 * 1024
+_UNSAFE_CHARS = re.compile(r"[^\w.\- ()\[\]]+", re.UNICODE)
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """Error de subida con el status HTTP que debe devolverse"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def safe_filename(name: Optional[str]) -> str:
+    """Nombre para mostrar: sin rutas, caracteres de control ni separadores"""
+    name = os.path.basename((name or "").replace("\\", "/"))
+    name = _UNSAFE_CHARS.sub("_", name).strip(" .")
+    return name[:255] or "file"
+
+
+class UploadStore:
+    """
+    Almacén de ficheros subidos direccionado por contenido.
+
+    Cada fichero se guarda una sola vez en ``blobs/<sha[:2]>/<sha256>``,
+    aunque se suba a varias conversaciones; la tabla ``UploadedFile`` enlaza
+    conversaciones, nombres y blobs. Los datos se escriben por bloques en un
+    thread (sin bloquear el event loop) a un fichero temporal mientras se
+    calcula el hash, y se publican con un rename atómico.
+
+    Las subidas grandes pueden hacerse por partes (``create_session`` /
+    ``write_part`` / ``complete``); las partes quedan en disco, así que una
+    subida interrumpida se reanuda enviando solo las que faltan. Las partes
+    cuentan para la cuota de la conversación mientras la subida está
+    abierta, y las subidas sin actividad en ``session_ttl`` se borran.
+
+    Un blob que ya no enlaza ninguna conversación (su nombre se subió con
+    otro contenido) se borra.
+    """
+
+    def __init__(self, root: str, max_file_bytes: int, max_conversation_bytes: int,
+                 session_ttl: float = 86400.0):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.tmp_dir = self.root / ".tmp"
+        self.session_dir = self.root / ".partial"
+        for directory in (self.blob_dir, self.tmp_dir, self.session_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        self.max_file_bytes = max_file_bytes
+        self.max_conversation_bytes = max_conversation_bytes
+        self.session_ttl = session_ttl
+        self._last_sweep = 0.0
+
+    @property
+    def engine(self):
+        from src.db import engine
+        return engine
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blob_dir / sha256[:2] / sha256
+
+    # --- Cuotas -------------------------------------------------------
+
+    def conversation_usage(self, conversation_id: str, session: Optional[Session] = None,
+                           exclude_filename: Optional[str] = None) -> int:
+        if session is None:
+            with Session(self.engine) as session:
+                return self.conversation_usage(conversation_id, session, exclude_filename)
+        query = (select(func.coalesce(func.sum(UploadedFile.size), 0))
+                 .where(UploadedFile.conversation_id == conversation_id))
+        if exclude_filename is not None:
+            query = query.where(UploadedFile.filename != exclude_filename)
+        return session.exec(query).one()
+
+    def _check_quota(self, conversation_id: str, size: int, session: Optional[Session] = None,
+                     exclude_filename: Optional[str] = None) -> None:
+        if size > self.max_file_bytes:
+            raise UploadError(f"File exceeds the {self.max_file_bytes} byte limit", 413)
+        usage = self.conversation_usage(conversation_id, session, exclude_filename)
+        if usage + size > self.max_conversation_bytes:
+            raise UploadError(
+                f"Conversation exceeds the {self.max_conversation_bytes} byte upload quota", 413
+            )
+
+    @staticmethod
+    def _lock_for_write(session: Session) -> None:
+        """
+        Toma el lock de escritura de SQLite antes de leer: la comprobación de
+        cuota y el insert quedan en la misma transacción y dos subidas
+        concurrentes no pueden pasar ambas la cuota.
+        """
+        if session.get_bind().dialect.name == "sqlite":
+            session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+
+    # --- Subida en un paso --------------------------------------------
+
+    async def save(self, conversation_id: str, filename: str, chunks: AsyncIterator[bytes]) -> UploadedFile:
+        """Guarda un fichero recibido como stream de bloques y lo enlaza a la conversación"""
+        filename = safe_filename(filename)
+        usage = await asyncio.to_thread(self.conversation_usage, conversation_id, None, filename)
+        available = self.max_conversation_bytes - usage
+        limit = min(self.max_file_bytes, max(0, available))
+
+        temp = self.tmp_dir / uuid.uuid4().hex
+        try:
+            sha256, size = await self._write_stream(temp, chunks, limit)
+            return await asyncio.to_thread(self._publish, conversation_id, filename, temp, sha256, size)
+        finally:
+            temp.unlink(missing_ok=True)
+
+    async def _write_stream(self, path: Path, chunks: AsyncIterator[bytes], limit: int,
+                            mode: str = "wb") -> Tuple[str, int]:
+        digest = hashlib.sha256()
+        size = 0
+        out = await asyncio.to_thread(open, path, mode)
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > limit:
+                    raise UploadError(f"Upload exceeds the {limit} byte limit", 413)
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+        finally:
+            await asyncio.to_thread(out.close)
+        return digest.hexdigest(), size
+
+    def _publish(self, conversation_id: str, filename: str, temp: Path, sha256: str, size: int) -> UploadedFile:
+        with Session(self.engine) as session:
+            self._lock_for_write(session)
+            existing = session.exec(
+                select(UploadedFile)
+                .where(UploadedFile.conversation_id == conversation_id)
+                .where(UploadedFile.filename == filename)
+            ).first()
+            if existing is not None and existing.sha256 == sha256:
+                return existing
+            # El fichero con el mismo nombre se sustituye: no cuenta para la cuota
+            self._check_quota(conversation_id, size, session, exclude_filename=filename)
+
+            blob = self.blob_path(sha256)
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp, blob)
+            unreferenced = None
+            if existing is not None:
+                # Mismo nombre con otro contenido: la nueva versión sustituye a la anterior
+                session.delete(existing)
+                unreferenced = self._unreference(session, existing.sha256)
+            record = UploadedFile(conversation_id=conversation_id, filename=filename,
+                                  sha256=sha256, size=size)
+            session.add(record)
+            try:
+                session.commit()
+            except BaseException:
+                if unreferenced is not None:
+                    os.replace(unreferenced, self.blob_path(existing.sha256))
+                raise
+            if unreferenced is not None:
+                unreferenced.unlink(missing_ok=True)
+            session.refresh(record)
+            return record
+
+    def _unreference(self, session: Session, sha256: str) -> Optional[Path]:
+        """
+        Si ya ningún fichero usa el blob lo aparta (aún con el lock, para que
+        nadie lo enlace entre medias) y devuelve dónde quedó; se borra tras
+        el commit o se restaura si el commit falla
+        """
+        references = session.exec(
+            select(func.count()).select_from(UploadedFile).where(UploadedFile.sha256 == sha256)
+        ).one()
+        blob = self.blob_path(sha256)
+        if references or not blob.exists():
+            return None
+        trash = self.tmp_dir / f"{sha256}.{uuid.uuid4().hex}.unreferenced"
+        os.replace(blob, trash)
+        return trash
+
+    # --- Subida por partes --------------------------------------------
+
+    def _session_path(self, upload_id: str) -> Path:
+        if not _UPLOAD_ID.match(upload_id):
+            raise UploadError("Unknown upload", 404)
+        return self.session_dir / upload_id
+
+    def _load_session(self, upload_id: str) -> dict:
+        path = self._session_path(upload_id) / "session.json"
+        if not path.exists():
+            raise UploadError("Unknown upload", 404)
+        return json.loads(path.read_text())
+
+    def create_session(self, conversation_id: str, filename: str, size: Optional[int] = None) -> dict:
+        self.sweep_sessions()
+        if size is not None:
+            self._check_quota(conversation_id, size, exclude_filename=safe_filename(filename))
+        upload_id = uuid.uuid4().hex
+        path = self.session_dir / upload_id
+        path.mkdir()
+        info = {"upload_id": upload_id, "conversation_id": conversation_id,
+                "filename": safe_filename(filename), "size": size}
+        (path / "session.json").write_text(json.dumps(info))
+        return info
+
+    def _parts(self, upload_id: str) -> List[Tuple[int, Path]]:
+        parts = []
+        for part in self._session_path(upload_id).glob("part-*"):
+            if part.suffix != ".tmp":
+                parts.append((int(part.name[5:]), part))
+        return sorted(parts)
+
+    def _open_session_bytes(self, conversation_id: str, skip: Path) -> int:
+        """Bytes en disco de las subidas por partes abiertas de la conversación (salvo ``skip``)"""
+        total = 0
+        for directory in self.session_dir.iterdir():
+            try:
+                info = json.loads((directory / "session.json").read_text())
+                if info.get("conversation_id") != conversation_id:
+                    continue
+                total += sum(p.stat().st_size for p in directory.glob("part-*") if p != skip)
+            except (OSError, ValueError):
+                # Sesión a medio crear o recién borrada
+                continue
+        return total
+
+    def sweep_sessions(self, force: bool = False) -> int:
+        """Borra las subidas por partes sin actividad en ``session_ttl``; devuelve cuántas"""
+        now = time.time()
+        if not force and now - self._last_sweep < 600:
+            return 0
+        self._last_sweep = now
+        removed = 0
+        for directory in self.session_dir.iterdir():
+            try:
+                # La última parte escrita marca la actividad
+                last = max(p.stat().st_mtime for p in [directory, *directory.iterdir()])
+            except OSError:
+                continue
+            if now - last > self.session_ttl:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def status(self, upload_id: str) -> dict:
+        info = self._load_session(upload_id)
+        parts = self._parts(upload_id)
+        info["parts"] = [number for number, _ in parts]
+        info["received"] = sum(part.stat().st_size for _, part in parts)
+        return info
+
+    async def write_part(self, upload_id: str, part_number: int, chunks: AsyncIterator[bytes]) -> dict:
+        """Guarda una parte; reenviar una parte la reemplaza (subidas reanudables)"""
+        if part_number < 1 or part_number > 10000:
+            raise UploadError("Part number must be between 1 and 10000")
+        info = await asyncio.to_thread(self._load_session, upload_id)
+        directory = self._session_path(upload_id)
+        received = sum(
+            p.stat().st_size for n, p in await asyncio.to_thread(self._parts, upload_id) if n != part_number
+        )
+
+        final = directory / f"part-{part_number:05d}"
+        temp = directory / f"part-{part_number:05d}.tmp"
+        # Las partes de todas las subidas abiertas cuentan para la cuota
+        usage = await asyncio.to_thread(
+            self.conversation_usage, info["conversation_id"], None, info["filename"]
+        )
+        pending = await asyncio.to_thread(self._open_session_bytes, info["conversation_id"], final)
+        limit = min(self.max_file_bytes - received, self.max_conversation_bytes - usage - pending)
+        try:
+            _, size = await self._write_stream(temp, chunks, max(0, limit))
+            os.replace(temp, final)
+        finally:
+            temp.unlink(missing_ok=True)
+        return {"upload_id": info["upload_id"], "part": part_number, "size": size}
+
+    async def complete(self, upload_id: str) -> UploadedFile:
+        """Une las partes en orden, calcula el hash y publica el fichero"""
+        info = await asyncio.to_thread(self._load_session, upload_id)
+        parts = await asyncio.to_thread(self._parts, upload_id)
+        numbers = [number for number, _ in parts]
+        if not parts or numbers != list(range(1, len(parts) + 1)):
+            raise UploadError(f"Missing parts; received {numbers}", 409)
+
+        total = sum(part.stat().st_size for _, part in parts)
+        if info["size"] is not None and total != info["size"]:
+            raise UploadError(f"Expected {info['size']} bytes, received {total}", 409)
+        await asyncio.to_thread(self._check_quota, info["conversation_id"], total, None, info["filename"])
+
+        async def read_parts():
+            for _, part in parts:
+                with open(part, "rb") as f:
+                    while True:
+                        block = await asyncio.to_thread(f.read, _WRITE_CHUNK)
+                        if not block:
+                            break
+                        yield block
+
+        temp = self.tmp_dir / upload_id
+        try:
+            sha256, size = await self._write_stream(temp, read_parts(), self.max_file_bytes)
+            record = await asyncio.to_thread(
+                self._publish, info["conversation_id"], info["filename"], temp, sha256, size
+            )
+        finally:
+            temp.unlink(missing_ok=True)
+        await asyncio.to_thread(shutil.rmtree, self._session_path(upload_id), True)
+        return record
+
+    def abort(self, upload_id: str) -> None:
+        self._load_session(upload_id)
+        shutil.rmtree(self._session_path(upload_id), ignore_errors=True)
+
+    # --- Consulta -----------------------------------------------------
+
+    def files(self, conversation_id: str) -> List[Tuple[str, str, Optional[str]]]:
+        """Ficheros de una conversación como tuplas ``(nombre, ruta, sha256)``"""
+        with Session(self.engine) as session:
+            records = session.exec(
+                select(UploadedFile)
+                .where(UploadedFile.conversation_id == conversation_id)
+                .order_by(UploadedFile.created_at)
+            ).all()
+        files = [(r.filename, str(self.blob_path(r.sha256)), r.sha256) for r in records]
+
+        # Subidas anteriores al almacén por contenido: uploads/<conversation_id>/<nombre>
+        legacy = self.root / safe_filename(conversation_id)
+        if legacy.is_dir():
+            files.extend((p.name, str(p), None) for p in sorted(legacy.iterdir())
+                         if p.is_file() and not p.name.startswith("."))
+        return files
+
+
+_store: Optional[UploadStore] = None
+
+
+def get_upload_store() -> UploadStore:
+    global _store
+    if _store is None:
+        _store = UploadStore(
+            settings.upload_dir,
+            max_file_bytes=settings.upload_max_file_bytes,
+            max_conversation_bytes=settings.upload_max_conversation_bytes,
+            session_ttl=settings.upload_session_ttl,
+        )
+    return _store
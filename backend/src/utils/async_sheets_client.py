@@ -0,0 +1,110 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from src.core.config import settings
+from src.utils.google_sheets_client import GoogleSheetsClient, get_sheets_client
+
+logger = logging.getLogger(__name__)
+
+
+class SheetsTimeoutError(TimeoutError):
+    """Una llamada a Google Sheets superó su timeout"""
+
+
+class AsyncGoogleSheetsClient:
+    """
+    Fachada asíncrona sobre ``GoogleSheetsClient``.
+
+    Las llamadas bloqueantes de ``googleapiclient`` se ejecutan en un pool de
+    hilos propio y de tamaño limitado, para que una llamada lenta a Sheets no
+    congele el event loop ni agote el threadpool por defecto de FastAPI.
+
+    Si una llamada supera su timeout, o la tarea que la espera se cancela, se
+    cancela también el trabajo pendiente en el pool. Una petición HTTP que ya
+    está en curso no se puede interrumpir: termina en su hilo y su resultado
+    se descarta.
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(AsyncGoogleSheetsClient, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, client: Optional[GoogleSheetsClient] = None,
+                 max_workers: int = 8, timeout: float = 30.0):
+        if getattr(self, "_executor", None) is not None:
+            return
+        self._client = client
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+        self._background = set()
+
+    @property
+    def client(self) -> GoogleSheetsClient:
+        # Inicialización perezosa: las credenciales se cargan en el primer uso
+        if self._client is None:
+            self._client = get_sheets_client()
+        return self._client
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Ejecuta ``fn(*args, **kwargs)`` en el pool de Sheets con timeout"""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timeout en llamada a Google Sheets",
+                           extra={"function": getattr(fn, '__name__', str(fn)), "timeout": timeout})
+            raise SheetsTimeoutError(f"Google Sheets call {getattr(fn, '__name__', fn)} timed out after {timeout}s")
+
+    def run_in_background(self, fn: Callable[..., Any], *args, **kwargs) -> asyncio.Task:
+        """Lanza ``fn`` en el pool sin esperarla; los errores solo se registran"""
+        task = asyncio.ensure_future(self.run(fn, *args, **kwargs))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Error en llamada a Google Sheets en segundo plano: {str(task.exception())}")
+
+    async def create_sheet(self, title, headers, **kwargs):
+        return await self.run(self.client.create_sheet, title, headers, **kwargs)
+
+    async def read_integration_tracker(self, spreadsheet_id, **kwargs):
+        return await self.run(self.client.read_integration_tracker, spreadsheet_id, **kwargs)
+
+    async def add_row(self, spreadsheet_id, sheet_name, values, **kwargs):
+        return await self.run(self.client.add_row, spreadsheet_id, sheet_name, values, **kwargs)
+
+    async def update_row(self, spreadsheet_id, sheet_name, row_index, values, **kwargs):
+        return await self.run(self.client.update_row, spreadsheet_id, sheet_name, row_index, values, **kwargs)
+
+    async def add_column(self, spreadsheet_id, sheet_name, column_name, **kwargs):
+        return await self.run(self.client.add_column, spreadsheet_id, sheet_name, column_name, **kwargs)
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        AsyncGoogleSheetsClient._instance = None
+
+
+# Singleton instance getter
+def get_async_sheets_client() -> AsyncGoogleSheetsClient:
+    return AsyncGoogleSheetsClient(
+        max_workers=settings.sheets_max_workers,
+        timeout=settings.sheets_call_timeout,
+    )
+
+
+def shutdown_async_sheets_client() -> None:
+    """Cierra el pool de Sheets si llegó a crearse (apagado de la app)"""
+    if AsyncGoogleSheetsClient._instance is not None:
+        AsyncGoogleSheetsClient._instance.shutdown(wait=False)
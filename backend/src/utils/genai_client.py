@@ -1,16 +1,15 @@
 import os
-from dotenv import load_dotenv
-from google import genai
-
-load_dotenv()
+from src.core.config import settings
 
 class GenAIClient:
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
+            from google import genai
+
             cls._instance = super(GenAIClient, cls).__new__(cls)
-            cls._instance.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+            cls._instance.client = genai.Client(api_key=settings.gemini_api_key or os.getenv("GEMINI_API_KEY"))
         return cls._instance
 
     def generate_content(self, prompt, model="gemini-2.0-flash"):
@@ -29,6 +28,22 @@ class GenAIClient:
         )
         return response
 
+    async def stream_content(self, contents, model="gemini-2.0-flash", config=None):
+        """
+        Stream content asynchronously (``client.aio``)
+
+        Args:
+            contents: Prompt text or list of Gemini content dicts
+            model (str): The model to use, defaults to gemini-2.0-flash
+            config: Optional GenerateContentConfig or dict (system instruction, tools...)
+
+        Returns:
+            An async iterator of response chunks
+        """
+        return await self.client.aio.models.generate_content_stream(
+            model=model, contents=contents, config=config
+        )
+
 def get_genai_client():
     return GenAIClient()
 
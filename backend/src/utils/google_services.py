@@ -0,0 +1,175 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCOPES = (
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive',
+)
+
+
+class GoogleServiceRegistry:
+    """
+    Credenciales y servicios de Google construidos una vez por proceso.
+
+    - Las credenciales de la cuenta de servicio se leen una vez por conjunto
+      de scopes; ``google-auth`` renueva el token solo cuando caduca.
+    - El documento de discovery se toma de ``discovery_cache_dir`` si existe,
+      si no del que trae ``googleapiclient`` (sin red) y como último recurso
+      se descarga y se guarda en ese directorio.
+    - Cada servicio se construye la primera vez que se pide. ``httplib2`` no
+      es thread-safe, así que las peticiones usan un ``Http`` por hilo.
+
+    Todo ello protegido con un lock: el pool de Sheets pide servicios desde
+    varios hilos a la vez.
+    """
+
+    def __init__(self, credentials_path: Optional[str] = None, credentials_json: Optional[str] = None,
+                 discovery_cache_dir: Optional[str] = None):
+        self.credentials_path = credentials_path
+        self.credentials_json = credentials_json
+        self.discovery_cache_dir = Path(discovery_cache_dir) if discovery_cache_dir else None
+        self._lock = threading.RLock()
+        self._credentials: Dict[Tuple[str, ...], Any] = {}
+        self._documents: Dict[Tuple[str, str], str] = {}
+        self._services: Dict[Tuple[str, str, Tuple[str, ...]], Any] = {}
+        self._local = threading.local()
+
+    def credentials(self, scopes: Sequence[str] = DEFAULT_SCOPES):
+        key = tuple(sorted(scopes))
+        with self._lock:
+            credentials = self._credentials.get(key)
+            if credentials is None:
+                credentials = self._credentials[key] = self._load_credentials(key)
+            return credentials
+
+    def loaded_credentials(self, scopes: Sequence[str] = DEFAULT_SCOPES):
+        """Las credenciales del registro si ya se cargaron; no las carga (None si no)"""
+        with self._lock:
+            return self._credentials.get(tuple(sorted(scopes)))
+
+    def service(self, api: str, version: str, scopes: Sequence[str] = DEFAULT_SCOPES):
+        key = (api, version, tuple(sorted(scopes)))
+        with self._lock:
+            service = self._services.get(key)
+            if service is None:
+                service = self._services[key] = self.build(api, version, self.credentials(scopes))
+            return service
+
+    def build(self, api: str, version: str, credentials):
+        """Construye un servicio nuevo reutilizando el documento de discovery en cache"""
+        from googleapiclient.discovery import build_from_document
+        from googleapiclient.http import HttpRequest
+
+        local = self._local
+
+        def request_builder(http, *args, **kwargs):
+            # Un AuthorizedHttp por hilo y credenciales: conexiones reutilizadas sin compartir httplib2
+            return HttpRequest(self._thread_http(local, credentials), *args, **kwargs)
+
+        logger.info("Inicializando cliente de Google", extra={"api": api, "version": version})
+        return build_from_document(
+            self.discovery_document(api, version),
+            http=self._thread_http(local, credentials),
+            requestBuilder=request_builder,
+        )
+
+    def discovery_document(self, api: str, version: str) -> str:
+        key = (api, version)
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                document = self._documents[key] = self._load_document(api, version)
+            return document
+
+    def reset(self) -> None:
+        with self._lock:
+            self._credentials.clear()
+            self._services.clear()
+
+    # --- Carga ------------------------------------------------------------
+
+    def _load_credentials(self, scopes: Tuple[str, ...]):
+        from google.oauth2 import service_account
+
+        if self.credentials_json:
+            logger.info("Usando credenciales de GOOGLE_CREDENTIALS_JSON")
+            return service_account.Credentials.from_service_account_info(
+                json.loads(self.credentials_json), scopes=scopes
+            )
+        if self.credentials_path and Path(self.credentials_path).exists():
+            logger.info("Usando archivo de credenciales", extra={"path": self.credentials_path})
+            return service_account.Credentials.from_service_account_file(self.credentials_path, scopes=scopes)
+        raise RuntimeError(
+            "No Google credentials found. "
+            "Set GOOGLE_CREDENTIALS_PATH or GOOGLE_CREDENTIALS_JSON"
+        )
+
+    def _load_document(self, api: str, version: str) -> str:
+        cached = self.discovery_cache_dir / f"{api}.{version}.json" if self.discovery_cache_dir else None
+        if cached is not None and cached.exists():
+            return cached.read_text(encoding="utf-8")
+
+        from googleapiclient import discovery_cache
+
+        document = discovery_cache.get_static_doc(api, version)
+        if document is None:
+            document = self._fetch_document(api, version)
+            if cached is not None:
+                try:
+                    cached.parent.mkdir(parents=True, exist_ok=True)
+                    cached.write_text(document, encoding="utf-8")
+                except OSError as e:
+                    logger.warning(f"No se pudo guardar el documento de discovery: {str(e)}")
+        return document
+
+    @staticmethod
+    def _fetch_document(api: str, version: str) -> str:
+        import httplib2
+        from googleapiclient.discovery import V2_DISCOVERY_URI
+
+        logger.info("Descargando documento de discovery", extra={"api": api, "version": version})
+        response, content = httplib2.Http(timeout=settings.sheets_call_timeout).request(
+            V2_DISCOVERY_URI.format(api=api, apiVersion=version)
+        )
+        if response.status >= 400:
+            raise RuntimeError(f"Discovery document for {api} {version} not found ({response.status})")
+        return content.decode("utf-8")
+
+    @staticmethod
+    def _thread_http(local: threading.local, credentials):
+        import google_auth_httplib2
+        import httplib2
+
+        pool = getattr(local, "http", None)
+        if pool is None:
+            pool = local.http = {}
+        http = pool.get(id(credentials))
+        if http is None:
+            http = pool[id(credentials)] = google_auth_httplib2.AuthorizedHttp(
+                credentials, http=httplib2.Http(timeout=settings.sheets_call_timeout)
+            )
+        return http
+
+
+_registry: Optional[GoogleServiceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_google_services() -> GoogleServiceRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = GoogleServiceRegistry(
+                    credentials_path=settings.google_credentials_path,
+                    credentials_json=settings.google_credentials_json,
+                    discovery_cache_dir=settings.google_discovery_cache_dir,
+                )
+    return _registry
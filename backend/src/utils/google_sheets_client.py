@@ -1,97 +1,209 @@
 import os
+import re
 import json
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from dotenv import load_dotenv
-from pathlib import Path
-load_dotenv()
+import time
+import functools
+import logging
+import threading
+from src.core.metrics import SHEETS_CALL_ERRORS, SHEETS_CALL_SECONDS, span
+from src.utils.google_services import get_google_services
+from src.utils.sheet_metadata_cache import SheetMetadataCache, SheetInfo
+
+logger = logging.getLogger(__name__)
+
+SHEET_TAB = 'Vendor Inventory'
+SPARE_TITLE = 'Palladium (spare)'
+
+def _failed(result):
+    """Los métodos informan de algunos errores en el resultado en lugar de lanzarlos"""
+    if isinstance(result, dict):
+        return 'error' in result or result.get('success') is False
+    if isinstance(result, list):
+        return any(isinstance(item, Exception) for item in result)
+    return False
+
+def _instrumented(fn):
+    """Latencia y errores por método (métricas de /metrics y span opcional)"""
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            with span(f"sheets.{fn.__name__}"):
+                result = fn(self, *args, **kwargs)
+            failed = _failed(result)
+            return result
+        finally:
+            SHEETS_CALL_SECONDS.labels(function=fn.__name__).observe(time.perf_counter() - start)
+            if failed:
+                SHEETS_CALL_ERRORS.labels(function=fn.__name__).inc()
+    return wrapper
 
 class GoogleSheetsClient:
     _instance = None
-    
+    _lock = threading.Lock()
+
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(GoogleSheetsClient, cls).__new__(cls)
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(GoogleSheetsClient, cls).__new__(cls)
         return cls._instance
 
     def __init__(self):
-        # Inicializar solo si no se ha hecho antes
-        if not hasattr(self, 'initialized') or not self.initialized:
-            self._initialize_clients()
-            self.initialized = True
-    SCOPES = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive',
-        ]
+        # Inicializar solo si no se ha hecho antes (varios hilos pueden llegar a la vez)
+        if getattr(self, 'initialized', False):
+            return
+        with self._lock:
+            if not getattr(self, 'initialized', False):
+                self._initialize_clients()
+                self._metadata = SheetMetadataCache(self.sheets)
+                self.initialized = True
+
     def _initialize_clients(self):
-        """Inicializa los clientes de Google API"""
+        """Toma los servicios de Sheets y Drive del registro compartido (se construyen una vez)"""
         try:
-            # Cargar credenciales desde archivo JSON o variables de entorno
-            credentials_path = './src/credentials.json'
-            print(f"Verificando ruta de credenciales: {credentials_path}")
-
-            if credentials_path and Path(credentials_path).exists():
-                print(f"Usando archivo de credenciales: {credentials_path}")
-                credentials = service_account.Credentials.from_service_account_file(
-                    credentials_path,
-                    scopes=self.SCOPES,
-                )
-            else:
-                raise RuntimeError(
-                    "No Google credentials found. "
-                    "Set GOOGLE_CREDENTIALS_PATH or GOOGLE_CREDENTIALS_JSON"
-                )
-
-            self.sheets = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
-            self.drive = build('drive', 'v3', credentials=credentials, cache_discovery=False)
-
-            print("Inicializando cliente de Google Sheets...")
-            self.sheets = build('sheets', 'v4', credentials=credentials)
-            print("Inicializando cliente de Google Drive...")
-            self.drive = build('drive', 'v3', credentials=credentials)
-            print("Inicialización completada con éxito")
+            services = get_google_services()
+            self.sheets = services.service('sheets', 'v4')
+            self.drive = services.service('drive', 'v3')
+            logger.info("Inicialización completada con éxito")
         except Exception as e:
-            import traceback
-            print(f"Error al inicializar GoogleSheetsClient: {str(e)}")
-            traceback.print_exc()
+            logger.exception(f"Error al inicializar GoogleSheetsClient: {str(e)}")
             self.initialized = False
             raise
     
-    def create_sheet(self, title, headers):
-        """Create a new Google Sheet with specified headers"""
-        # Create a new spreadsheet
-        spreadsheet = self.sheets.spreadsheets().create(body={
-            'properties': {'title': title},
-            'sheets': [{'properties': {'title': 'Vendor Inventory'}}]
-        }).execute()
-        
-        spreadsheet_id = spreadsheet['spreadsheetId']
-        
-        # Add headers
-        self.sheets.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range='Vendor Inventory!A1',
-            valueInputOption='RAW',
-            body={'values': [headers]}
+    @staticmethod
+    def _header_cells(headers):
+        return [{'values': [{'userEnteredValue': {'stringValue': str(h)}} for h in headers]}]
+
+    def _prime_created(self, spreadsheet_id, sheet_id, row_count, column_count, headers):
+        self._metadata.prime(spreadsheet_id, [
+            SheetInfo(sheet_id=sheet_id, title=SHEET_TAB, row_count=row_count,
+                      column_count=column_count, headers=list(headers))
+        ])
+
+    @staticmethod
+    def _sheet_url(spreadsheet_id):
+        return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
+
+    @_instrumented
+    def create_sheet(self, title, headers, share=True):
+        """
+        Create a new Google Sheet with specified headers
+
+        The headers go in the create body, so the spreadsheet is ready after a
+        single call. It is shared by link before returning unless ``share=False``.
+        """
+        spreadsheet = self.sheets.spreadsheets().create(
+            body={
+                'properties': {'title': title},
+                'sheets': [{
+                    'properties': {
+                        'title': SHEET_TAB,
+                        'gridProperties': {'rowCount': 1000, 'columnCount': max(26, len(headers))},
+                    },
+                    'data': [{'startRow': 0, 'startColumn': 0, 'rowData': self._header_cells(headers)}],
+                }],
+            },
+            fields='spreadsheetId,sheets.properties(sheetId,title,gridProperties(rowCount,columnCount))'
         ).execute()
-        
-        # Skip formatting for now
-        
-        # Make the spreadsheet accessible via link
+
+        spreadsheet_id = spreadsheet['spreadsheetId']
+        properties = spreadsheet['sheets'][0]['properties']
+        grid = properties.get('gridProperties', {})
+        self._prime_created(spreadsheet_id, properties['sheetId'], grid.get('rowCount', 0),
+                            grid.get('columnCount', 0), headers)
+
+        if share:
+            self._share_or_delete(spreadsheet_id)
+
+        return {
+            'spreadsheet_id': spreadsheet_id,
+            'url': self._sheet_url(spreadsheet_id)
+        }
+
+    @_instrumented
+    def share_with_link(self, spreadsheet_id):
+        """Make the spreadsheet accessible via link"""
+        self._share_with_link(spreadsheet_id)
+
+    # Los métodos instrumentados llaman a estas versiones internas, para que
+    # una operación lógica cuente una sola vez en las métricas
+
+    def _share_with_link(self, spreadsheet_id):
         self.drive.permissions().create(
             fileId=spreadsheet_id,
             body={'type': 'anyone', 'role': 'reader'},
             fields='id'
         ).execute()
-        
-        # Get share link
-        sheet_url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
-        
+
+    def _share_or_delete(self, spreadsheet_id):
+        """Una hoja recién creada que no se pudo compartir se borra: nadie tiene su enlace"""
+        try:
+            self._share_with_link(spreadsheet_id)
+        except Exception:
+            try:
+                self.drive.files().delete(fileId=spreadsheet_id).execute()
+                self._metadata.invalidate(spreadsheet_id)
+            except Exception as e:
+                logger.warning(f"No se pudo borrar una hoja sin compartir: {str(e)}",
+                               extra={"spreadsheet_id": spreadsheet_id})
+            raise
+
+    @_instrumented
+    def create_spare(self, title=SPARE_TITLE, share=True):
+        """Hoja en blanco (compartida salvo ``share=False``) para ``SpreadsheetPool``"""
+        spreadsheet = self.sheets.spreadsheets().create(
+            body={'properties': {'title': title}, 'sheets': [{'properties': {'title': SHEET_TAB}}]},
+            fields='spreadsheetId,sheets.properties(sheetId,gridProperties(rowCount,columnCount))'
+        ).execute()
+        spreadsheet_id = spreadsheet['spreadsheetId']
+        if share:
+            self._share_or_delete(spreadsheet_id)
+
+        properties = spreadsheet['sheets'][0]['properties']
+        grid = properties.get('gridProperties', {})
+        return {
+            'spreadsheet_id': spreadsheet_id,
+            'sheet_id': properties['sheetId'],
+            'row_count': grid.get('rowCount', 0),
+            'column_count': grid.get('columnCount', 0),
+        }
+
+    @_instrumented
+    def delete_spreadsheet(self, spreadsheet_id):
+        """Borra una hoja en blanco que no se llegó a usar"""
+        self.drive.files().delete(fileId=spreadsheet_id).execute()
+        self._metadata.invalidate(spreadsheet_id)
+
+    @_instrumented
+    def adopt_spare(self, spreadsheet_id, sheet_id, title, headers, row_count, column_count):
+        """Renombra una hoja del pool y escribe las cabeceras en una sola petición"""
+        requests = [{
+            'updateSpreadsheetProperties': {'properties': {'title': title}, 'fields': 'title'}
+        }]
+        if len(headers) > column_count:
+            requests.append({'appendDimension': {
+                'sheetId': sheet_id, 'dimension': 'COLUMNS', 'length': len(headers) - column_count
+            }})
+            column_count = len(headers)
+        requests.append({'updateCells': {
+            'start': {'sheetId': sheet_id, 'rowIndex': 0, 'columnIndex': 0},
+            'rows': self._header_cells(headers),
+            'fields': 'userEnteredValue',
+        }})
+        self.sheets.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'requests': requests}
+        ).execute()
+
+        self._prime_created(spreadsheet_id, sheet_id, row_count, column_count, headers)
         return {
             'spreadsheet_id': spreadsheet_id,
-            'url': sheet_url
+            'url': self._sheet_url(spreadsheet_id)
         }
 
+    @_instrumented
     def read_integration_tracker(self, spreadsheet_id="1Vil2a5Z2vAjP3OawRkGfZ3O8JQA4oFsXvzdzu_B0g9U"):
         """Leer los datos del Integration Tracker"""
         try:
@@ -120,34 +232,37 @@ class GoogleSheetsClient:
             return structured_data
 
         except Exception as e:
-            print(f"Error al leer la hoja: {str(e)}")
+            logger.error(f"Error al leer la hoja: {str(e)}", extra={"spreadsheet_id": spreadsheet_id})
             return {"error": str(e)}
 
+    @_instrumented
     def add_row(self, spreadsheet_id, sheet_name, values):
-        """Añade una fila a la hoja de cálculo"""
-        # Obtener el último índice de fila con datos
-        result = self.sheets.spreadsheets().values().get(
+        """Añade una fila al final de la tabla con values.append (una sola petición)"""
+        result = self.sheets.spreadsheets().values().append(
             spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A:Z"
-        ).execute()
-
-        values_range = result.get('values', [])
-        next_row = len(values_range) + 1
-
-        # Añadir nueva fila
-        self.sheets.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A{next_row}",
+            range=f"{sheet_name}!A1",
             valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
             body={'values': [values]}
         ).execute()
 
+        updated_range = result.get('updates', {}).get('updatedRange', '')
+        next_row = self._row_from_range(updated_range)
+        self._metadata.record_rows(spreadsheet_id, sheet_name, 1)
+
         return {
             'success': True,
             'message': f'Row added at position {next_row}',
             'row': next_row
         }
 
+    @staticmethod
+    def _row_from_range(a1_range):
+        """Extrae la última fila de un rango A1 como 'Hoja!A5:C5'"""
+        match = re.search(r'(\d+)$', a1_range.split('!')[-1])
+        return int(match.group(1)) if match else None
+
+    @_instrumented
     def update_row(self, spreadsheet_id, sheet_name, row_index, values):
         """Actualiza una fila existente"""
         self.sheets.spreadsheets().values().update(
@@ -157,41 +272,174 @@ class GoogleSheetsClient:
             body={'values': [values]}
         ).execute()
 
+        if row_index == 1:
+            self._metadata.forget_headers(spreadsheet_id, sheet_name)
+
         return {
             'success': True,
             'message': f'Row {row_index} updated'
         }
 
+    @_instrumented
     def add_column(self, spreadsheet_id, sheet_name, column_name):
-        """Añade una nueva columna"""
-        # Obtener información de la hoja
-        sheet_metadata = self.sheets.spreadsheets().get(
-            spreadsheetId=spreadsheet_id
-        ).execute()
+        """Añade una nueva columna a continuación de la última cabecera"""
+        result = self._batch_mutate(spreadsheet_id, [
+            {'op': 'add_column', 'sheet_name': sheet_name, 'column_name': column_name}
+        ])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
 
-        # Encontrar la siguiente columna libre
-        sheets = sheet_metadata.get('sheets', [])
-        for sheet in sheets:
-            if sheet['properties']['title'] == sheet_name:
-                # Añadir encabezado de la nueva columna
-                properties = sheet['properties']
-                num_columns = properties.get('gridProperties', {}).get('columnCount', 0)
-                column_letter = self._index_to_column(num_columns)
+    def prefetch_metadata(self, spreadsheet_id, sheet_name=None):
+        """Carga en cache los metadatos (y las cabeceras de ``sheet_name``) antes de necesitarlos"""
+        if sheet_name is None:
+            self._metadata.get(spreadsheet_id)
+        else:
+            self._metadata.headers(spreadsheet_id, sheet_name)
 
-                self.sheets.spreadsheets().values().update(
-                    spreadsheetId=spreadsheet_id,
-                    range=f"{sheet_name}!{column_letter}1",
-                    valueInputOption='RAW',
-                    body={'values': [[column_name]]}
-                ).execute()
+    def invalidate_metadata(self, spreadsheet_id):
+        """Olvida los metadatos en cache (p. ej. si otro worker cambió la hoja)"""
+        self._metadata.invalidate(spreadsheet_id)
+
+    @_instrumented
+    def batch_mutate(self, spreadsheet_id, mutations):
+        """
+        Aplica varias mutaciones sobre una hoja de cálculo con el mínimo de peticiones.
+
+        ``mutations`` es una lista de dicts con ``op`` ('add_row', 'update_row' o
+        'add_column') y sus argumentos. Las mutaciones consecutivas compatibles se
+        agrupan: las filas nuevas de una misma hoja en un único values.append, y
+        las actualizaciones y cabeceras de columna en un único values.batchUpdate
+        (precedido de un spreadsheets.batchUpdate que amplía la cuadrícula).
+        Devuelve un resultado por mutación, en el mismo orden; si una petición
+        falla, su excepción se devuelve para todas las mutaciones que agrupaba.
+        """
+        return self._batch_mutate(spreadsheet_id, mutations)
+
+    def _batch_mutate(self, spreadsheet_id, mutations):
+        results = [None] * len(mutations)
+
+        segments = []
+        for index, mutation in enumerate(mutations):
+            kind = 'append' if mutation['op'] == 'add_row' else 'write'
+            if not segments or segments[-1][0] != kind:
+                segments.append((kind, []))
+            segments[-1][1].append(index)
 
-                return {
+        for kind, indexes in segments:
+            try:
+                if kind == 'append':
+                    self._batch_append(spreadsheet_id, mutations, indexes, results)
+                else:
+                    self._batch_write(spreadsheet_id, mutations, indexes, results)
+            except Exception as e:
+                for index in indexes:
+                    results[index] = e
+
+        return results
+
+    def _batch_append(self, spreadsheet_id, mutations, indexes, results):
+        by_sheet = {}
+        for index in indexes:
+            by_sheet.setdefault(mutations[index]['sheet_name'], []).append(index)
+
+        for sheet_name, sheet_indexes in by_sheet.items():
+            result = self.sheets.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A1",
+                valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
+                body={'values': [mutations[i]['values'] for i in sheet_indexes]}
+            ).execute()
+
+            last_row = self._row_from_range(result.get('updates', {}).get('updatedRange', ''))
+            self._metadata.record_rows(spreadsheet_id, sheet_name, len(sheet_indexes))
+            first_row = last_row - len(sheet_indexes) + 1 if last_row is not None else None
+
+            for offset, index in enumerate(sheet_indexes):
+                row = first_row + offset if first_row is not None else None
+                results[index] = {
+                    'success': True,
+                    'message': f'Row added at position {row}',
+                    'row': row
+                }
+
+    def _batch_write(self, spreadsheet_id, mutations, indexes, results):
+        data = []
+        requests = []
+        new_columns = []
+        next_column = {}
+        column_count = {}
+
+        for index in indexes:
+            mutation = mutations[index]
+            sheet_name = mutation['sheet_name']
+
+            if mutation['op'] == 'update_row':
+                data.append({
+                    'range': f"{sheet_name}!A{mutation['row_index']}",
+                    'values': [mutation['values']]
+                })
+                results[index] = {
                     'success': True,
-                    'message': f'Column "{column_name}" added at position {column_letter}',
-                    'column': column_letter
+                    'message': f"Row {mutation['row_index']} updated"
                 }
+                continue
+
+            info = self._metadata.sheet(spreadsheet_id, sheet_name)
+            if info is None:
+                results[index] = {'success': False, 'message': f'Sheet "{sheet_name}" not found'}
+                continue
+
+            # La nueva columna va justo después de la última cabecera
+            if sheet_name not in next_column:
+                next_column[sheet_name] = len(self._metadata.headers(spreadsheet_id, sheet_name))
+                column_count[sheet_name] = info.column_count
+            position = next_column[sheet_name]
+            next_column[sheet_name] += 1
+
+            grew = position >= column_count[sheet_name]
+            if grew:
+                requests.append({'appendDimension': {
+                    'sheetId': info.sheet_id,
+                    'dimension': 'COLUMNS',
+                    'length': 1
+                }})
+                column_count[sheet_name] += 1
+
+            column_letter = self._index_to_column(position)
+            column_name = mutation['column_name']
+            data.append({'range': f"{sheet_name}!{column_letter}1", 'values': [[column_name]]})
+            new_columns.append((sheet_name, column_name, grew))
+            results[index] = {
+                'success': True,
+                'message': f'Column "{column_name}" added at position {column_letter}',
+                'column': column_letter
+            }
+
+        try:
+            if requests:
+                self.sheets.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'requests': requests}
+                ).execute()
+
+            if data:
+                self.sheets.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'valueInputOption': 'RAW', 'data': data}
+                ).execute()
+        except Exception:
+            # Los metadatos en cache pueden ser la causa del error
+            self._metadata.invalidate(spreadsheet_id)
+            raise
+
+        for index in indexes:
+            if mutations[index]['op'] == 'update_row' and mutations[index]['row_index'] == 1:
+                self._metadata.forget_headers(spreadsheet_id, mutations[index]['sheet_name'])
 
-        return {'success': False, 'message': f'Sheet "{sheet_name}" not found'}
+        for sheet_name, column_name, grew in new_columns:
+            self._metadata.record_column(spreadsheet_id, sheet_name, column_name, grew)
 
     def _index_to_column(self, index):
         """Convierte índice numérico a letra de columna (A, B, ..., Z, AA, AB, ...)"""
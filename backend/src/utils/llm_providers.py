@@ -0,0 +1,221 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.core.config import settings
+from src.utils.openai_client import get_openai_client
+
+# Errores transitorios: se reintenta con otro proveedor
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class ToolCallDelta:
+    index: int
+    id: Optional[str] = None
+    name: Optional[str] = None
+    arguments: Optional[str] = None
+
+
+@dataclass
+class LLMDelta:
+    """Fragmento de respuesta en streaming, igual para todos los proveedores"""
+    content: Optional[str] = None
+    tool_calls: List[ToolCallDelta] = field(default_factory=list)
+    finish_reason: Optional[str] = None    # "stop", "tool_calls", "length"...
+    prompt_tokens: Optional[int] = None    # uso, en el último delta si el proveedor lo informa
+    completion_tokens: Optional[int] = None
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """Status HTTP de un error de OpenAI (``status_code``) o de google-genai (``code``)"""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    try:
+        import openai
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+    except ImportError:
+        pass
+    return error_status(error) in RETRYABLE_STATUS
+
+
+class LLMProvider(ABC):
+    """Interfaz común: ``stream`` devuelve ``LLMDelta`` con tool calls en formato OpenAI"""
+
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def stream(self, model: str, messages: List[dict], tools: Optional[List[dict]] = None) -> AsyncIterator[LLMDelta]:
+        ...
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    async def stream(self, model, messages, tools=None):
+        client = get_openai_client()
+        if hasattr(client, "with_options"):
+            # El router hace el failover; pocos reintentos internos del SDK
+            client = client.with_options(max_retries=settings.llm_provider_max_retries)
+
+        kwargs = {"tools": tools} if tools else {}
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, stream=True,
+            stream_options={"include_usage": True}, **kwargs
+        )
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    yield LLMDelta(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta
+                yield LLMDelta(
+                    content=delta.content,
+                    tool_calls=[
+                        ToolCallDelta(
+                            tc.index, tc.id,
+                            tc.function.name if tc.function else None,
+                            tc.function.arguments if tc.function else None,
+                        )
+                        for tc in delta.tool_calls or []
+                    ],
+                    finish_reason=choice.finish_reason,
+                )
+        finally:
+            # Cierra la respuesta HTTP para que OpenAI deje de generar si se cancela
+            await stream.close()
+
+
+def _strip_schema(schema: Any) -> Any:
+    """Gemini no acepta ``default`` en los esquemas de parámetros"""
+    if isinstance(schema, dict):
+        return {k: _strip_schema(v) for k, v in schema.items() if k != "default"}
+    if isinstance(schema, list):
+        return [_strip_schema(v) for v in schema]
+    return schema
+
+
+def to_gemini_contents(messages: List[dict]) -> Tuple[Optional[str], List[dict]]:
+    """Convierte mensajes en formato OpenAI a (system_instruction, contents) de Gemini"""
+    system: List[str] = []
+    contents: List[dict] = []
+    call_names: Dict[str, str] = {}
+
+    for message in messages:
+        role = message["role"]
+        if role == "system":
+            if message.get("content"):
+                system.append(message["content"])
+            continue
+
+        if role == "tool":
+            part = {"function_response": {
+                "name": call_names.get(message.get("tool_call_id"), "tool"),
+                "response": {"result": message.get("content")},
+            }}
+            previous = contents[-1] if contents else None
+            if previous and previous["role"] == "user" and "function_response" in previous["parts"][0]:
+                previous["parts"].append(part)
+            else:
+                contents.append({"role": "user", "parts": [part]})
+            continue
+
+        parts = []
+        if message.get("content"):
+            parts.append({"text": message["content"]})
+        for call in message.get("tool_calls") or []:
+            call_names[call["id"]] = call["function"]["name"]
+            try:
+                args = json.loads(call["function"]["arguments"] or "{}")
+            except json.JSONDecodeError:
+                args = {}
+            parts.append({"function_call": {"name": call["function"]["name"], "args": args}})
+        if parts:
+            contents.append({"role": "model" if role == "assistant" else "user", "parts": parts})
+
+    return ("\n\n".join(system) or None), contents
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def available(self) -> bool:
+        if not (settings.gemini_api_key or os.getenv("GEMINI_API_KEY")):
+            return False
+        try:
+            from google import genai  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    async def stream(self, model, messages, tools=None):
+        from src.utils.genai_client import get_genai_client
+
+        system, contents = to_gemini_contents(messages)
+        config: Dict[str, Any] = {}
+        if system:
+            config["system_instruction"] = system
+        if tools:
+            config["tools"] = [{"function_declarations": [
+                _strip_schema(tool["function"]) for tool in tools if tool.get("type") == "function"
+            ]}]
+
+        stream = await get_genai_client().stream_content(contents, model=model, config=config or None)
+        calls = 0
+        usage = None
+        try:
+            async for chunk in stream:
+                # usage_metadata es acumulado: vale el del último chunk
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if not chunk.candidates:
+                    continue
+                candidate = chunk.candidates[0]
+                parts = candidate.content.parts if candidate.content and candidate.content.parts else []
+                for part in parts:
+                    if part.text:
+                        yield LLMDelta(content=part.text)
+                    if part.function_call:
+                        # Gemini envía cada llamada completa; se le asigna un id estilo OpenAI
+                        yield LLMDelta(tool_calls=[ToolCallDelta(
+                            calls, f"call_{uuid.uuid4().hex[:24]}",
+                            part.function_call.name, json.dumps(dict(part.function_call.args or {})),
+                        )])
+                        calls += 1
+                if candidate.finish_reason:
+                    reason = str(getattr(candidate.finish_reason, "name", candidate.finish_reason)).lower()
+                    if calls:
+                        reason = "tool_calls"
+                    elif reason == "max_tokens":
+                        reason = "length"
+                    yield LLMDelta(finish_reason=reason)
+            if usage is not None:
+                yield LLMDelta(prompt_tokens=usage.prompt_token_count,
+                               completion_tokens=usage.candidates_token_count)
+        finally:
+            close = getattr(stream, "aclose", None)
+            if close is not None:
+                await close()
+
+
+PROVIDERS: Dict[str, LLMProvider] = {
+    OpenAIProvider.name: OpenAIProvider(),
+    GeminiProvider.name: GeminiProvider(),
+}
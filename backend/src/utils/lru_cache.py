@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[V]):
+    """
+    Thread-safe LRU cache with optional per-entry TTL.
+
+    Entries are evicted when the cache grows beyond ``maxsize`` (least recently
+    used first) or when they are older than ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, V], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            stored_at, value = entry
+            if self._expired(stored_at, time.monotonic()):
+                self._evict(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._evict(oldest)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def purge_expired(self) -> int:
+        """Elimina las entradas expiradas y devuelve cuántas se borraron"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (ts, _) in self._data.items() if self._expired(ts, now)]
+            for key in expired:
+                self._evict(key)
+            return len(expired)
+
+    def _evict(self, key: Hashable) -> None:
+        _, value = self._data.pop(key)
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
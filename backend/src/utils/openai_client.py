@@ -1,29 +1,141 @@
+import asyncio
 import os
-from dotenv import load_dotenv
-from openai import AsyncOpenAI, OpenAI
-from typing import List, Dict, Any
+import threading
+import httpx
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+from src.core.config import settings
 
-load_dotenv()
+if TYPE_CHECKING:
+    # El SDK tarda en importarse: se carga al crear el cliente
+    from openai import AsyncOpenAI
+
+_client: Optional["AsyncOpenAI"] = None
+_client_lock = threading.Lock()
+_pool_stats = {"requests": 0, "responses": 0}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+async def _on_request(request: httpx.Request):
+    _pool_stats["requests"] += 1
+
+async def _on_response(response: httpx.Response):
+    _pool_stats["responses"] += 1
+
+def get_openai_client() -> "AsyncOpenAI":
+    """
+    Shared AsyncOpenAI client for the whole process.
+
+    All conversations reuse its httpx connection pool (keep-alive, HTTP/2
+    when h2 is installed), so new chats don't pay a TLS handshake and idle
+    pools don't pile up. Retries use the SDK's exponential backoff with jitter.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import AsyncOpenAI
+
+                http_client = httpx.AsyncClient(
+                    http2=settings.openai_http2 and _http2_available(),
+                    limits=httpx.Limits(
+                        max_connections=settings.openai_max_connections,
+                        max_keepalive_connections=settings.openai_max_keepalive_connections,
+                        keepalive_expiry=settings.openai_keepalive_expiry,
+                    ),
+                    timeout=httpx.Timeout(settings.openai_timeout, connect=settings.openai_connect_timeout),
+                    event_hooks={"request": [_on_request], "response": [_on_response]},
+                )
+                _client = AsyncOpenAI(
+                    api_key=settings.openai_api_key or os.getenv("OPENAI_API_KEY"),
+                    base_url=settings.openai_base_url,
+                    http_client=http_client,
+                    max_retries=settings.openai_max_retries,
+                )
+    return _client
+
+async def close_openai_client():
+    """Closes the shared client and its connection pool (app shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+def openai_pool_stats() -> Dict[str, Any]:
+    """Request counters and connection pool state of the shared client"""
+    stats = dict(_pool_stats)
+    stats["http2"] = settings.openai_http2 and _http2_available()
+    stats["max_connections"] = settings.openai_max_connections
+    stats["max_keepalive_connections"] = settings.openai_max_keepalive_connections
+
+    connections = []
+    if _client is not None:
+        # httpx no expone el pool públicamente; httpcore sí lista sus conexiones
+        pool = getattr(getattr(_client._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+    stats["connections"] = len(connections)
+    stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+    return stats
 
 class OpenAIConversation:
-    def __init__(self, conversation_id=None, model="gpt-4-turbo-2024-04-09"):
+    def __init__(self, conversation_id=None, model="gpt-4-turbo-2024-04-09", store=None, client=None):
         """
         Initialize a new conversation with OpenAI
         
         Args:
             conversation_id: Optional identifier for this conversation
             model: The model to use for this conversation
+            store: Optional ConversationStore where messages and metadata are persisted
+            client: AsyncOpenAI client to use, defaults to the shared process-wide one
         """
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self._client = client
         self.conversation_id = conversation_id
         self.model = model
         self.message_history = []
         self.metadata = {}  # Para almacenar referencias a recursos externos
+        self.store = store
+        self.version = 0  # versión persistida, la mantiene el store
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        # Perezoso: cargar conversaciones (historial, búsqueda) no construye el SDK
+        if self._client is None:
+            self._client = get_openai_client()
+        return self._client
+
+    @client.setter
+    def client(self, client: "AsyncOpenAI") -> None:
+        self._client = client
     
-    def add_message(self, role: str, content: str):
+    def add_message(self, role: str, content: str, **extra):
         """Add a message to the conversation history"""
-        self.message_history.append({"role": role, "content": content})
+        message = {"role": role, "content": content, **extra}
+        self.message_history.append(message)
+        if self.store is not None:
+            self.store.append_message(self, message)
+
+    def set_metadata(self, key: str, value: Any):
+        """Store a metadata value and persist it"""
+        self.metadata[key] = value
+        if self.store is not None:
+            self.store.save_metadata(self)
+
+    async def aadd_message(self, role: str, content: str, **extra):
+        """``add_message`` for async code: the store write runs in a thread"""
+        message = {"role": role, "content": content, **extra}
+        self.message_history.append(message)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.append_message, self, message)
+
+    async def aset_metadata(self, key: str, value: Any):
+        """``set_metadata`` for async code: the store write runs in a thread"""
+        self.metadata[key] = value
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save_metadata, self)
         
     def generate_response(self, prompt: str) -> Dict[str, Any]:
         """
@@ -49,5 +161,5 @@ class OpenAIConversation:
         return response
 
 # Factory function to create new conversations
-def create_conversation(conversation_id=None, model="gpt-4-turbo-2024-04-09"):
-    return OpenAIConversation(conversation_id, model)
\ No newline at end of file
+def create_conversation(conversation_id=None, model="gpt-4-turbo-2024-04-09", store=None, client=None):
+    return OpenAIConversation(conversation_id, model, store=store, client=client)
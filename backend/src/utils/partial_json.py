@@ -0,0 +1,127 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalObjectParser:
+    """
+    Parser incremental de un objeto JSON que llega troceado (los ``arguments``
+    de una tool call en streaming).
+
+    ``feed`` devuelve los pares (clave, valor) de primer nivel que quedan
+    completos con cada trozo, sin esperar al objeto entero: con
+    ``{"title": "Vendors", "headers": [`` ya se conoce ``title``. Los valores
+    anidados se entregan cuando se cierran. Si la entrada no es un objeto
+    JSON válido el parser se marca como ``failed`` y deja de producir valores.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.failed = False
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._mode = "start"        # start | first_key | key | colon | value | literal | nested | string | after
+        self._in_string = False
+        self._escape = False
+        self._token_start = 0
+        self._key = None
+        self._comma = False         # en un valor anidado, el último carácter significativo fue una coma
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.failed or self.done or not chunk:
+            return []
+        self._text += chunk
+        completed = []
+        try:
+            self._scan(completed)
+        except (ValueError, TypeError):
+            self.failed = True
+        return completed
+
+    def _scan(self, completed: List[Tuple[str, Any]]) -> None:
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._mode == "key":
+                        self._key = json.loads(text[self._token_start:self._pos + 1])
+                        self._mode = "colon"
+                    elif self._mode == "string":
+                        self._complete(completed, text[self._token_start:self._pos + 1])
+                self._pos += 1
+                continue
+
+            mode = self._mode
+            if mode == "nested":
+                if char in "}]" and self._comma:
+                    raise ValueError(f"trailing comma before {char!r}")
+                if char not in _WHITESPACE:
+                    self._comma = char == ","
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._complete(completed, text[self._token_start:self._pos + 1])
+            elif mode == "literal":
+                if char in _WHITESPACE or char in ",}":
+                    self._complete(completed, text[self._token_start:self._pos])
+                    continue             # el delimitador se procesa en modo "after"
+            elif char in _WHITESPACE:
+                pass
+            elif mode == "start":
+                if char != "{":
+                    raise ValueError("not a JSON object")
+                self._depth = 1
+                self._mode = "first_key"
+            elif mode in ("first_key", "key"):
+                # Tras una coma tiene que venir otra clave: {"a": 1,} no es JSON
+                if char == "}" and mode == "first_key":
+                    self.done = True
+                elif char == '"':
+                    self._token_start = self._pos
+                    self._mode = "key"
+                    self._in_string = True
+                else:
+                    raise ValueError(f"unexpected {char!r} before a key")
+            elif mode == "colon":
+                if char != ":":
+                    raise ValueError(f"expected ':' but got {char!r}")
+                self._mode = "value"
+            elif mode == "value":
+                self._token_start = self._pos
+                if char == '"':
+                    self._mode = "string"
+                    self._in_string = True
+                elif char in "{[":
+                    self._mode = "nested"
+                    self._depth += 1
+                else:
+                    self._mode = "literal"
+            elif mode == "after":
+                if char == ",":
+                    self._mode = "key"
+                    self._key = None
+                elif char == "}":
+                    self.done = True
+                else:
+                    raise ValueError(f"unexpected {char!r} after a value")
+            self._pos += 1
+
+    def _complete(self, completed: List[Tuple[str, Any]], raw: str) -> None:
+        value = json.loads(raw)
+        self.values[self._key] = value
+        completed.append((self._key, value))
+        self._mode = "after"
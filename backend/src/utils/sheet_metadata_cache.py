@@ -0,0 +1,108 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.utils.lru_cache import LRUCache
+
+# Solo lo necesario para localizar hojas y su tamaño
+METADATA_FIELDS = 'sheets.properties(sheetId,title,gridProperties(rowCount,columnCount))'
+
+
+@dataclass
+class SheetInfo:
+    sheet_id: int
+    title: str
+    row_count: int
+    column_count: int
+    headers: Optional[List[str]] = None    # fila 1, se carga bajo demanda
+
+
+@dataclass
+class SpreadsheetMetadata:
+    spreadsheet_id: str
+    sheets: Dict[str, SheetInfo] = field(default_factory=dict)
+
+
+class SheetMetadataCache:
+    """
+    Cache de metadatos por hoja de cálculo (título → sheetId, tamaño y cabeceras).
+
+    Se rellena con field masks para no descargar el recurso completo. Las
+    escrituras propias actualizan la entrada (``record_*``) o la invalidan;
+    los cambios hechos por terceros se recogen al expirar el TTL.
+    """
+
+    def __init__(self, sheets_service, maxsize: int = 256, ttl: float = 300.0):
+        self.sheets = sheets_service
+        self._cache: LRUCache[SpreadsheetMetadata] = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, spreadsheet_id: str) -> SpreadsheetMetadata:
+        metadata = self._cache.get(spreadsheet_id)
+        if metadata is None:
+            metadata = self._fetch(spreadsheet_id)
+            self._cache.set(spreadsheet_id, metadata)
+        return metadata
+
+    def sheet(self, spreadsheet_id: str, sheet_name: str) -> Optional[SheetInfo]:
+        return self.get(spreadsheet_id).sheets.get(sheet_name)
+
+    def headers(self, spreadsheet_id: str, sheet_name: str) -> Optional[List[str]]:
+        info = self.sheet(spreadsheet_id, sheet_name)
+        if info is None:
+            return None
+        if info.headers is None:
+            result = self.sheets.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!1:1"
+            ).execute()
+            values = result.get('values', [])
+            info.headers = list(values[0]) if values else []
+        return info.headers
+
+    def prime(self, spreadsheet_id: str, sheets: List[SheetInfo]) -> None:
+        """Registra los metadatos de una hoja recién creada sin pedirlos a Google"""
+        self._cache.set(spreadsheet_id, SpreadsheetMetadata(spreadsheet_id, {s.title: s for s in sheets}))
+
+    def record_column(self, spreadsheet_id: str, sheet_name: str, column_name: str, grew: bool) -> None:
+        info = self._cached_sheet(spreadsheet_id, sheet_name)
+        if info is None:
+            return
+        if info.headers is not None:
+            info.headers.append(column_name)
+        if grew:
+            info.column_count += 1
+
+    def record_rows(self, spreadsheet_id: str, sheet_name: str, count: int) -> None:
+        """values.append con INSERT_ROWS amplía la cuadrícula"""
+        info = self._cached_sheet(spreadsheet_id, sheet_name)
+        if info is not None:
+            info.row_count += count
+
+    def forget_headers(self, spreadsheet_id: str, sheet_name: str) -> None:
+        info = self._cached_sheet(spreadsheet_id, sheet_name)
+        if info is not None:
+            info.headers = None
+
+    def invalidate(self, spreadsheet_id: str) -> None:
+        self._cache.pop(spreadsheet_id)
+
+    def _cached_sheet(self, spreadsheet_id: str, sheet_name: str) -> Optional[SheetInfo]:
+        metadata = self._cache.get(spreadsheet_id)
+        return metadata.sheets.get(sheet_name) if metadata else None
+
+    def _fetch(self, spreadsheet_id: str) -> SpreadsheetMetadata:
+        result = self.sheets.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields=METADATA_FIELDS
+        ).execute()
+
+        metadata = SpreadsheetMetadata(spreadsheet_id)
+        for sheet in result.get('sheets', []):
+            properties = sheet['properties']
+            grid = properties.get('gridProperties', {})
+            metadata.sheets[properties['title']] = SheetInfo(
+                sheet_id=properties['sheetId'],
+                title=properties['title'],
+                row_count=grid.get('rowCount', 0),
+                column_count=grid.get('columnCount', 0),
+            )
+        return metadata
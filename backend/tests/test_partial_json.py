@@ -0,0 +1,38 @@
+import pytest
+
+from src.utils.partial_json import IncrementalObjectParser
+
+
+def feed_all(chunks):
+    parser = IncrementalObjectParser()
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return parser, completed
+
+
+def test_values_complete_before_the_object_closes():
+    parser, completed = feed_all(['{"title": "Ven', 'dors", "headers": ["Name",', ' "Email"]'])
+
+    assert completed == [("title", "Vendors"), ("headers", ["Name", "Email"])]
+    assert not parser.done and not parser.failed
+
+
+def test_empty_object_is_done():
+    parser, completed = feed_all(["{ ", "}"])
+
+    assert completed == []
+    assert parser.done and not parser.failed
+
+
+@pytest.mark.parametrize("chunks", [
+    ['{"a": 1,}'],
+    ['{"a": 1,', ' }'],
+    ['{"a": [1,]}'],
+    ['{"a": {"b": 2 ,', "\n}}"],
+])
+def test_trailing_commas_are_rejected(chunks):
+    parser, _ = feed_all(chunks)
+
+    assert parser.failed
+    assert not parser.done
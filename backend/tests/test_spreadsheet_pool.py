@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from src.models.sheet_write import SpareSpreadsheet
+from src.services import spreadsheet_pool
+from src.services.spreadsheet_pool import SpreadsheetPool, provision_spreadsheet
+from src.utils.async_sheets_client import SheetsTimeoutError
+
+
+class FakeSheetsClient:
+    """Lo mínimo de ``AsyncGoogleSheetsClient`` que usa el pool"""
+
+    def __init__(self):
+        self.deleted = []
+        self.created = []
+        self.client = self
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def delete_spreadsheet(self, spreadsheet_id):
+        self.deleted.append(spreadsheet_id)
+
+    async def create_sheet(self, title, headers):
+        self.created.append(title)
+        return {"spreadsheet_id": "new", "url": "https://docs.google.com/spreadsheets/d/new/edit"}
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    client = FakeSheetsClient()
+    monkeypatch.setattr(spreadsheet_pool, "get_async_sheets_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def pool():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine, tables=[SpareSpreadsheet.__table__])
+    pool = SpreadsheetPool(size=0, engine=engine)
+    pool._add(SpareSpreadsheet(spreadsheet_id="spare-1", sheet_id=0, row_count=1000, column_count=26))
+    return pool
+
+
+def spare_ids(pool):
+    with Session(pool.engine) as session:
+        return [s.spreadsheet_id for s in session.exec(select(SpareSpreadsheet)).all()]
+
+
+def failing_adopt(error):
+    async def adopt(spare, title, headers):
+        raise error
+    return adopt
+
+
+def test_claim_puts_spare_back_when_adopt_raises(monkeypatch, sheets, pool):
+    monkeypatch.setattr(spreadsheet_pool, "adopt_spare", failing_adopt(RuntimeError("quota exceeded")))
+
+    assert asyncio.run(pool.claim("Vendors", ["Name"])) is None
+    assert spare_ids(pool) == ["spare-1"]
+    assert sheets.deleted == []
+
+
+def test_claim_deletes_spare_when_adopt_times_out(monkeypatch, sheets, pool):
+    # No se sabe si la hoja se renombró: no puede volver al pool
+    monkeypatch.setattr(spreadsheet_pool, "adopt_spare", failing_adopt(SheetsTimeoutError("timed out")))
+
+    assert asyncio.run(pool.claim("Vendors", ["Name"])) is None
+    assert spare_ids(pool) == []
+    assert sheets.deleted == ["spare-1"]
+
+
+def test_provision_falls_back_and_releases_reserved_spare(monkeypatch, sheets):
+    monkeypatch.setattr(spreadsheet_pool, "adopt_spare", failing_adopt(RuntimeError("boom")))
+    monkeypatch.setattr(spreadsheet_pool, "get_spreadsheet_pool", lambda: None)
+
+    async def reserved():
+        return SpareSpreadsheet(spreadsheet_id="reserved", sheet_id=0, row_count=1000, column_count=26)
+
+    result = asyncio.run(provision_spreadsheet("Vendors", ["Name"], spare=reserved()))
+
+    assert result["spreadsheet_id"] == "new"
+    # Sin pool la hoja reservada se borra en lugar de quedar huérfana
+    assert sheets.deleted == ["reserved"]
+    assert sheets.created == ["Vendors"]
+
+
+def test_provision_cancelled_releases_reserved_spare_once_ready(monkeypatch, sheets):
+    monkeypatch.setattr(spreadsheet_pool, "get_spreadsheet_pool", lambda: None)
+
+    async def scenario():
+        ready = asyncio.Event()
+
+        async def reserve():
+            await ready.wait()
+            return SpareSpreadsheet(spreadsheet_id="reserved", sheet_id=0, row_count=1000, column_count=26)
+
+        spare = asyncio.ensure_future(reserve())
+        task = asyncio.ensure_future(provision_spreadsheet("Vendors", ["Name"], spare=spare))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        # La reserva termina después de la cancelación y aun así se libera
+        ready.set()
+        await spare
+        await asyncio.gather(*spreadsheet_pool._releasing)
+
+    asyncio.run(scenario())
+    assert sheets.deleted == ["reserved"]
+    assert sheets.created == []
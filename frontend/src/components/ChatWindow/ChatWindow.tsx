@@ -4,6 +4,9 @@ import MessageBubble from '../MessageBubble/MessageBubble';
 import MessageInput from '../MessageInput/MessageInput';
 import { XStack, YStack, Text, ScrollView, View } from 'tamagui';
 import { uploadFilesChatUploadPost } from '../../api/sdk.gen';
+import { readSSE } from '../../hooks/useStream';
+
+const MAX_STREAM_RECONNECTS = 3;
 
 const api = {
   getMessages: async (chatId: string) => {
@@ -56,22 +59,44 @@ const api = {
         });
 
         if (response.ok) {
-          const reader = response.body?.getReader();
-          if (!reader) throw new Error('No stream available');
-
-          const decoder = new TextDecoder();
-          while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-
-            const chunk = decoder.decode(value);
-            const lines = chunk.split('\n\n');
-            for (const line of lines) {
-              if (line.startsWith('data: ')) {
-                yield line.substring(6);
+          if (!response.body) throw new Error('No stream available');
+
+          // Si la conexión se corta antes del evento "done", se reconecta con
+          // Last-Event-ID y el servidor reenvía lo que faltaba
+          let lastEventId: string | undefined;
+          let finished = false;
+          let current: Response | null = response;
+          for (let attempt = 0; ; attempt++) {
+            if (current) {
+              try {
+                for await (const message of readSSE(current)) {
+                  if (message.id) lastEventId = message.id;
+                  if (message.event === 'done') {
+                    finished = true;
+                    break;
+                  }
+                  yield message.data;
+                }
+              } catch (error) {
+                console.warn('Stream interrumpido, reconectando:', error);
               }
+              current = null;
+            }
+            if (finished || !lastEventId || attempt >= MAX_STREAM_RECONNECTS) break;
+
+            await new Promise((resolve) => setTimeout(resolve, 500 * (attempt + 1)));
+            try {
+              const retry = await fetch(`http://localhost:8000/chat/stream/${chatId}`, {
+                headers: { 'Last-Event-ID': lastEventId },
+              });
+              // 204/410: la generación ya no existe en el servidor
+              if (retry.status !== 200 || !retry.body) break;
+              current = retry;
+            } catch (error) {
+              console.warn('No se pudo reconectar:', error);
             }
           }
+          if (!finished) yield '\n\n(Respuesta interrumpida)';
         } else {
           yield 'Error al procesar tu mensaje.';
         }
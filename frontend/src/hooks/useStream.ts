@@ -8,4 +8,44 @@ export async function* streamToIterator(res: Response) {
       yield decoder.decode(value, { stream: true });
     }
   }
-  
\ No newline at end of file
+
+export interface SSEMessage {
+    id?: string;
+    event?: string;
+    data: string;
+  }
+
+// Parses a text/event-stream response: events may span several network
+// chunks, multi-line payloads use one `data:` field per line and lines
+// starting with ':' are keep-alive comments.
+export async function* readSSE(res: Response): AsyncGenerator<SSEMessage> {
+    let buffer = '';
+    for await (const text of streamToIterator(res)) {
+      buffer += text.replace(/\r\n?/g, '\n');
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const message = parseEvent(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        if (message) yield message;
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+  }
+
+function parseEvent(block: string): SSEMessage | null {
+    const data: string[] = [];
+    const message: SSEMessage = { data: '' };
+    for (const line of block.split('\n')) {
+      if (!line || line.startsWith(':')) continue;
+      const colon = line.indexOf(':');
+      const field = colon === -1 ? line : line.slice(0, colon);
+      let value = colon === -1 ? '' : line.slice(colon + 1);
+      if (value.startsWith(' ')) value = value.slice(1);
+      if (field === 'data') data.push(value);
+      else if (field === 'id') message.id = value;
+      else if (field === 'event') message.event = value;
+    }
+    if (data.length === 0) return null;
+    message.data = data.join('\n');
+    return message;
+  }